@@ -30,7 +30,7 @@ from llm import execute_action, TOOLS_DEFINITIONS
 from auth import require_login, require_admin
 
 # Utilities
-from financial_context import get_month_summary, build_financial_context
+from financial_context import get_month_summary
 from memory import build_memory_context, log_message, maybe_update_summary
 from core import TransactionValidator, ValidationError, handle_errors
 
@@ -69,7 +69,6 @@ __all__ = [
     "require_admin",
     # Utils
     "get_month_summary",
-    "build_financial_context",
     "build_memory_context",
     "log_message",
     "maybe_update_summary",
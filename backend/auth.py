@@ -1,16 +1,33 @@
 """Authentication middleware and decorators"""
 
+import base64
+import hashlib
+import hmac
+import json
+import time
 from functools import wraps
 from datetime import datetime, timedelta, timezone
 from flask import request, jsonify, g
+from config import AUTH_SIGNED_TOKENS, AUTH_TOKEN_REVALIDATE, SECRET_KEY
+from core import get_logger, incr
 from database import get_db
+from session_cache import session_cache, token_hash
 
+logger = get_logger(__name__)
 
-def get_current_user():
-    """Get current authenticated user from session token with expiry check"""
-    db = get_db()
+WIB = timezone(timedelta(hours=7))
+
+# Signed stateless tokens: "st1.<base64 claims>.<base64 HMAC-SHA256>"
+SIGNED_TOKEN_PREFIX = "st1."
 
-    # Support multiple token sources: Authorization header (Bearer), X-Session-Token, or cookie
+# Tokens signed with the public default key could be forged
+SIGNED_TOKENS_ENABLED = AUTH_SIGNED_TOKENS and SECRET_KEY != "dev-secret-key"
+if AUTH_SIGNED_TOKENS and not SIGNED_TOKENS_ENABLED:
+    logger.warning("auth_signed_tokens_disabled", reason="SECRET_KEY is not set")
+
+
+def get_request_token():
+    """Session token from the Authorization header (Bearer), X-Session-Token or cookie"""
     token = None
     auth_header = request.headers.get("Authorization")
     # Removed: Debug logging of auth header to prevent token exposure
@@ -20,11 +37,45 @@ def get_current_user():
         token = request.headers.get("X-Session-Token")
     if not token:
         token = request.cookies.get("session_token")
+    return token or None
 
-    if not token:
-        return None
 
-    # Database query
+def get_session_token():
+    """Row key in `sessions` of the request's token (unwraps a signed token)"""
+    token = get_request_token()
+    if token and token.startswith(SIGNED_TOKEN_PREFIX):
+        claims = _verify_signed_token(token)
+        return claims["sid"] if claims else None
+    return token
+
+
+def _parse_expiry(expires_at):
+    # Handle both datetime object (PostgreSQL) and string (SQLite)
+    if isinstance(expires_at, datetime):
+        return expires_at
+    # SQLite returns string; attempt parse
+    try:
+        return datetime.fromisoformat(expires_at.replace("Z", ""))
+    except ValueError:
+        return datetime.strptime(expires_at, "%Y-%m-%d %H:%M:%S")
+
+
+def _wib_now():
+    # Compare in WIB to match stored timezone policy
+    return datetime.now(WIB).replace(tzinfo=None)
+
+
+def _lookup_session(db, token):
+    """(user, expiry) of a session token, from the cache or the database"""
+    key = token_hash(token)
+    cached = session_cache.get(key)
+    if cached is not None:
+        user, exp_dt = cached
+        if exp_dt is None or exp_dt >= _wib_now():
+            return dict(user), exp_dt
+        # Expired while cached: the query below removes it
+
+    generation = session_cache.generation()
     cur = db.execute(
         """
         SELECT users.id, users.name, users.email, users.role, sessions.expires_at
@@ -39,38 +90,130 @@ def get_current_user():
         return None
 
     # Expiry check
-    expires_at = row["expires_at"]
-    if expires_at:
+    exp_dt = None
+    if row["expires_at"]:
         try:
-            # Handle both datetime object (PostgreSQL) and string (SQLite)
-            if isinstance(expires_at, datetime):
-                exp_dt = expires_at
-            else:
-                # SQLite returns string; attempt parse
-                try:
-                    exp_dt = datetime.fromisoformat(expires_at.replace("Z", ""))
-                except ValueError:
-                    exp_dt = datetime.strptime(expires_at, "%Y-%m-%d %H:%M:%S")
-
-            # Compare in WIB to match stored timezone policy
-            wib_now = datetime.now(timezone(timedelta(hours=7))).replace(tzinfo=None)
-            if exp_dt < wib_now:
-                # Session expired -> remove it
-                db.execute("DELETE FROM sessions WHERE session_token = %s", (token,))
-                db.commit()
-                return None
+            exp_dt = _parse_expiry(row["expires_at"])
         except Exception:
-            # If parsing fails treat as invalid / expired
+            exp_dt = None
+            expired = True  # If parsing fails treat as invalid / expired
+        else:
+            expired = exp_dt < _wib_now()
+        if expired:
+            # Session expired -> remove it
             db.execute("DELETE FROM sessions WHERE session_token = %s", (token,))
             db.commit()
             return None
 
-    return {
+    user = {
         "id": row["id"],
         "name": row["name"],
         "email": row["email"],
         "role": row["role"],
     }
+    session_cache.put(key, user["id"], (user, exp_dt), generation)
+    return dict(user), exp_dt
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(body: str) -> str:
+    message = (SIGNED_TOKEN_PREFIX + body).encode()
+    return _b64(hmac.new(SECRET_KEY.encode(), message, hashlib.sha256).digest())
+
+
+def issue_signed_token(session_token, user, expires_at):
+    """Signed stateless token carrying the session and the user's identity.
+
+    Verified without the database until AUTH_TOKEN_REVALIDATE seconds after
+    issue, or until an auth change of the user is seen in auth_events.
+    """
+    exp_dt = _parse_expiry(expires_at) if expires_at else None
+    claims = {
+        "sid": session_token,
+        "uid": user["id"],
+        "name": user["name"],
+        "email": user["email"],
+        "role": user["role"],
+        "exp": int(exp_dt.replace(tzinfo=WIB).timestamp()) if exp_dt else None,
+        "iat": int(time.time()),
+        "ver": session_cache.current_version(),
+    }
+    body = _b64(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{SIGNED_TOKEN_PREFIX}{body}.{_sign(body)}"
+
+
+def _verify_signed_token(token):
+    """Claims of a signed token, or None when malformed or tampered with"""
+    try:
+        body, signature = token[len(SIGNED_TOKEN_PREFIX):].split(".")
+        if not hmac.compare_digest(signature, _sign(body)):
+            return None
+        return json.loads(_unb64(body))
+    except Exception:
+        return None
+
+
+def _user_from_signed_token(token):
+    claims = _verify_signed_token(token)
+    if claims is None:
+        incr("auth_signed_token_rejected")
+        return None
+    now = time.time()
+    if claims["exp"] is not None and claims["exp"] <= now:
+        return None
+
+    if now - claims["iat"] < AUTH_TOKEN_REVALIDATE and not session_cache.changed_since(
+        claims["uid"], claims["ver"]
+    ):
+        incr("auth_signed_token_hits")
+        return {
+            "id": claims["uid"],
+            "name": claims["name"],
+            "email": claims["email"],
+            "role": claims["role"],
+        }
+
+    # Revalidate against the session, then hand the client a fresh token
+    found = _lookup_session(get_db(), claims["sid"])
+    if not found or found[0]["id"] != claims["uid"]:
+        return None
+    user, exp_dt = found
+    g.refreshed_session_token = issue_signed_token(claims["sid"], user, exp_dt)
+    incr("auth_signed_token_revalidations")
+    return user
+
+
+def get_current_user():
+    """Get current authenticated user from session token with expiry check"""
+    token = get_request_token()
+    if not token:
+        return None
+
+    session_cache.refresh(get_db)
+    if token.startswith(SIGNED_TOKEN_PREFIX):
+        if SIGNED_TOKENS_ENABLED:
+            return _user_from_signed_token(token)
+        # Mode switched off: the session inside still counts
+        token = get_session_token()
+        if not token:
+            return None
+
+    found = _lookup_session(get_db(), token)
+    return found[0] if found else None
+
+
+def session_token_for_client(session_token, user, expires_at):
+    """Token handed out at login: signed in stateless mode, else the session token"""
+    if SIGNED_TOKENS_ENABLED:
+        return issue_signed_token(session_token, user, expires_at)
+    return session_token
 
 
 def require_login(f):
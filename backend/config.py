@@ -28,6 +28,115 @@ if DATABASE_URL.startswith("postgres://"):
 
 DB_TYPE = "postgresql"  # Always PostgreSQL
 
+# Connection pool (one pool per gunicorn worker process)
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "4"))  # match gunicorn --threads
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))  # max wait to borrow
+DB_POOL_PING_AFTER = float(os.environ.get("DB_POOL_PING_AFTER", "30"))  # idle secs
+DB_CONNECT_RETRIES = int(os.environ.get("DB_CONNECT_RETRIES", "3"))
+DB_CONNECT_BACKOFF = float(os.environ.get("DB_CONNECT_BACKOFF", "0.5"))
+DB_TIMEZONE = "Asia/Jakarta"
+# Lower bound for the deadline-derived statement_timeout (final writes still run)
+DB_MIN_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_MIN_STATEMENT_TIMEOUT_MS", "1000"))
+
+# Per-worker cache of account balances, keyed by the
+# user's data_version so every worker sees writes made by the others
+FINANCIAL_CACHE_MAX = int(os.environ.get("FINANCIAL_CACHE_MAX", "512"))
+FINANCIAL_CACHE_TTL = float(os.environ.get("FINANCIAL_CACHE_TTL", "600"))  # secs
+
+# Bulk transaction import (/api/transactions/import)
+IMPORT_MAX_ROWS = int(os.environ.get("IMPORT_MAX_ROWS", "100000"))
+
+# Background memory summarization (one worker thread per gunicorn worker)
+SUMMARY_QUEUE_MAX = int(os.environ.get("SUMMARY_QUEUE_MAX", "200"))
+SUMMARY_JOB_ATTEMPTS = int(os.environ.get("SUMMARY_JOB_ATTEMPTS", "3"))
+SUMMARY_RETRY_BACKOFF = float(os.environ.get("SUMMARY_RETRY_BACKOFF", "5"))  # secs
+# Refresh from previous summary + logs since its last_log_id (false: full rebuild)
+MEMORY_SUMMARY_INCREMENTAL = (
+    os.environ.get("MEMORY_SUMMARY_INCREMENTAL", "true").lower() == "true"
+)
+
+# Local answers for aggregate chat questions (balances, totals, top categories);
+# below this share of recognized words the question goes to the LLM
+LOCAL_QUERY_ENABLED = os.environ.get("LOCAL_QUERY_ENABLED", "true").lower() == "true"
+LOCAL_QUERY_MIN_CONFIDENCE = float(os.environ.get("LOCAL_QUERY_MIN_CONFIDENCE", "0.9"))
+
+# Local capture of one-line transactions ("makan siang 35rb pakai gopay").
+# Off until tests/test_transaction_capture_corpus.py shows no false positives;
+# the extracted fields are passed to the LLM as hints either way.
+LOCAL_CAPTURE_ENABLED = (
+    os.environ.get("LOCAL_CAPTURE_ENABLED", "false").lower() == "true"
+)
+LOCAL_CAPTURE_HINTS = os.environ.get("LOCAL_CAPTURE_HINTS", "true").lower() == "true"
+LOCAL_CAPTURE_MIN_CONFIDENCE = float(
+    os.environ.get("LOCAL_CAPTURE_MIN_CONFIDENCE", "0.9")
+)
+
+# Explanations after tool calls are templated from the action results; the
+# model-written explanation is an opt-in extra, streamed after the template
+CHAT_LLM_EXPLANATION = os.environ.get("CHAT_LLM_EXPLANATION", "false").lower() == "true"
+CHAT_LLM_EXPLANATION_TIMEOUT = float(os.environ.get("CHAT_LLM_EXPLANATION_TIMEOUT", "8"))
+# Time budget of one /api/chat request across DB and LLM stages (gunicorn --timeout is 120)
+CHAT_DEADLINE_SECONDS = float(os.environ.get("CHAT_DEADLINE_SECONDS", "20"))
+# Admission control for /api/chat per worker. A waiting request holds a thread,
+# so CHAT_MAX_CONCURRENT + CHAT_QUEUE_MAX must stay below gunicorn --threads (4)
+CHAT_MAX_CONCURRENT = int(os.environ.get("CHAT_MAX_CONCURRENT", "2"))
+CHAT_QUEUE_MAX = int(os.environ.get("CHAT_QUEUE_MAX", "1"))
+CHAT_QUEUE_PER_USER = int(os.environ.get("CHAT_QUEUE_PER_USER", "1"))
+CHAT_QUEUE_TIMEOUT = float(os.environ.get("CHAT_QUEUE_TIMEOUT", "5"))
+# Identical /api/chat messages within this window share the first request's reply
+CHAT_DEDUPE_ENABLED = os.environ.get("CHAT_DEDUPE_ENABLED", "true").lower() == "true"
+CHAT_DEDUPE_WINDOW = float(os.environ.get("CHAT_DEDUPE_WINDOW", "10"))
+# How long a write's Idempotency-Key (and its stored response) is honored
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get("IDEMPOTENCY_TTL_HOURS", "24"))
+# Per-worker cache of session token -> user for require_login (0 disables).
+# Auth changes are logged in auth_events; every worker applies the log at
+# most every AUTH_EVENTS_POLL seconds
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_MAX = int(os.environ.get("AUTH_CACHE_MAX", "4096"))
+AUTH_EVENTS_POLL = float(os.environ.get("AUTH_EVENTS_POLL", "2"))
+# Signed stateless session tokens: verified without the DB and revalidated
+# against the sessions table every AUTH_TOKEN_REVALIDATE seconds (needs SECRET_KEY)
+AUTH_SIGNED_TOKENS = os.environ.get("AUTH_SIGNED_TOKENS", "false").lower() == "true"
+AUTH_TOKEN_REVALIDATE = float(os.environ.get("AUTH_TOKEN_REVALIDATE", "300"))
+
+# Per-worker cache of plain LLM answers to query/general messages, scoped to
+# the user's data version. Setting RESPONSE_CACHE_EMBEDDING_MODEL (a
+# sentence-transformers model, e.g. "paraphrase-multilingual-MiniLM-L12-v2")
+# also matches similar wording above RESPONSE_CACHE_SIMILARITY.
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX = int(os.environ.get("RESPONSE_CACHE_MAX", "500"))
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_EMBEDDING_MODEL = os.environ.get("RESPONSE_CACHE_EMBEDDING_MODEL", "")
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0.92"))
+
+# LLM provider clients (one pooled HTTP transport per gunicorn worker)
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.environ.get("LLM_MAX_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "60"))
+GEMINI_TIMEOUT = float(os.environ.get("GEMINI_TIMEOUT", "60"))
+# The LLM router retries and fails over; SDK-level retries would multiply them
+OPENAI_CLIENT_MAX_RETRIES = int(os.environ.get("OPENAI_CLIENT_MAX_RETRIES", "0"))
+
+# LLM routing: failover between providers, circuit breaker, hedged requests
+DEFAULT_OPENAI_MODEL = os.environ.get("DEFAULT_OPENAI_MODEL", "gpt-4o-mini")
+DEFAULT_GEMINI_MODEL = os.environ.get("DEFAULT_GEMINI_MODEL", "gemini-2.5-flash")
+LLM_FAILOVER_ENABLED = os.environ.get("LLM_FAILOVER_ENABLED", "true").lower() == "true"
+LLM_PROVIDER_RETRIES = int(os.environ.get("LLM_PROVIDER_RETRIES", "1"))
+LLM_RETRY_DELAY = float(os.environ.get("LLM_RETRY_DELAY", "0.5"))
+# An LLM call (or retry) is not started with less than this left in the request budget
+LLM_MIN_CALL_SECONDS = float(os.environ.get("LLM_MIN_CALL_SECONDS", "2"))
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+# Hedging sends a second, paid request: off unless explicitly enabled
+LLM_HEDGE_ENABLED = os.environ.get("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", "1.0"))
+LLM_HEDGE_DEFAULT_DELAY = float(os.environ.get("LLM_HEDGE_DEFAULT_DELAY", "8.0"))
+LLM_HEDGE_WORKERS = int(os.environ.get("LLM_HEDGE_WORKERS", "8"))
+
 # Email configuration (SMTP)
 SMTP_HOST = os.environ.get("SMTP_HOST")  # e.g., smtp.gmail.com
 SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
@@ -37,10 +146,11 @@ SMTP_FROM = os.environ.get("SMTP_FROM", "noreply@financialadvisor.com")
 APP_URL = os.environ.get("APP_URL", "http://localhost:8000")
 
 # Flask config
+SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-key")
 FLASK_CONFIG = {
     "SQLALCHEMY_DATABASE_URI": DATABASE_URL or f"sqlite:///{DB_PATH}",
     "SQLALCHEMY_TRACK_MODIFICATIONS": False,
-    "SECRET_KEY": os.environ.get("SECRET_KEY", "dev-secret-key"),
+    "SECRET_KEY": SECRET_KEY,
 }
 
 # reCAPTCHA (optional)
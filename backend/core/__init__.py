@@ -6,15 +6,30 @@ Modules:
 - logger: Structured logging configuration
 - error_handler: Error handling middleware
 - validators: Input validation utilities
+- metrics: Per-worker counters and latency windows
+- deadline: Per-request time budgets
+- admission: Fair bounded concurrency limits
+- single_flight: Shared execution of identical concurrent calls
 """
 
 from .logger import get_logger
 from .error_handler import handle_errors
 from .validators import TransactionValidator, ValidationError
+from .metrics import latency, incr, metrics_snapshot
+from .deadline import Deadline, DeadlineExceeded
+from .admission import FairLimiter
+from .single_flight import SingleFlight
 
 __all__ = [
     "get_logger",
     "handle_errors",
     "TransactionValidator",
     "ValidationError",
+    "latency",
+    "incr",
+    "metrics_snapshot",
+    "Deadline",
+    "DeadlineExceeded",
+    "FairLimiter",
+    "SingleFlight",
 ]
@@ -0,0 +1,175 @@
+"""Admission control - bounded, per-user fair concurrency limits
+
+A gunicorn gthread worker has a fixed number of threads and a queued
+request still holds one while it waits. FairLimiter therefore caps how many
+threads one class of slow requests can hold, running plus waiting, so the
+remaining threads always serve everything else:
+
+- at most `max_active` requests run at once;
+- at most `max_queue` wait, at most `per_user_queue` of them per key, each
+  for up to `timeout` seconds;
+- freed slots go round-robin over the keys with waiters, so one user's
+  burst cannot starve other users;
+- anything that does not fit is rejected immediately, with a Retry-After
+  estimated from how long admitted requests hold their slot.
+
+Requests that wait on something other than a slot (e.g. a duplicate waiting
+for another request's result) still hold a thread; hold()/unhold() count them
+against the same queue bounds without ever giving them a slot.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Hashable, Optional
+
+from .metrics import latency
+
+
+class _Waiter:
+    __slots__ = ("granted",)
+
+    def __init__(self):
+        self.granted = False
+
+
+class FairLimiter:
+    """Per-worker concurrency limiter with a fair bounded wait queue"""
+
+    def __init__(
+        self,
+        name: str,
+        max_active: int,
+        max_queue: int,
+        per_user_queue: int,
+        timeout: float,
+    ):
+        self.name = name
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.per_user_queue = per_user_queue
+        self.timeout = timeout
+        self.active = 0
+        self.queued = 0
+        self.holding = 0
+        self._holds: Dict[Hashable, int] = {}
+        self._queues: "OrderedDict[Hashable, deque]" = OrderedDict()
+        self._cond = threading.Condition()
+        self.admitted = 0
+        self.waited = 0
+        self.rejected_full = 0
+        self.rejected_user = 0
+        self.timeouts = 0
+
+    def acquire(self, key: Hashable) -> Optional[float]:
+        """Take a slot for `key`; returns the acquire time, or None if rejected"""
+        started = time.monotonic()
+        with self._cond:
+            if self.active < self.max_active and not self.queued:
+                return self._admit(started)
+            if not self._has_room(key):
+                return None
+
+            waiter = _Waiter()
+            self._queues.setdefault(key, deque()).append(waiter)
+            self.queued += 1
+            self.waited += 1
+            expires = started + self.timeout
+            while not waiter.granted:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    self._withdraw(key, waiter)
+                    self.timeouts += 1
+                    latency(f"{self.name}_queue_wait").record(self.timeout * 1000)
+                    return None
+                self._cond.wait(remaining)
+        latency(f"{self.name}_queue_wait").record((time.monotonic() - started) * 1000)
+        return time.monotonic()
+
+    def release(self, acquired_at: float) -> None:
+        latency(f"{self.name}_hold").record((time.monotonic() - acquired_at) * 1000)
+        with self._cond:
+            self.active -= 1
+            self._grant()
+
+    def hold(self, key: Hashable) -> bool:
+        """Count a thread waiting outside the limiter for `key`; False if no room"""
+        with self._cond:
+            if not self._has_room(key):
+                return False
+            self.holding += 1
+            self._holds[key] = self._holds.get(key, 0) + 1
+            return True
+
+    def unhold(self, key: Hashable) -> None:
+        with self._cond:
+            self.holding -= 1
+            if self._holds[key] == 1:
+                del self._holds[key]
+            else:
+                self._holds[key] -= 1
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait: the median slot hold time"""
+        p50 = latency(f"{self.name}_hold").percentile(50)
+        return max(1, math.ceil(p50 / 1000)) if p50 else 1
+
+    def _admit(self, started: float) -> float:
+        # Caller holds self._cond
+        self.active += 1
+        self.admitted += 1
+        return started
+
+    def _has_room(self, key: Hashable) -> bool:
+        # Caller holds self._cond
+        if self.queued + self.holding >= self.max_queue:
+            self.rejected_full += 1
+            return False
+        waiting = self._queues.get(key)
+        if (len(waiting) if waiting else 0) + self._holds.get(key, 0) >= self.per_user_queue:
+            self.rejected_user += 1
+            return False
+        return True
+
+    def _withdraw(self, key: Hashable, waiter: _Waiter) -> None:
+        # Caller holds self._cond
+        waiting = self._queues[key]
+        waiting.remove(waiter)
+        if not waiting:
+            del self._queues[key]
+        self.queued -= 1
+
+    def _grant(self) -> None:
+        # Caller holds self._cond; round-robin: the served key moves to the back
+        granted = False
+        while self.active < self.max_active and self._queues:
+            key, waiting = self._queues.popitem(last=False)
+            waiter = waiting.popleft()
+            if waiting:
+                self._queues[key] = waiting
+            waiter.granted = True
+            self.queued -= 1
+            self._admit(0.0)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            result = {
+                "active": self.active,
+                "max_active": self.max_active,
+                "queued": self.queued,
+                "max_queue": self.max_queue,
+                "queued_users": len(self._queues),
+                "holding": self.holding,
+                "admitted": self.admitted,
+                "waited": self.waited,
+                "rejected_queue_full": self.rejected_full,
+                "rejected_user_queue": self.rejected_user,
+                "queue_timeouts": self.timeouts,
+            }
+        result["queue_wait"] = latency(f"{self.name}_queue_wait").snapshot()
+        result["hold"] = latency(f"{self.name}_hold").snapshot()
+        return result
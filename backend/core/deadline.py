@@ -0,0 +1,53 @@
+"""Per-request deadline budgets
+
+A Deadline is created when a request starts and handed to every stage
+(DB statements, LLM calls, retries). Each stage asks how much time is left
+instead of using its own fixed timeout, so the request as a whole finishes
+inside its budget, well before gunicorn's worker timeout.
+"""
+
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before a stage could finish"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        super().__init__(f"Deadline exceeded during {stage}")
+
+
+class Deadline:
+    """Monotonic time budget of one request"""
+
+    def __init__(self, seconds: float):
+        self.budget = seconds
+        self.started = time.monotonic()
+        self.expires_at = self.started + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def covers(self, seconds: float) -> bool:
+        """Whether `seconds` of work still fit in the budget"""
+        return self.remaining() >= seconds
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """Remaining seconds, optionally capped by a stage's own limit"""
+        remaining = self.remaining()
+        return min(remaining, cap) if cap is not None else remaining
+
+    def statement_timeout_ms(self, floor_ms: int) -> int:
+        """Postgres statement_timeout for the next statement.
+
+        Never below `floor_ms`: the final writes of a request (logging the
+        reply) must still be able to run once the budget is spent.
+        """
+        return max(int(self.remaining() * 1000), floor_ms)
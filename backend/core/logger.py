@@ -143,7 +143,7 @@ class StructuredLogger:
             0,
             event,
             (),
-            exc,
+            (type(exc), exc, exc.__traceback__) if exc else None,
         )
         record.extra_data = context
         self.logger.handle(record)
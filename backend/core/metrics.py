@@ -0,0 +1,78 @@
+"""In-process runtime metrics (one registry per gunicorn worker)
+
+Counters and rolling latency windows, read by /api/admin/metrics.
+"""
+
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+_lock = threading.Lock()
+_latencies: Dict[str, "LatencyWindow"] = {}
+_counters: Dict[str, int] = {}
+
+
+def _pick(sorted_samples, pct: float) -> float:
+    idx = int(round(pct / 100 * (len(sorted_samples) - 1)))
+    return sorted_samples[min(len(sorted_samples) - 1, idx)]
+
+
+class LatencyWindow:
+    """Rolling window of the most recent latency samples (milliseconds)"""
+
+    def __init__(self, size: int = 500):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, ms: float) -> None:
+        with self._lock:
+            self._samples.append(ms)
+            self.count += 1
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        return _pick(samples, pct) if samples else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self.count
+        if not samples:
+            return {"count": count, "window": 0}
+        return {
+            "count": count,
+            "window": len(samples),
+            "avg_ms": round(sum(samples) / len(samples), 1),
+            "p50_ms": round(_pick(samples, 50), 1),
+            "p95_ms": round(_pick(samples, 95), 1),
+            "p99_ms": round(_pick(samples, 99), 1),
+            "max_ms": round(samples[-1], 1),
+        }
+
+
+def latency(name: str) -> LatencyWindow:
+    """Get (or create) the latency window registered under `name`"""
+    with _lock:
+        window = _latencies.get(name)
+        if window is None:
+            window = _latencies[name] = LatencyWindow()
+        return window
+
+
+def incr(name: str, amount: int = 1) -> None:
+    """Increment a named counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def metrics_snapshot() -> Dict[str, Any]:
+    """All counters and latency summaries of this worker"""
+    with _lock:
+        counters = dict(_counters)
+        windows = dict(_latencies)
+    return {
+        "counters": counters,
+        "latency": {name: w.snapshot() for name, w in windows.items()},
+    }
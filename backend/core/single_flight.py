@@ -0,0 +1,88 @@
+"""Single-flight - share one execution between identical concurrent calls
+
+The first caller for a key becomes the leader and does the work; callers
+arriving with the same key while it runs (or up to `retention` seconds after
+it finished) wait for and reuse the leader's result instead of repeating
+the work. A leader that fails publishes None: its followers then run on
+their own. Per worker, like the other in-process registries.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class Flight:
+    """One execution; `result` is set once `done` is"""
+
+    __slots__ = ("done", "result", "finished_at")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.finished_at: Optional[float] = None
+
+
+class SingleFlight:
+    """Registry of in-flight (and recently finished) executions by key"""
+
+    def __init__(self, retention: float):
+        self.retention = retention
+        self._flights: Dict[Hashable, Flight] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+        self.follower_timeouts = 0
+
+    def begin(self, key: Hashable) -> Tuple[Flight, bool]:
+        """(flight, is_leader): the leader must call finish() whatever happens"""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.leaders += 1
+            return flight, True
+
+    def wait(self, flight: Flight, timeout: float) -> Optional[Any]:
+        """The leader's result, or None if it failed or took over `timeout`"""
+        if not flight.done.wait(timeout):
+            with self._lock:
+                self.follower_timeouts += 1
+            return None
+        if flight.result is not None:
+            with self._lock:
+                self.shared += 1
+        return flight.result
+
+    def finish(self, key: Hashable, flight: Flight, result: Optional[Any]) -> None:
+        with self._lock:
+            flight.result = result
+            flight.finished_at = time.monotonic()
+            if result is None and self._flights.get(key) is flight:
+                del self._flights[key]  # nothing to share: the next caller leads
+        flight.done.set()
+
+    def _prune(self, now: float) -> None:
+        # Caller holds self._lock
+        expired = [
+            key
+            for key, flight in self._flights.items()
+            if flight.finished_at is not None and now - flight.finished_at > self.retention
+        ]
+        for key in expired:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = sum(1 for f in self._flights.values() if f.finished_at is None)
+            return {
+                "in_flight": in_flight,
+                "retained": len(self._flights) - in_flight,
+                "retention_seconds": self.retention,
+                "leaders": self.leaders,
+                "shared": self.shared,
+                "follower_timeouts": self.follower_timeouts,
+            }
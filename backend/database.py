@@ -1,10 +1,31 @@
 """Database utilities and connection management - PostgreSQL only"""
 
+import itertools
 import os
-from flask import g
-from config import SCHEMA_PATH
+import threading
+import time
+from flask import g, has_app_context
+from config import (
+    SCHEMA_PATH,
+    DATABASE_URL,
+    DB_POOL_MIN,
+    DB_POOL_MAX,
+    DB_POOL_TIMEOUT,
+    DB_POOL_PING_AFTER,
+    DB_CONNECT_RETRIES,
+    DB_CONNECT_BACKOFF,
+    DB_TIMEZONE,
+    DB_MIN_STATEMENT_TIMEOUT_MS,
+)
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
 import psycopg2.extras
+from core import DeadlineExceeded
+
+
+# Unique names for server-side cursors (only need to be unique per connection)
+_stream_ids = itertools.count(1)
 
 
 class _PgAdapter:
@@ -20,14 +41,52 @@ class _PgAdapter:
         # Convert SQLite-style placeholders (?) to psycopg2 (%s)
         return query.replace("?", "%s")
 
+    def _statement_timeout(self):
+        """SET LOCAL derived from the request deadline (see set_request_deadline)"""
+        deadline = g.get("deadline") if has_app_context() else None
+        if deadline is None:
+            return ""
+        ms = deadline.statement_timeout_ms(DB_MIN_STATEMENT_TIMEOUT_MS)
+        return f"SET LOCAL statement_timeout = {ms}; "
+
+    def _run(self, cur, query: str, params):
+        try:
+            cur.execute(query, params or ())
+        except psycopg2.errors.QueryCanceled as e:
+            if (g.get("deadline") if has_app_context() else None) is None:
+                raise
+            self._conn.rollback()
+            raise DeadlineExceeded("db") from e
+
     def execute(self, query: str, params=()):
         cur = self._conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cur.execute(self._convert_placeholders(query), params or ())
+        # Sent in the same round trip; the cursor keeps the last result
+        prefix = self._statement_timeout()
+        self._run(cur, prefix + self._convert_placeholders(query), params)
         return cur
 
     def cursor(self):
         return self._conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
+    def stream(self, query: str, params=(), itersize: int = 500):
+        """Execute on a server-side (named) cursor.
+
+        Iterating the returned cursor fetches `itersize` rows per round trip,
+        so memory stays flat whatever the result size. Must be consumed before
+        the connection commits/rolls back; close it when done.
+        """
+        cur = self._conn.cursor(
+            name=f"stream_{next(_stream_ids)}",
+            cursor_factory=psycopg2.extras.RealDictCursor,
+        )
+        cur.itersize = itersize
+        prefix = self._statement_timeout()
+        if prefix:
+            # DECLARE takes a single statement
+            self._conn.cursor().execute(prefix)
+        self._run(cur, self._convert_placeholders(query), params)
+        return cur
+
     def commit(self):
         self._conn.commit()
 
@@ -38,28 +97,259 @@ class _PgAdapter:
         self._conn.close()
 
 
-def get_db():
-    """Get PostgreSQL database connection from Flask g object"""
-    if "db" not in g:
-        conn = psycopg2.connect(os.environ.get("DATABASE_URL"))
-        # Ensure session timezone is Asia/Jakarta (WIB) so CURRENT_TIMESTAMP is in WIB
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+def _connect():
+    """Open a new connection with retry/backoff (Neon may be cold-starting).
+
+    The session timezone is set once here so CURRENT_TIMESTAMP is in WIB for
+    the whole lifetime of the connection.
+    """
+    delay = DB_CONNECT_BACKOFF
+    for attempt in range(DB_CONNECT_RETRIES + 1):
+        try:
+            conn = psycopg2.connect(DATABASE_URL)
+            break
+        except psycopg2.OperationalError as e:
+            if attempt == DB_CONNECT_RETRIES:
+                raise
+            print(
+                f"[DB WARN] Connect failed (attempt {attempt + 1}), retrying in {delay:.1f}s: {e}"
+            )
+            time.sleep(delay)
+            delay *= 2
+
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SET TIME ZONE '{DB_TIMEZONE}'")
+        conn.commit()
+        cur.close()
+    except Exception as tz_err:
+        print(f"[DB WARN] Failed to set session timezone: {tz_err}")
+    return conn
+
+
+class _ConnectionPool:
+    """Thread-safe PostgreSQL connection pool for a single worker process.
+
+    - Keeps between ``minconn`` and ``maxconn`` open connections
+    - Borrowers block up to ``timeout`` seconds when the pool is exhausted
+    - Connections idle longer than ``ping_after`` are checked with SELECT 1
+      on borrow and replaced if the server dropped them
+    - Connections are rolled back on return so no transaction leaks
+      between requests
+    """
+
+    def __init__(self, minconn, maxconn, timeout, ping_after):
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = []  # list of (conn, returned_at)
+        self._open = 0
+        self._borrowed = 0
+
+        self._stats = {
+            "connections_created": 0,
+            "connections_discarded": 0,
+            "borrows": 0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "wait_time_total_ms": 0.0,
+            "wait_time_max_ms": 0.0,
+        }
+
+        for _ in range(self.minconn):
+            try:
+                self._idle.append((self._new_conn(), time.monotonic()))
+            except Exception as e:
+                print(f"[DB WARN] Could not prefill pool: {e}")
+                break
+
+    def _new_conn(self):
+        conn = _connect()
+        with self._cond:
+            self._open += 1
+            self._stats["connections_created"] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._stats["connections_discarded"] += 1
+            self._cond.notify()
+
+    def _is_healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if idle_for < self.ping_after:
+            return True
         try:
             cur = conn.cursor()
-            cur.execute("SET TIME ZONE 'Asia/Jakarta'")
-            conn.commit()
+            cur.execute("SELECT 1")
+            cur.fetchone()
             cur.close()
-        except Exception as tz_err:
-            print(f"[DB WARN] Failed to set session timezone: {tz_err}")
+            conn.rollback()
+            return True
+        except Exception:
+            with self._cond:
+                self._stats["health_check_failures"] += 1
+            return False
+
+    def getconn(self):
+        """Borrow a connection, opening a new one if below maxconn"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        while True:
+            conn = None
+            idle_for = 0.0
+            create = False
+            with self._cond:
+                while not self._idle and self._open >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available after {self.timeout:g}s"
+                        )
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    idle_for = time.monotonic() - returned_at
+                else:
+                    # Reserve the slot before connecting outside the lock
+                    self._open += 1
+                    create = True
+
+            if create:
+                try:
+                    conn = _connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats["connections_created"] += 1
+            elif not self._is_healthy(conn, idle_for):
+                self._discard(conn)
+                continue
+
+            waited_ms = (time.monotonic() - start) * 1000
+            with self._cond:
+                self._borrowed += 1
+                self._stats["borrows"] += 1
+                self._stats["wait_time_total_ms"] += waited_ms
+                self._stats["wait_time_max_ms"] = max(
+                    self._stats["wait_time_max_ms"], waited_ms
+                )
+            return conn
+
+    def putconn(self, conn):
+        """Return a borrowed connection to the pool"""
+        with self._cond:
+            self._borrowed -= 1
+
+        if conn.closed:
+            self._discard(conn)
+            return
+
+        try:
+            if (
+                conn.get_transaction_status()
+                != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+            ):
+                conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            borrows = self._stats["borrows"]
+            return {
+                "pid": self.pid,
+                "min": self.minconn,
+                "max": self.maxconn,
+                "open": self._open,
+                "borrowed": self._borrowed,
+                "idle": len(self._idle),
+                **self._stats,
+                "wait_time_avg_ms": round(
+                    self._stats["wait_time_total_ms"] / borrows, 3
+                )
+                if borrows
+                else 0.0,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """Return this process's pool, creating it lazily (and again after fork)"""
+    global _pool
+    pid = os.getpid()
+    if _pool is None or _pool.pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool.pid != pid:
+                # Sockets inherited from a parent process must not be reused
+                _pool = _ConnectionPool(
+                    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_PING_AFTER
+                )
+    return _pool
+
+
+def get_pool_stats():
+    """Pool statistics for the current worker (borrowed, idle, wait time)"""
+    return _get_pool().stats()
+
+
+def get_db():
+    """Get a pooled PostgreSQL connection bound to the Flask g object"""
+    if "db" not in g:
         # Wrap with adapter that exposes .execute/.commit like sqlite3
-        g.db = _PgAdapter(conn)
+        g.db = _PgAdapter(_get_pool().getconn())
     return g.db
 
 
+def set_request_deadline(deadline):
+    """Bound every statement of this request by `deadline` (core.Deadline).
+
+    Each statement runs with SET LOCAL statement_timeout set to the time
+    left, never below DB_MIN_STATEMENT_TIMEOUT_MS. A statement cancelled by
+    it raises DeadlineExceeded.
+    """
+    g.deadline = deadline
+
+
 def close_db(exc=None):
-    """Close database connection"""
+    """Return the request's connection to the pool"""
     db = g.pop("db", None)
     if db is not None:
-        db.close()
+        _get_pool().putconn(db._conn)
 
 
 def init_db(standalone=False):
@@ -72,15 +362,7 @@ def init_db(standalone=False):
 
     if standalone:
         # Direct connection without Flask's g
-        conn = psycopg2.connect(os.environ.get("DATABASE_URL"))
-        try:
-            cur = conn.cursor()
-            cur.execute("SET TIME ZONE 'Asia/Jakarta'")
-            conn.commit()
-            cur.close()
-        except Exception as tz_err:
-            print(f"[DB WARN] Failed to set session timezone: {tz_err}")
-        db = _PgAdapter(conn)
+        db = _PgAdapter(_connect())
     else:
         db = get_db()
 
@@ -119,6 +401,11 @@ def init_db(standalone=False):
         if "avatar_url" not in cols:
             cur.execute("ALTER TABLE users ADD COLUMN avatar_url TEXT")
             altered = True
+        if "data_version" not in cols:
+            cur.execute(
+                "ALTER TABLE users ADD COLUMN data_version BIGINT NOT NULL DEFAULT 0"
+            )
+            altered = True
 
         if altered:
             db.commit()
@@ -1,8 +1,106 @@
 ﻿"""Helper functions for financial operations"""
 
-from functools import lru_cache
+import threading
+import time
+from collections import OrderedDict
+from config import FINANCIAL_CACHE_MAX, FINANCIAL_CACHE_TTL
 from database import get_db
 
+# Accounts shown on the dashboard, in display order
+DASHBOARD_ACCOUNTS = [
+    "Cash",
+    "BCA",
+    "Maybank",
+    "Seabank",
+    "Shopeepay",
+    "Gopay",
+    "Jago",
+    "ISaku",
+    "Ovo",
+    "Superbank",
+    "Blu Account (Saving)",
+]
+
+
+
+class _VersionedCache:
+    """Thread-safe LRU + TTL cache whose keys start with (user_id, data_version).
+
+    A write in any worker bumps users.data_version in Postgres, so stale
+    entries are simply never looked up again and age out of the LRU.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [k for k in self._data if k[0] == user_id]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_balance_cache = _VersionedCache(FINANCIAL_CACHE_MAX, FINANCIAL_CACHE_TTL)
+
+
+def bump_data_version(db, user_id):
+    """Mark the user's financial data as changed (caller commits with the write)"""
+    db.execute(
+        "UPDATE users SET data_version = data_version + 1 WHERE id = ?", (user_id,)
+    )
+
+
+def get_data_version(user_id):
+    """Current data version of a user (0 if the user does not exist)"""
+    db = get_db()
+    row = db.execute(
+        "SELECT data_version FROM users WHERE id = ?", (user_id,)
+    ).fetchone()
+    return row["data_version"] if row else 0
+
 
 def _validate_year_month(user_id, year, month):
     if not isinstance(user_id, int) or user_id <= 0:
@@ -17,22 +115,17 @@ def get_month_summary(user_id, year, month):
     """Get income/expense summary for a specific month"""
     _validate_year_month(user_id, year, month)
     db = get_db()
-    start_date = f"{year}-{month:02d}-01"
-
-    if month == 12:
-        end_date = f"{year + 1}-01-01"
-    else:
-        end_date = f"{year}-{month + 1:02d}-01"
 
+    # Read the monthly rollup buckets instead of scanning raw transactions
     cur = db.execute(
         """
         SELECT
-            SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) AS total_income,
-            SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) AS total_expense
-        FROM transactions
-        WHERE user_id = ? AND date >= ? AND date < ?
+            SUM(CASE WHEN type = 'income' THEN total_amount ELSE 0 END) AS total_income,
+            SUM(CASE WHEN type = 'expense' THEN total_amount ELSE 0 END) AS total_expense
+        FROM transaction_rollups
+        WHERE user_id = ? AND month = ?
         """,
-        (user_id, start_date, end_date),
+        (user_id, f"{year}-{month:02d}-01"),
     )
     row = cur.fetchone()
 
@@ -56,32 +149,18 @@ def get_month_summary(user_id, year, month):
     }
 
 
-@lru_cache(maxsize=128)
-def _cached_financial_context(user_id, year, month):
-    """Internal cached function - DO NOT call directly"""
-    _validate_year_month(user_id, year, month)
-    db = get_db()
-    summary = get_month_summary(user_id, year, month)
-
-    # Get recent transactions
+def month_date_range(year, month):
+    """[start, end) ISO dates of a calendar month"""
     start_date = f"{year}-{month:02d}-01"
     if month == 12:
         end_date = f"{year + 1}-01-01"
     else:
         end_date = f"{year}-{month + 1:02d}-01"
+    return start_date, end_date
 
-    cur = db.execute(
-        """
-        SELECT id, date, type, category, description, amount, account
-        FROM transactions
-        WHERE user_id = ? AND date >= ? AND date < ?
-        ORDER BY date DESC
-        LIMIT 20
-        """,
-        (user_id, start_date, end_date),
-    )
-    rows = cur.fetchall()
 
+def format_financial_context(year, month, summary, rows):
+    """Render the month summary and recent transactions for the LLM prompt"""
     tx_lines = []
     for row in rows:
         amount = float(row["amount"]) if row.get("amount") is not None else 0
@@ -102,11 +181,54 @@ def _cached_financial_context(user_id, year, month):
     return f"{summary_text}\nRecent transactions (latest first):\n{tx_text}\n"
 
 
-def build_financial_context(user_id, year, month):
-    """Build context string with user's financial data for LLM (with caching)"""
-    return _cached_financial_context(user_id, year, month)
+def invalidate_financial_cache(user_id=None):
+    """Free this worker's cached entries after transaction changes.
+
+    Correctness across workers comes from the data_version bump done in the
+    write transaction; this only releases memory early.
+    """
+    if user_id is None:
+        _balance_cache.clear()
+    else:
+        _balance_cache.invalidate_user(user_id)
+
+
+def get_financial_cache_stats():
+    """Hit/miss counters of this worker's financial caches"""
+    return {
+        "account_balances": _balance_cache.stats(),
+    }
 
 
-def invalidate_financial_cache():
-    """Invalidate financial context cache after transaction changes"""
-    _cached_financial_context.cache_clear()
+def _load_account_balances(user_id):
+    """All dashboard account balances in a single grouped query"""
+    db = get_db()
+    cur = db.execute(
+        """
+        SELECT account,
+               SUM(CASE WHEN type = 'income' THEN total_amount
+                        WHEN type = 'expense' THEN -total_amount
+                        ELSE total_amount END) AS balance
+        FROM transaction_rollups
+        WHERE user_id = ? AND account = ANY(?)
+        GROUP BY account
+        """,
+        (user_id, DASHBOARD_ACCOUNTS),
+    )
+    by_account = {row["account"]: float(row["balance"] or 0) for row in cur.fetchall()}
+
+    accounts = [
+        {"account": acc, "balance": by_account.get(acc, 0)} for acc in DASHBOARD_ACCOUNTS
+    ]
+    total_all = float(sum(a["balance"] for a in accounts))
+    return {"accounts": accounts, "total_all": total_all}
+
+
+def get_account_balances(user_id):
+    """Balances of every dashboard account (cached per user data version)"""
+    key = (user_id, get_data_version(user_id))
+    result = _balance_cache.get(key)
+    if result is None:
+        result = _load_account_balances(user_id)
+        _balance_cache.put(key, result)
+    return result
@@ -0,0 +1,119 @@
+"""Idempotency keys for transaction writes
+
+A retried write (client retry, double submit, duplicate chat message on
+another worker) carries the same key as the first attempt. The key is
+claimed with one INSERT on the (user_id, idem_key) primary key, in the same
+DB transaction as the write itself, and the response is stored before that
+transaction commits:
+
+- first attempt: the INSERT succeeds -> write, store_response(), commit;
+- duplicate while the first is still running: the INSERT waits on the
+  unique index until the first commits (or rolls back, and then this one
+  becomes the first);
+- later duplicate: the INSERT conflicts -> the stored response is replayed.
+
+No SELECT-then-INSERT window, so concurrent duplicates cannot both write.
+Keys expire after IDEMPOTENCY_TTL_HOURS: an expired key is reclaimed by the
+same INSERT, and expired rows are purged every few hundred claims.
+"""
+
+import itertools
+import json
+from typing import Any, Optional, Tuple
+
+from config import IDEMPOTENCY_TTL_HOURS
+from core import incr
+
+MAX_KEY_LENGTH = 255
+_PURGE_EVERY = 200
+_claims = itertools.count(1)
+
+_CLAIM_SQL = """
+    INSERT INTO idempotency_keys (user_id, idem_key, scope, fingerprint)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (user_id, idem_key) DO UPDATE SET
+        scope = EXCLUDED.scope,
+        fingerprint = EXCLUDED.fingerprint,
+        status_code = NULL,
+        response = NULL,
+        created_at = CURRENT_TIMESTAMP
+    WHERE idempotency_keys.created_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+    RETURNING user_id
+"""
+
+_STORED_SQL = """
+    SELECT fingerprint, status_code, response FROM idempotency_keys
+    WHERE user_id = %s AND idem_key = %s
+"""
+
+
+def claim_key(
+    db, user_id: int, key: str, scope: str, fingerprint: Optional[str] = None
+) -> Optional[Tuple[int, Any]]:
+    """Claim `key` for a write that is about to run on `db`.
+
+    Returns None when this request owns the key (go ahead, then call
+    store_response before committing). Otherwise returns the
+    (status_code, body) to answer with: the stored response of the first
+    attempt, or a 422 when the key was used for a different request.
+    """
+    key = key[:MAX_KEY_LENGTH]
+    if next(_claims) % _PURGE_EVERY == 0:
+        purge_expired(db)
+    owned = db.execute(
+        _CLAIM_SQL, (user_id, key, scope, fingerprint, IDEMPOTENCY_TTL_HOURS)
+    ).fetchone()
+    if owned:
+        incr("idempotency_claims")
+        return None
+
+    stored = db.execute(_STORED_SQL, (user_id, key)).fetchone()
+    if stored is None:
+        # Released by its owner between the two statements: claim it again
+        return claim_key(db, user_id, key, scope, fingerprint)
+    if fingerprint and stored["fingerprint"] and stored["fingerprint"] != fingerprint:
+        incr("idempotency_key_reused")
+        return 422, {
+            "success": False,
+            "error": "Idempotency-Key sudah dipakai untuk request lain",
+            "code": "IDEMPOTENCY_KEY_REUSED",
+        }
+    incr("idempotency_replays")
+    if stored["response"] is None:
+        # Owner committed its write without a stored response
+        return 409, {
+            "success": False,
+            "error": "Request ini sudah diproses",
+            "code": "IDEMPOTENCY_ALREADY_PROCESSED",
+        }
+    return stored["status_code"], json.loads(stored["response"])
+
+
+def store_response(db, user_id: int, key: str, status_code: int, body: Any) -> None:
+    """Record the response of an owned key. Does not commit - the caller
+    commits together with the write."""
+    db.execute(
+        """
+        UPDATE idempotency_keys SET status_code = %s, response = %s
+        WHERE user_id = %s AND idem_key = %s
+        """,
+        (status_code, json.dumps(body, default=str), user_id, key[:MAX_KEY_LENGTH]),
+    )
+
+
+def release_key(db, user_id: int, key: str) -> None:
+    """Give up an owned key when nothing was written (e.g. validation failed)"""
+    db.execute(
+        "DELETE FROM idempotency_keys WHERE user_id = %s AND idem_key = %s",
+        (user_id, key[:MAX_KEY_LENGTH]),
+    )
+
+
+def purge_expired(db) -> None:
+    db.execute(
+        """
+        DELETE FROM idempotency_keys
+        WHERE created_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+        """,
+        (IDEMPOTENCY_TTL_HOURS,),
+    )
@@ -11,6 +11,22 @@ from .amount_parser import parse_amount, extract_amount_from_message
 from .retry_utils import retry_with_backoff, call_llm_with_retry
 from .category_suggester import get_category_suggestion
 from .field_parser import parse_field_with_confidence
+from .query_engine import QueryPlan, plan_query, answer_query
+from .transaction_capture import TransactionCapture, capture_transaction
+from .result_explainer import explain_results
+from .response_cache import (
+    get_response_cache,
+    get_response_cache_stats,
+    invalidate_cached_responses,
+    is_cacheable,
+)
+from .providers import (
+    get_openai_client,
+    get_gemini_model,
+    get_provider_stats,
+    provider_available,
+)
+from .router import Attempt, CircuitBreaker, route_llm_call, get_router_stats
 
 __all__ = [
     "execute_action",
@@ -24,4 +40,22 @@ __all__ = [
     "call_llm_with_retry",
     "get_category_suggestion",
     "parse_field_with_confidence",
+    "QueryPlan",
+    "plan_query",
+    "answer_query",
+    "TransactionCapture",
+    "capture_transaction",
+    "explain_results",
+    "get_response_cache",
+    "get_response_cache_stats",
+    "invalidate_cached_responses",
+    "is_cacheable",
+    "get_openai_client",
+    "get_gemini_model",
+    "get_provider_stats",
+    "provider_available",
+    "Attempt",
+    "CircuitBreaker",
+    "route_llm_call",
+    "get_router_stats",
 ]
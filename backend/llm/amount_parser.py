@@ -34,6 +34,8 @@ INDONESIAN_NUMBERS = {
     "miliar": 1000000000,
 }
 
+_PLAIN_NUMBER_RE = re.compile(r"(rp\s*)?\d[\d.,]*")
+
 
 def parse_amount(text: str) -> Optional[float]:
     """Parse amount from various text formats
@@ -61,6 +63,13 @@ def parse_amount(text: str) -> Optional[float]:
 
     text_lower = text.lower().strip()
 
+    # Plain numbers with thousand separators ("50.000", "1,250,000.00") must not
+    # be read as shorthand decimals (the shorthand pattern would stop at "50,0")
+    if _PLAIN_NUMBER_RE.fullmatch(text_lower):
+        amount = _parse_numeric(text_lower)
+        if amount is not None:
+            return amount
+
     # Try shorthand formats first (most common)
     amount = _parse_shorthand(text_lower)
     if amount is not None:
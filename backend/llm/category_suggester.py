@@ -263,17 +263,22 @@ def suggest_category_from_history(
     if not description:
         return None
 
-    # Get similar descriptions from user's history
+    words = re.findall(r"\w+", description.lower())
+    if not words:
+        return None
+
+    # Only history sharing at least one word (served by idx_transactions_search)
     cursor = db.execute(
         """
         SELECT category, description, COUNT(*) as freq
         FROM transactions
         WHERE user_id = %s AND type = %s AND description IS NOT NULL
+          AND search_vector @@ to_tsquery('simple', %s)
         GROUP BY category, description
         ORDER BY freq DESC
         LIMIT 50
         """,
-        (user_id, transaction_type),
+        (user_id, transaction_type, " | ".join(words)),
     )
 
     history = cursor.fetchall()
@@ -5,10 +5,12 @@ Uses TransactionService for safe operations with isolation and validation.
 
 from datetime import datetime, timedelta, timezone
 import re
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Sequence
 from core import get_logger, TransactionValidator, ValidationError
 from database import get_db
 from financial_context import invalidate_financial_cache
+from idempotency import claim_key, release_key, store_response
+from transaction_rollups import add_to_rollups, remove_from_rollups, replace_in_rollups
 from llm.validation_utils import (
     validate_account,
     validate_amount,
@@ -86,8 +88,24 @@ def _parse_amount(val: Optional[str]) -> Optional[float]:
         return None
 
 
+def _transaction_details(row) -> Dict[str, Any]:
+    """JSON-safe copy of a transaction row for structured action results"""
+    return {
+        "type": row["type"],
+        "amount": float(row["amount"]),
+        "category": row["category"],
+        "account": row["account"],
+        "date": str(row["date"]),
+    }
+
+
 def execute_action(
-    user_id: int, action_name: str, args: Dict[str, Any], lang: str = "id"
+    user_id: int,
+    action_name: str,
+    args: Dict[str, Any],
+    lang: str = "id",
+    idempotency_key: Optional[str] = None,
+    prior_idempotency_key: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     Execute LLM action with proper error handling and validation.
@@ -97,6 +115,10 @@ def execute_action(
         action_name: Action name (add_transaction, create_savings_goal, etc)
         args: Action arguments
         lang: Language for response messages (id/en), default='id'
+        idempotency_key: Runs the action at most once per key; a repeat
+            returns the first result with "replayed": True
+        prior_idempotency_key: Another key of the same request (e.g. from an
+            earlier time bucket); a result stored under it is replayed too
 
     Returns:
         Dict with success status and details
@@ -104,6 +126,20 @@ def execute_action(
     # Ensure lang is valid
     lang = lang if lang in ["id", "en"] else "id"
 
+    if idempotency_key:
+        keys = [k for k in (prior_idempotency_key, idempotency_key) if k]
+        return _execute_once(user_id, action_name, args, lang, keys)
+    return _run_action(user_id, action_name, args, lang)
+
+
+def _run_action(
+    user_id: int,
+    action_name: str,
+    args: Dict[str, Any],
+    lang: str,
+    keys: Sequence[str] = (),
+) -> Dict[str, Any]:
+    """Dispatch to the action; a write stores its result under `keys` before committing"""
     try:
         logger.info(
             "llm_action_started",
@@ -120,23 +156,23 @@ def execute_action(
             "add_expense",
             "add_income",
         ]:
-            return _execute_add_transaction(user_id, action_name, args, lang)
+            return _execute_add_transaction(user_id, action_name, args, lang, keys)
 
         # CREATE SAVINGS GOAL
         elif action_name == "create_savings_goal":
-            return _execute_create_savings_goal(user_id, args, lang)
+            return _execute_create_savings_goal(user_id, args, lang, keys)
 
         # UPDATE TRANSACTION
         elif action_name == "update_transaction":
-            return _execute_update_transaction(user_id, args, lang)
+            return _execute_update_transaction(user_id, args, lang, keys)
 
         # DELETE TRANSACTION
         elif action_name == "delete_transaction":
-            return _execute_delete_transaction(user_id, args, lang)
+            return _execute_delete_transaction(user_id, args, lang, keys)
 
         # TRANSFER FUNDS
         elif action_name == "transfer_funds":
-            return _execute_transfer_funds(user_id, args, lang)
+            return _execute_transfer_funds(user_id, args, lang, keys)
 
         else:
             logger.warning("unknown_action", action=action_name, user_id=user_id)
@@ -165,8 +201,70 @@ def execute_action(
         }
 
 
+def _execute_once(
+    user_id: int, action_name: str, args: Dict[str, Any], lang: str, keys: List[str]
+) -> Dict[str, Any]:
+    """execute_action guarded by idempotency keys.
+
+    Every key is claimed on the request connection, in order, so the
+    action's own commit (_commit_write) stores the result under every key
+    and commits it together with the claims and the write: a duplicate
+    waiting on a claim finds the result. A key already used replays its
+    result; a failed action gives the keys back.
+    """
+    db = get_db()
+    try:
+        for key in keys:
+            replay = claim_key(db, user_id, key, action_name)
+            if replay:
+                break
+    except Exception as e:
+        db.rollback()
+        logger.error("llm_action_claim_failed", action=action_name, user_id=user_id, error=str(e))
+        return {
+            "success": False,
+            "message": f"Kesalahan saat menjalankan aksi: {str(e)}",
+            "code": "EXECUTION_ERROR",
+        }
+    if replay:
+        db.rollback()
+        status_code, result = replay
+        logger.info("llm_action_replayed", action=action_name, user_id=user_id)
+        if status_code != 200:
+            return result
+        return {**result, "replayed": True}
+
+    result = _run_action(user_id, action_name, args, lang, keys)
+    if result.get("success"):
+        return result
+    try:
+        for key in keys:
+            release_key(db, user_id, key)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(
+            "llm_action_idempotency_store_failed",
+            action=action_name,
+            user_id=user_id,
+            error=str(e),
+        )
+    return result
+
+
+def _commit_write(db, user_id: int, keys: Sequence[str], result: Dict[str, Any]) -> None:
+    """Commit an action's write, with its result stored under its idempotency keys"""
+    for key in keys:
+        store_response(db, user_id, key, 200, result)
+    db.commit()
+
+
 def _execute_add_transaction(
-    user_id: int, action_name: str, args: Dict[str, Any], lang: str = "id"
+    user_id: int,
+    action_name: str,
+    args: Dict[str, Any],
+    lang: str = "id",
+    keys: Sequence[str] = (),
 ) -> Dict[str, Any]:
     """Execute add transaction with validation and isolation"""
     lang = lang if lang in ["id", "en"] else "id"
@@ -385,8 +483,7 @@ def _execute_add_transaction(
                 account,
             ),
         )
-        db.commit()
-        invalidate_financial_cache()  # Clear cache after transaction added
+        add_to_rollups(db, user_id, {**validated, "account": account})
         type_label = validated["type"].capitalize()
         if lang == "en":
             type_label = "Income" if validated["type"] == "income" else "Expense"
@@ -400,7 +497,17 @@ def _execute_add_transaction(
             "message": success_message,
             "amount": validated["amount"],
             "category": validated["category"],
+            "details": {
+                "type": validated["type"],
+                "amount": validated["amount"],
+                "category": validated["category"],
+                "description": validated["description"],
+                "date": str(validated["date"]),
+                "account": account,
+            },
         }
+        _commit_write(db, user_id, keys, result)
+        invalidate_financial_cache(user_id)  # Clear cache after transaction added
     except Exception as e:
         logger.error("transaction_insert_error", user_id=user_id, error=str(e))
         result = {
@@ -413,7 +520,7 @@ def _execute_add_transaction(
 
 
 def _execute_create_savings_goal(
-    user_id: int, args: Dict[str, Any], lang: str = "id"
+    user_id: int, args: Dict[str, Any], lang: str = "id", keys: Sequence[str] = ()
 ) -> Dict[str, Any]:
     """Execute create savings goal with validation - NO DEFAULTS"""
 
@@ -537,15 +644,6 @@ def _execute_create_savings_goal(
             (user_id, name, target_amount, description, normalized_date),
         )
         goal_id = cur.fetchone()[0]
-        db.commit()
-
-        logger.info(
-            "savings_goal_created",
-            user_id=user_id,
-            goal_id=goal_id,
-            name=name,
-            target_date=normalized_date,
-        )
 
         # Format date for display
         from datetime import datetime as dt
@@ -561,7 +659,7 @@ def _execute_create_savings_goal(
             if lang == "id"
             else f"✨ Savings goal '{name}' created successfully! Target ${target_amount:,.0f} by {date_display}"
         )
-        return {
+        result = {
             "success": True,
             "message": success_msg,
             "details": {
@@ -572,6 +670,16 @@ def _execute_create_savings_goal(
                 "goal_id": goal_id,
             },
         }
+        _commit_write(db, user_id, keys, result)
+
+        logger.info(
+            "savings_goal_created",
+            user_id=user_id,
+            goal_id=goal_id,
+            name=name,
+            target_date=normalized_date,
+        )
+        return result
 
     except Exception as e:
         db.rollback()
@@ -589,7 +697,7 @@ def _execute_create_savings_goal(
 
 
 def _execute_update_transaction(
-    user_id: int, args: Dict[str, Any], lang: str = "id"
+    user_id: int, args: Dict[str, Any], lang: str = "id", keys: Sequence[str] = ()
 ) -> Dict[str, Any]:
     """Execute update transaction with validation"""
 
@@ -616,11 +724,13 @@ def _execute_update_transaction(
         # Verify transaction belongs to user
         cur = db.cursor()
         cur.execute(
-            "SELECT id FROM transactions WHERE id = %s AND user_id = %s",
+            """SELECT id, date, type, category, amount, account FROM transactions
+               WHERE id = %s AND user_id = %s FOR UPDATE""",
             (transaction_id, user_id),
         )
 
-        if not cur.fetchone():
+        old_row = cur.fetchone()
+        if not old_row:
             logger.warning(
                 "transaction_not_found",
                 user_id=user_id,
@@ -640,6 +750,7 @@ def _execute_update_transaction(
         # Build update query from provided fields
         update_fields = []
         params = []
+        new_row = dict(old_row)
 
         for field in ["date", "type", "category", "description", "amount", "account"]:
             if field in args:
@@ -656,6 +767,7 @@ def _execute_update_transaction(
 
                 update_fields.append(f"{field} = %s")
                 params.append(value)
+                new_row[field] = value
 
         if not update_fields:
             return {
@@ -673,25 +785,32 @@ def _execute_update_transaction(
         )
 
         cur.execute(query, params)
-        db.commit()
-        invalidate_financial_cache()  # Clear cache after transaction updated
-
-        logger.info(
-            "transaction_updated",
-            user_id=user_id,
-            transaction_id=transaction_id,
-        )
+        replace_in_rollups(db, user_id, old_row, new_row)
 
         success_msg = (
             f"✅ Transaksi #{transaction_id} berhasil diperbarui"
             if lang == "id"
             else f"✅ Transaction #{transaction_id} updated successfully"
         )
-        return {
+        result = {
             "success": True,
             "message": success_msg,
             "transaction_id": transaction_id,
+            "details": {
+                "transaction_id": transaction_id,
+                "before": _transaction_details(old_row),
+                "after": _transaction_details(new_row),
+            },
         }
+        _commit_write(db, user_id, keys, result)
+        invalidate_financial_cache(user_id)  # Clear cache after transaction updated
+
+        logger.info(
+            "transaction_updated",
+            user_id=user_id,
+            transaction_id=transaction_id,
+        )
+        return result
 
     except Exception as e:
         db.rollback()
@@ -714,7 +833,7 @@ def _execute_update_transaction(
 
 
 def _execute_delete_transaction(
-    user_id: int, args: Dict[str, Any], lang: str = "id"
+    user_id: int, args: Dict[str, Any], lang: str = "id", keys: Sequence[str] = ()
 ) -> Dict[str, Any]:
     """Execute delete transaction with mandatory confirmation for safety"""
 
@@ -826,7 +945,8 @@ def _execute_delete_transaction(
 
         # Delete transaction
         cur.execute(
-            "DELETE FROM transactions WHERE id = %s AND user_id = %s RETURNING id",
+            """DELETE FROM transactions WHERE id = %s AND user_id = %s
+               RETURNING id, date, type, category, amount, account""",
             (transaction_id, user_id),
         )
 
@@ -843,25 +963,31 @@ def _execute_delete_transaction(
                 "code": "DELETE_FAILED",
             }
 
-        db.commit()
-        invalidate_financial_cache()  # Clear cache after transaction deleted
-
-        logger.info(
-            "transaction_deleted",
-            user_id=user_id,
-            transaction_id=transaction_id,
-        )
+        remove_from_rollups(db, user_id, deleted)
 
         success_msg = (
             f"✅ Transaksi #{transaction_id} terhapus"
             if lang == "id"
             else f"✅ Transaction #{transaction_id} deleted"
         )
-        return {
+        result = {
             "success": True,
             "message": success_msg,
             "transaction_id": transaction_id,
+            "details": {
+                "transaction_id": transaction_id,
+                **_transaction_details(deleted),
+            },
         }
+        _commit_write(db, user_id, keys, result)
+        invalidate_financial_cache(user_id)  # Clear cache after transaction deleted
+
+        logger.info(
+            "transaction_deleted",
+            user_id=user_id,
+            transaction_id=transaction_id,
+        )
+        return result
 
     except Exception as e:
         db.rollback()
@@ -884,7 +1010,7 @@ def _execute_delete_transaction(
 
 
 def _execute_transfer_funds(
-    user_id: int, args: Dict[str, Any], lang: str = "id"
+    user_id: int, args: Dict[str, Any], lang: str = "id", keys: Sequence[str] = ()
 ) -> Dict[str, Any]:
     """Execute transfer between accounts with validation - NO DEFAULTS"""
 
@@ -1003,10 +1129,10 @@ def _execute_transfer_funds(
     # Check balance (prevent negative balance)
     db = get_db()
     cur_balance = db.execute(
-        """SELECT COALESCE(SUM(CASE WHEN type='income' THEN amount 
-                                    WHEN type='expense' THEN -amount 
+        """SELECT COALESCE(SUM(CASE WHEN type='income' THEN total_amount 
+                                    WHEN type='expense' THEN -total_amount 
                                     ELSE 0 END), 0) as balance
-           FROM transactions WHERE user_id = %s AND account = %s""",
+           FROM transaction_rollups WHERE user_id = %s AND account = %s""",
         (user_id, from_account),
     ).fetchone()["balance"]
 
@@ -1131,18 +1257,20 @@ def _execute_transfer_funds(
             ),
         )
 
-        db.commit()
-        invalidate_financial_cache()  # Clear cache after transfer completed
-
-        logger.info(
-            "transfer_completed",
-            user_id=user_id,
-            from_account=from_account,
-            to_account=to_account,
-            amount=amount,
-        )
+        for tx_type, account in (("expense", from_account), ("income", to_account)):
+            add_to_rollups(
+                db,
+                user_id,
+                {
+                    "date": normalized_date,
+                    "type": tx_type,
+                    "category": "Transfer",
+                    "amount": amount,
+                    "account": account,
+                },
+            )
 
-        return {
+        result = {
             "success": True,
             "message": f"✅ Transfer Rp {amount:,.0f} dari {from_account} ke {to_account} berhasil",
             "details": {
@@ -1154,6 +1282,17 @@ def _execute_transfer_funds(
                 "balance_from": cur_balance - amount,
             },
         }
+        _commit_write(db, user_id, keys, result)
+        invalidate_financial_cache(user_id)  # Clear cache after transfer completed
+
+        logger.info(
+            "transfer_completed",
+            user_id=user_id,
+            from_account=from_account,
+            to_account=to_account,
+            amount=amount,
+        )
+        return result
 
     except Exception as e:
         logger.error(
@@ -0,0 +1,172 @@
+"""Provider Registry - LLM clients created once per worker and reused
+
+- OpenAI: one client per process over a pooled httpx transport (keep-alive,
+  bounded connections, connect/read timeouts). The SDK's own retries are
+  off by default because the LLM router retries and fails over itself.
+- Gemini: GenerativeModel handles cached by model id, built once with the
+  safety settings baked in.
+
+Clients are rebuilt after fork (gunicorn workers never share sockets).
+Every OpenAI request is traced to count new vs reused connections;
+get_provider_stats() feeds /api/admin/metrics.
+"""
+
+import os
+import threading
+from typing import Dict
+
+from openai import OpenAI
+
+from config import (
+    GOOGLE_API_KEY,
+    OPENAI_API_KEY,
+    LLM_CONNECT_TIMEOUT,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE,
+    LLM_READ_TIMEOUT,
+    OPENAI_CLIENT_MAX_RETRIES,
+)
+from core import get_logger, incr, metrics_snapshot
+
+try:
+    import httpx
+except Exception:
+    httpx = None  # Optional: fall back to the SDK's default transport
+
+try:
+    import google.generativeai as genai
+except Exception:
+    genai = None  # Optional: allow running without Google Generative AI
+
+logger = get_logger(__name__)
+
+GEMINI_SAFETY = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_NONE",
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_NONE",
+    },
+]
+
+_lock = threading.Lock()
+_pid = None
+_openai_client = None
+_transport = None
+_gemini_models: Dict[str, object] = {}
+_gemini_configured = False
+
+
+def _traced_transport():
+    """httpx transport that counts opened vs reused connections"""
+
+    def trace(event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            incr("llm_http_connections_opened")
+
+    class TracedTransport(httpx.HTTPTransport):
+        def handle_request(self, request):
+            incr("llm_http_requests")
+            request.extensions["trace"] = trace
+            return super().handle_request(request)
+
+    return TracedTransport(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def _reset_after_fork() -> None:
+    # Caller holds _lock
+    global _pid, _openai_client, _transport, _gemini_configured
+    if _pid != os.getpid():
+        _pid = os.getpid()
+        _openai_client = None
+        _transport = None
+        _gemini_models.clear()
+        _gemini_configured = False
+
+
+def get_openai_client() -> OpenAI:
+    """The worker's shared OpenAI client"""
+    global _openai_client, _transport
+    with _lock:
+        _reset_after_fork()
+        if _openai_client is None:
+            if httpx is not None:
+                _transport = _traced_transport()
+                http_client = httpx.Client(
+                    transport=_transport,
+                    timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                )
+                _openai_client = OpenAI(
+                    http_client=http_client, max_retries=OPENAI_CLIENT_MAX_RETRIES
+                )
+            else:
+                _openai_client = OpenAI(max_retries=OPENAI_CLIENT_MAX_RETRIES)
+            logger.info("openai_client_created", pid=_pid, pooled=httpx is not None)
+        return _openai_client
+
+
+def get_gemini_model(model_id: str):
+    """Cached GenerativeModel for `model_id` (safety settings included)"""
+    global _gemini_configured
+    if genai is None or not GOOGLE_API_KEY:
+        raise RuntimeError("Gemini is not configured (google-generativeai / GOOGLE_API_KEY)")
+    with _lock:
+        _reset_after_fork()
+        if not _gemini_configured:
+            genai.configure(api_key=GOOGLE_API_KEY)
+            _gemini_configured = True
+        model = _gemini_models.get(model_id)
+        if model is None:
+            model = genai.GenerativeModel(model_id, safety_settings=GEMINI_SAFETY)
+            _gemini_models[model_id] = model
+            incr("gemini_model_handles_created")
+        else:
+            incr("gemini_model_handles_reused")
+        return model
+
+
+def provider_available(provider: str) -> bool:
+    """Whether `provider` ("openai" / "google") has credentials in this deployment"""
+    if provider == "openai":
+        return bool(OPENAI_API_KEY)
+    if provider == "google":
+        return genai is not None and bool(GOOGLE_API_KEY)
+    return False
+
+
+def get_provider_stats() -> Dict:
+    """Client/connection reuse of this worker"""
+    counters = metrics_snapshot()["counters"]
+    requests = counters.get("llm_http_requests", 0)
+    opened = counters.get("llm_http_connections_opened", 0)
+    with _lock:
+        pool = getattr(_transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        models = sorted(_gemini_models)
+    return {
+        "openai": {
+            "pooled": _transport is not None,
+            "requests": requests,
+            "connections_opened": opened,
+            "connection_reuse_rate": round(1 - opened / requests, 4) if requests else 0.0,
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+        },
+        "gemini": {
+            "models": models,
+            "handles_created": counters.get("gemini_model_handles_created", 0),
+            "handles_reused": counters.get("gemini_model_handles_reused", 0),
+        },
+    }
+
@@ -0,0 +1,484 @@
+"""Local Query Engine - answer common aggregate questions without the LLM
+
+Recognizes, in Indonesian and English:
+- balance per account ("saldo BCA berapa?", "my gopay balance")
+- income/expense totals for a period ("total pengeluaran bulan ini")
+- top expense categories ("kategori pengeluaran terbesar bulan lalu")
+- spending in a date range ("pengeluaran dari 1 oktober sampai 15 oktober")
+
+plan_query() is pure (no database). Its confidence is the share of words in
+the message the plan accounts for, so anything with extra intent ("kenapa",
+"saran", unknown words) falls back to the LLM.
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from financial_context import get_account_balances
+from database import get_db
+
+from .input_interpreter import InputInterpreter, MatchConfidence
+from .validation_utils import parse_natural_date, VALID_CATEGORIES_BY_TYPE
+
+QUERY_KINDS = ("balance", "totals", "top_categories")
+TOP_CATEGORIES_LIMIT = 5
+
+MONTHS = {
+    "januari": 1, "january": 1, "jan": 1,
+    "februari": 2, "february": 2, "feb": 2,
+    "maret": 3, "march": 3, "mar": 3,
+    "april": 4, "apr": 4,
+    "mei": 5, "may": 5,
+    "juni": 6, "june": 6, "jun": 6,
+    "juli": 7, "july": 7, "jul": 7,
+    "agustus": 8, "august": 8, "agt": 8, "aug": 8,
+    "september": 9, "sept": 9, "sep": 9,
+    "oktober": 10, "october": 10, "okt": 10, "oct": 10,
+    "november": 11, "nov": 11,
+    "desember": 12, "december": 12, "des": 12, "dec": 12,
+}
+MONTH_NAMES = {
+    "id": ["Januari", "Februari", "Maret", "April", "Mei", "Juni", "Juli",
+           "Agustus", "September", "Oktober", "November", "Desember"],
+    "en": ["January", "February", "March", "April", "May", "June", "July",
+           "August", "September", "October", "November", "December"],
+}
+_MONTH_ALT = "|".join(sorted(MONTHS, key=len, reverse=True))
+
+# Relative periods: phrase -> (unit, parse_natural_date term or None for "now")
+RELATIVE_PERIODS = {
+    "hari ini": ("day", "hari ini"),
+    "today": ("day", "today"),
+    "kemarin": ("day", "kemarin"),
+    "yesterday": ("day", "yesterday"),
+    "minggu ini": ("week", None),
+    "this week": ("week", None),
+    "minggu lalu": ("week", "minggu lalu"),
+    "minggu kemarin": ("week", "minggu lalu"),
+    "last week": ("week", "last week"),
+    "bulan ini": ("month", None),
+    "this month": ("month", None),
+    "bulan lalu": ("month", "bulan lalu"),
+    "bulan kemarin": ("month", "bulan lalu"),
+    "last month": ("month", "last month"),
+    "tahun ini": ("year", None),
+    "this year": ("year", None),
+    "tahun lalu": ("year", "tahun lalu"),
+    "last year": ("year", "last year"),
+}
+_RELATIVE_RE = re.compile(
+    r"\b(" + "|".join(sorted(RELATIVE_PERIODS, key=len, reverse=True)) + r")\b"
+)
+_DATE_RE = re.compile(
+    rf"\b(\d{{4}}-\d{{2}}-\d{{2}}|\d{{1,2}}\s+(?:{_MONTH_ALT})(?:\s+\d{{4}})?)\b"
+)
+_MONTH_RE = re.compile(rf"\b(?:bulan\s+)?({_MONTH_ALT})(?:\s+(\d{{4}}))?\b")
+
+# Questions the templates cannot answer well
+_UNSUPPORTED_RE = re.compile(
+    r"\b(kenapa|mengapa|why|saran|sarankan|advice|advise|tips?|bagaimana|how\s+to|"
+    r"should|sebaiknya|hemat|budget|anggaran|analisa|analisis|analy[sz]e|banding|"
+    r"bandingkan|compare|vs|prediksi|predict|forecast|rata|average|besok|tomorrow|"
+    r"depan|next|rencana|plan|goal|target|tabungan|savings?|transfer)\b"
+)
+
+_BALANCE_RE = re.compile(r"\b(saldo|balance|balances)\b")
+_TOP_RE = re.compile(
+    r"\b(terbesar|terbanyak|terboros|top|biggest|largest|most|paling)\b"
+)
+_INCOME_RE = re.compile(r"\b(pemasukan|pendapatan|penghasilan|income|earnings?|earned)\b")
+_EXPENSE_RE = re.compile(r"\b(pengeluaran|expenses?|spending|spent|spend|keluar)\b")
+_SUMMARY_RE = re.compile(r"\b(ringkasan|rekap|summary|cashflow|arus)\b")
+
+CATEGORY_WORDS = {
+    **{c.lower(): c for cats in VALID_CATEGORIES_BY_TYPE.values() for c in cats},
+    "food": "Makan",
+    "makanan": "Makan",
+    "transportasi": "Transport",
+    "transportation": "Transport",
+    "entertainment": "Hiburan",
+    "shopping": "Belanja",
+    "health": "Kesehatan",
+    "education": "Pendidikan",
+    "utilities": "Utilitas",
+    "salary": "Gaji",
+}
+CATEGORY_WORDS.pop("lainnya", None)
+EXPENSE_CATEGORIES = set(VALID_CATEGORIES_BY_TYPE["expense"])
+
+# Words that carry no query meaning of their own
+FILLER_WORDS = {
+    "saya", "aku", "ku", "gue", "gw", "kita", "di", "ke", "dari", "untuk", "buat",
+    "yang", "ada", "sih", "dong", "deh", "ya", "yah", "nya", "berapa", "brp",
+    "total", "jumlah", "totalnya", "jumlahnya", "semua", "seluruh", "cek", "lihat",
+    "tampilkan", "tunjukkan", "tolong", "minta", "coba", "apa", "ini", "itu",
+    "sekarang", "saat", "kah", "aja", "saja", "udah", "sudah", "uang", "duit",
+    "rekening", "akun", "dompet", "kategori", "sampai", "hingga", "sd", "s", "d",
+    "antara", "dan", "bulan", "tahun", "tanggal", "tgl", "pada", "selama", "per",
+    "masing", "masing-masing", "tiap", "my", "me", "i", "the", "a", "an", "is",
+    "are", "was", "what", "whats", "s", "how", "much", "many", "did", "do", "in",
+    "on", "for", "of", "this", "that", "all", "show", "check", "tell", "please",
+    "current", "currently", "now", "account", "accounts", "wallet", "category",
+    "categories", "from", "to", "until", "between", "and", "during", "total",
+    "banyak", "besar", "hi", "halo", "hai", "kak", "min", "bro", "mana", "with",
+    "transaksi", "transactions", "money", "pakai", "pake", "via", "lewat", "using",
+}
+
+_interpreter = InputInterpreter()
+
+
+@dataclass
+class QueryPlan:
+    """A recognized aggregate question"""
+
+    kind: str  # one of QUERY_KINDS
+    start: date
+    end: date  # exclusive
+    period: Tuple[str, date]  # (unit, anchor) for labels
+    tx_type: Optional[str] = None  # "income", "expense" or None for both
+    accounts: List[str] = field(default_factory=list)
+    category: Optional[str] = None
+    confidence: float = 0.0
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+(?:-[a-z0-9]+)*", text)
+
+
+def _month_range(year: int, month: int) -> Tuple[date, date]:
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def _natural(term: Optional[str], today: date) -> Optional[date]:
+    if term is None:
+        return today
+    value = parse_natural_date(term)
+    return date.fromisoformat(value) if value else None
+
+
+def _parse_day(text: str, today: date) -> Optional[date]:
+    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", text):
+        try:
+            return date.fromisoformat(text)
+        except ValueError:
+            return None
+    value = parse_natural_date(text)
+    if not value:
+        return None
+    day = date.fromisoformat(value)
+    # parse_natural_date rolls yearless dates forward; questions look back
+    if day > today and not re.search(r"\d{4}$", text):
+        day = day.replace(year=day.year - 1)
+    return day
+
+
+def _find_period(text: str, today: date):
+    """(start, end, (unit, anchor), matched spans) or None if unparseable"""
+    dates = [(m.span(), _parse_day(m.group(1), today)) for m in _DATE_RE.finditer(text)]
+    if dates:
+        if len(dates) > 2 or any(d is None for _, d in dates):
+            return None
+        days = sorted(d for _, d in dates)
+        first, last = days[0], days[-1]
+        unit = "day" if first == last else "range"
+        return first, last + timedelta(days=1), (unit, first), [s for s, _ in dates]
+
+    rel = _RELATIVE_RE.search(text)
+    if rel:
+        unit, term = RELATIVE_PERIODS[rel.group(1)]
+        anchor = _natural(term, today)
+        if anchor is None:
+            return None
+        if unit == "day":
+            start, end = anchor, anchor + timedelta(days=1)
+        elif unit == "week":
+            start = anchor - timedelta(days=anchor.weekday())
+            end = min(start + timedelta(days=7), today + timedelta(days=1))
+        elif unit == "month":
+            start, end = _month_range(anchor.year, anchor.month)
+        else:
+            start, end = date(anchor.year, 1, 1), date(anchor.year + 1, 1, 1)
+        return start, end, (unit, start), [rel.span()]
+
+    month = _MONTH_RE.search(text)
+    if month:
+        month_num = MONTHS[month.group(1)]
+        year = int(month.group(2)) if month.group(2) else today.year
+        if not month.group(2) and month_num > today.month:
+            year -= 1
+        start, end = _month_range(year, month_num)
+        return start, end, ("month", start), [month.span()]
+
+    start, end = _month_range(today.year, today.month)
+    return start, end, ("month", start), []
+
+
+def _find_accounts(words: List[str]) -> Tuple[List[str], set]:
+    """Accounts named in the message (exact alias matches only) and their word indexes"""
+    accounts, used = [], set()
+    for size in (3, 2, 1):
+        for i in range(len(words) - size + 1):
+            idx = set(range(i, i + size))
+            if idx & used:
+                continue
+            result = _interpreter.interpret_account(" ".join(words[i:i + size]))
+            if result.confidence == MatchConfidence.EXACT and result.interpreted_value:
+                if result.interpreted_value not in accounts:
+                    accounts.append(result.interpreted_value)
+                used |= idx
+    return accounts, used
+
+
+def plan_query(message: str, today: date) -> Optional[QueryPlan]:
+    """Recognize a supported aggregate question; None if it is not one"""
+    text = (message or "").lower().strip()
+    if not text or _UNSUPPORTED_RE.search(text):
+        return None
+
+    if _BALANCE_RE.search(text):
+        kind = "balance"
+    elif _TOP_RE.search(text) and (_EXPENSE_RE.search(text) or "kategori" in text
+                                   or "categor" in text):
+        kind = "top_categories"
+    elif _INCOME_RE.search(text) or _EXPENSE_RE.search(text) or _SUMMARY_RE.search(text):
+        kind = "totals"
+    else:
+        kind = None
+
+    period = _find_period(text, today)
+    if period is None:
+        return None
+    start, end, period_key, spans = period
+
+    # Words covered by the period expression are accounted for
+    remaining = text
+    for a, b in sorted(spans, reverse=True):
+        remaining = remaining[:a] + " " + remaining[b:]
+    words = _words(remaining)
+    accounts, used = _find_accounts(words)
+
+    category = None
+    tx_type = None
+    known = 0
+    for i, word in enumerate(words):
+        if i in used or word in FILLER_WORDS:
+            known += 1
+        elif _BALANCE_RE.fullmatch(word) or _TOP_RE.fullmatch(word) or _SUMMARY_RE.fullmatch(word):
+            known += 1
+        elif _INCOME_RE.fullmatch(word):
+            tx_type = "both" if tx_type == "expense" else "income"
+            known += 1
+        elif _EXPENSE_RE.fullmatch(word):
+            tx_type = "both" if tx_type == "income" else "expense"
+            known += 1
+        elif word in CATEGORY_WORDS and category in (None, CATEGORY_WORDS[word]):
+            category = CATEGORY_WORDS[word]
+            known += 1
+
+    if kind is None and category:
+        kind = "totals"  # "belanja bulan ini berapa?"
+    if kind is None:
+        return None
+
+    if kind == "balance" and (category or (spans and end <= today)):
+        return None  # historical or per-category balances are not templated
+    if kind == "top_categories":
+        if category:
+            return None
+        tx_type = "expense"
+    if kind == "totals":
+        if category and tx_type is None:
+            tx_type = "expense" if category in EXPENSE_CATEGORIES else "income"
+        if tx_type == "both" and category:
+            return None
+        if tx_type == "both" or (tx_type is None and _SUMMARY_RE.search(text)):
+            tx_type = None
+        elif tx_type is None:
+            return None
+
+    confidence = known / len(words) if words else 1.0
+    return QueryPlan(
+        kind=kind,
+        start=start,
+        end=end,
+        period=period_key,
+        tx_type=tx_type,
+        accounts=accounts,
+        category=category,
+        confidence=round(confidence, 2),
+    )
+
+
+def _period_label(plan: QueryPlan, lang: str) -> str:
+    unit, anchor = plan.period
+    names = MONTH_NAMES["en" if lang == "en" else "id"]
+    if unit == "month":
+        return f"{names[anchor.month - 1]} {anchor.year}"
+    if unit == "year":
+        return f"{anchor.year}" if lang == "en" else f"tahun {anchor.year}"
+    last = plan.end - timedelta(days=1)
+    if unit == "day" or plan.start == last:
+        return plan.start.isoformat()
+    sep = "to" if lang == "en" else "s/d"
+    return f"{plan.start.isoformat()} {sep} {last.isoformat()}"
+
+
+def _whole_months(plan: QueryPlan) -> bool:
+    return plan.start.day == 1 and plan.end.day == 1
+
+
+def _filters(plan: QueryPlan, rollups: bool):
+    """WHERE clause + params for the plan over rollups or raw transactions"""
+    if rollups:
+        where = ["user_id = ?", "month >= ?", "month < ?"]
+    else:
+        where = ["user_id = ?", "date >= ?", "date < ?"]
+    params = [plan.start.isoformat(), plan.end.isoformat()]
+    if plan.accounts:
+        where.append("account = ANY(?)")
+        params.append(plan.accounts)
+    if plan.category:
+        where.append("category = ?")
+        params.append(plan.category)
+    if plan.tx_type:
+        where.append("type = ?")
+        params.append(plan.tx_type)
+    else:
+        where.append("type IN ('income', 'expense')")
+    return " AND ".join(where), params
+
+
+def _load_totals(user_id: int, plan: QueryPlan) -> Dict[str, Dict[str, float]]:
+    rollups = _whole_months(plan)
+    where, params = _filters(plan, rollups)
+    if rollups:
+        sql = f"""SELECT type, SUM(total_amount) AS total, SUM(tx_count) AS n
+                  FROM transaction_rollups WHERE {where} GROUP BY type"""
+    else:
+        sql = f"""SELECT type, SUM(amount) AS total, COUNT(*) AS n
+                  FROM transactions WHERE {where} GROUP BY type"""
+    rows = get_db().execute(sql, [user_id, *params]).fetchall()
+    return {r["type"]: {"total": float(r["total"] or 0), "n": int(r["n"] or 0)} for r in rows}
+
+
+def _load_top_categories(user_id: int, plan: QueryPlan) -> List[Dict]:
+    rollups = _whole_months(plan)
+    where, params = _filters(plan, rollups)
+    amount = "total_amount" if rollups else "amount"
+    table = "transaction_rollups" if rollups else "transactions"
+    rows = get_db().execute(
+        f"""SELECT category, SUM({amount}) AS total FROM {table}
+            WHERE {where} GROUP BY category ORDER BY total DESC LIMIT ?""",
+        [user_id, *params, TOP_CATEGORIES_LIMIT],
+    ).fetchall()
+    return [{"category": r["category"], "total": float(r["total"] or 0)} for r in rows]
+
+
+def _scope(plan: QueryPlan, lang: str) -> str:
+    parts = []
+    if plan.category:
+        parts.append(f"{'category' if lang == 'en' else 'kategori'} {plan.category}")
+    if plan.accounts:
+        parts.append(f"{'from' if lang == 'en' else 'dari'} {' & '.join(plan.accounts)}")
+    return f" ({', '.join(parts)})" if parts else ""
+
+
+def _answer_balance(user_id: int, plan: QueryPlan, lang: str) -> str:
+    balances = get_account_balances(user_id)
+    by_account = {a["account"]: a["balance"] for a in balances["accounts"]}
+    if plan.accounts:
+        lines = [f"- {acc}: Rp {by_account.get(acc, 0):,.0f}" for acc in plan.accounts]
+        if len(plan.accounts) == 1:
+            acc = plan.accounts[0]
+            if lang == "en":
+                return f"💰 Your {acc} balance is Rp {by_account.get(acc, 0):,.0f}."
+            return f"💰 Saldo {acc} kamu saat ini Rp {by_account.get(acc, 0):,.0f}."
+        header = "💰 Your balances:" if lang == "en" else "💰 Saldo kamu saat ini:"
+        return "\n".join([header, *lines])
+
+    lines = [
+        f"- {a['account']}: Rp {a['balance']:,.0f}"
+        for a in balances["accounts"]
+        if a["balance"]
+    ]
+    total = balances["total_all"]
+    if lang == "en":
+        if not lines:
+            return "💰 You have no recorded balance in any account yet."
+        return "\n".join(["💰 Your balances:", *lines, f"Total: Rp {total:,.0f}"])
+    if not lines:
+        return "💰 Belum ada saldo tercatat di akun mana pun."
+    return "\n".join(["💰 Saldo kamu saat ini:", *lines, f"Total: Rp {total:,.0f}"])
+
+
+def _answer_totals(user_id: int, plan: QueryPlan, lang: str) -> str:
+    totals = _load_totals(user_id, plan)
+    label = _period_label(plan, lang)
+    scope = _scope(plan, lang)
+    income = totals.get("income", {"total": 0.0, "n": 0})
+    expense = totals.get("expense", {"total": 0.0, "n": 0})
+
+    if plan.tx_type is None:
+        net = income["total"] - expense["total"]
+        if lang == "en":
+            return (
+                f"📊 Summary for {label}{scope}:\n"
+                f"- Income: Rp {income['total']:,.0f} ({income['n']} transactions)\n"
+                f"- Expenses: Rp {expense['total']:,.0f} ({expense['n']} transactions)\n"
+                f"- Net: Rp {net:,.0f}"
+            )
+        return (
+            f"📊 Ringkasan {label}{scope}:\n"
+            f"- Pemasukan: Rp {income['total']:,.0f} ({income['n']} transaksi)\n"
+            f"- Pengeluaran: Rp {expense['total']:,.0f} ({expense['n']} transaksi)\n"
+            f"- Selisih: Rp {net:,.0f}"
+        )
+
+    bucket = income if plan.tx_type == "income" else expense
+    if lang == "en":
+        noun = "income" if plan.tx_type == "income" else "expenses"
+        if not bucket["n"]:
+            return f"📊 No {noun} recorded for {label}{scope}."
+        return (
+            f"📊 Total {noun} for {label}{scope}: Rp {bucket['total']:,.0f} "
+            f"({bucket['n']} transactions)."
+        )
+    noun = "pemasukan" if plan.tx_type == "income" else "pengeluaran"
+    if not bucket["n"]:
+        return f"📊 Belum ada {noun} tercatat untuk {label}{scope}."
+    return (
+        f"📊 Total {noun} {label}{scope}: Rp {bucket['total']:,.0f} "
+        f"({bucket['n']} transaksi)."
+    )
+
+
+def _answer_top_categories(user_id: int, plan: QueryPlan, lang: str) -> str:
+    top = _load_top_categories(user_id, plan)
+    label = _period_label(plan, lang)
+    scope = _scope(plan, lang)
+    if not top:
+        if lang == "en":
+            return f"📊 No expenses recorded for {label}{scope}."
+        return f"📊 Belum ada pengeluaran tercatat untuk {label}{scope}."
+    lines = [f"{i}. {t['category']}: Rp {t['total']:,.0f}" for i, t in enumerate(top, 1)]
+    if lang == "en":
+        header = f"📊 Top expense categories for {label}{scope}:"
+    else:
+        header = f"📊 Kategori pengeluaran terbesar {label}{scope}:"
+    return "\n".join([header, *lines])
+
+
+_ANSWERS = {
+    "balance": _answer_balance,
+    "totals": _answer_totals,
+    "top_categories": _answer_top_categories,
+}
+
+
+def answer_query(user_id: int, plan: QueryPlan, lang: str) -> str:
+    """Templated reply for a plan, computed from rollups or raw transactions"""
+    return _ANSWERS[plan.kind](user_id, plan, lang)
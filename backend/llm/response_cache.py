@@ -0,0 +1,230 @@
+"""Response Cache - reuse LLM answers to repeated questions
+
+Users ask the same analytic questions again ("ringkas bulan ini", "kategori
+terbesar apa?") while their data has not changed. Plain-text answers to
+query/general messages are cached per worker under a scope of
+
+    (user_id, data_version, lang, provider, model, period, today)
+
+plus the normalized message. Every transaction write bumps
+users.data_version, so a mutation makes the old entries unreachable; they
+age out of the LRU. With RESPONSE_CACHE_EMBEDDING_MODEL set (and
+sentence-transformers installed) a miss on the exact message falls back to
+the most similar cached message of the same scope above
+RESPONSE_CACHE_SIMILARITY.
+
+Messages that refer to the conversation ("yang tadi", "itu kenapa?") are
+never cached: their answer depends on the dialogue, not only on the data.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    RESPONSE_CACHE_EMBEDDING_MODEL,
+    RESPONSE_CACHE_MAX,
+    RESPONSE_CACHE_SIMILARITY,
+    RESPONSE_CACHE_TTL,
+)
+from core import get_logger
+
+try:
+    from sentence_transformers import SentenceTransformer
+except Exception:
+    SentenceTransformer = None
+
+logger = get_logger(__name__)
+
+MAX_CACHEABLE_CHARS = 300
+
+_CONTEXTUAL_RE = re.compile(
+    r"\b(itu|tadi|tersebut|barusan|lagi|lanjut|lanjutkan|sebelumnya|sebelum|"
+    r"kedua|ketiga|terakhir|yg\s+mana|yang\s+mana|jawabanmu|kamu\s+bilang|it|that|"
+    r"those|these|again|previous|above|earlier|continue|more|you\s+said)\b"
+)
+_FILLER_WORDS = {
+    "tolong", "dong", "donk", "ya", "yah", "sih", "deh", "kak", "min", "bro", "please",
+    "pls", "plz", "coba", "nih", "aja", "saja", "kah",
+}
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase, punctuation-free, filler-free form of a message"""
+    words = re.findall(r"\w+", (message or "").lower())
+    kept = [w for w in words if w not in _FILLER_WORDS]
+    return " ".join(kept or words)
+
+
+def is_cacheable(message: str) -> bool:
+    """Stand-alone questions only: short and not referring to the dialogue"""
+    text = (message or "").lower()
+    return bool(text.strip()) and len(text) <= MAX_CACHEABLE_CHARS and not (
+        _CONTEXTUAL_RE.search(text)
+    )
+
+
+def _dot(a: List[float], b: List[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+class ResponseCache:
+    """Thread-safe LRU + TTL cache of answers, with optional similarity lookup"""
+
+    def __init__(self, maxsize: int, ttl: float, embedder=None, threshold: float = 0.92):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._embedder = embedder
+        self._data = OrderedDict()  # (scope, normalized) -> (stored_at, answer)
+        self._vectors: Dict[Tuple, Dict[str, List[float]]] = {}  # scope -> {normalized: vector}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.embedding_errors = 0
+
+    def _embed(self, text: str) -> Optional[List[float]]:
+        if self._embedder is None:
+            return None
+        try:
+            return [float(x) for x in self._embedder(text)]
+        except Exception as e:
+            with self._lock:
+                self.embedding_errors += 1
+            logger.warning("response_cache_embedding_failed", error=str(e))
+            return None
+
+    def _drop(self, key) -> None:
+        # Caller holds self._lock
+        scope, normalized = key
+        del self._data[key]
+        vectors = self._vectors.get(scope)
+        if vectors is not None:
+            vectors.pop(normalized, None)
+            if not vectors:
+                del self._vectors[scope]
+
+    def _fresh(self, key) -> Optional[str]:
+        # Caller holds self._lock
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= self.ttl:
+            self._drop(key)
+            self.evictions += 1
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def lookup(self, scope: Tuple, message: str) -> Optional[Tuple[str, str]]:
+        """(answer, "exact" | "semantic") or None"""
+        normalized = normalize_message(message)
+        with self._lock:
+            answer = self._fresh((scope, normalized))
+            if answer is not None:
+                self.hits += 1
+                return answer, "exact"
+            candidates = dict(self._vectors.get(scope) or {})
+
+        if candidates:
+            vector = self._embed(normalized)
+            if vector is not None:
+                best, score = max(
+                    ((text, _dot(vector, vec)) for text, vec in candidates.items()),
+                    key=lambda item: item[1],
+                )
+                if score >= self.threshold:
+                    with self._lock:
+                        answer = self._fresh((scope, best))
+                        if answer is not None:
+                            self.hits += 1
+                            self.semantic_hits += 1
+                            return answer, "semantic"
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, scope: Tuple, message: str, answer: str) -> None:
+        normalized = normalize_message(message)
+        vector = self._embed(normalized)
+        key = (scope, normalized)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic(), answer)
+            if vector is not None:
+                self._vectors.setdefault(scope, {})[normalized] = vector
+            self.stores += 1
+            while len(self._data) > self.maxsize:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for key in [k for k in self._data if k[0][0] == user_id]:
+                self._drop(key)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "semantic": self._embedder is not None,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "embedding_errors": self.embedding_errors,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _load_embedder():
+    if not RESPONSE_CACHE_EMBEDDING_MODEL:
+        return None
+    if SentenceTransformer is None:
+        logger.warning(
+            "response_cache_embeddings_unavailable",
+            model=RESPONSE_CACHE_EMBEDDING_MODEL,
+        )
+        return None
+    model = SentenceTransformer(RESPONSE_CACHE_EMBEDDING_MODEL)
+    return lambda text: model.encode(text, normalize_embeddings=True)
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """The worker's response cache (embedding model loaded on first use)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    RESPONSE_CACHE_MAX,
+                    RESPONSE_CACHE_TTL,
+                    embedder=_load_embedder(),
+                    threshold=RESPONSE_CACHE_SIMILARITY,
+                )
+    return _cache
+
+
+def invalidate_cached_responses(user_id: int) -> None:
+    """Drop a user's cached answers (account deleted); no-op before first use"""
+    if _cache is not None:
+        _cache.invalidate_user(user_id)
+
+
+def get_response_cache_stats() -> Dict:
+    return _cache.stats() if _cache else {}
@@ -0,0 +1,167 @@
+"""Result Explainer - templated explanations of executed financial actions
+
+Turns the structured results of execute_action (amounts, categories,
+accounts, dates, goal targets) into a short bilingual explanation, with the
+new balance of every account the actions touched. Replaces the follow-up
+"explain this" completion after tool calls: one cached balance lookup
+instead of a second model round trip.
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from financial_context import get_account_balances
+from database import get_db
+from core import get_logger
+
+logger = get_logger(__name__)
+
+_TYPE_LABELS = {
+    "id": {"income": "Pemasukan", "expense": "Pengeluaran"},
+    "en": {"income": "Income", "expense": "Expense"},
+}
+_FIELD_LABELS = {
+    "id": {"amount": "jumlah", "category": "kategori", "account": "akun",
+           "date": "tanggal", "type": "tipe"},
+    "en": {"amount": "amount", "category": "category", "account": "account",
+           "date": "date", "type": "type"},
+}
+
+
+def _rp(amount: float) -> str:
+    return f"Rp {amount:,.0f}"
+
+
+def _months_until(target: str, today: date) -> Optional[int]:
+    try:
+        end = date.fromisoformat(str(target)[:10])
+    except ValueError:
+        return None
+    months = (end.year - today.year) * 12 + end.month - today.month
+    return max(months, 1) if end > today else None
+
+
+def _explain_transaction(details: Dict[str, Any], lang: str) -> List[str]:
+    # The status line already has type, amount and account
+    what = f" ({details['description']})" if details.get("description") else ""
+    if lang == "en":
+        return [f"📝 Category {details['category']}{what}, dated {details['date']}."]
+    return [f"📝 Kategori {details['category']}{what}, tanggal {details['date']}."]
+
+
+def _explain_update(details: Dict[str, Any], lang: str) -> List[str]:
+    before, after = details["before"], details["after"]
+    labels = _FIELD_LABELS[lang]
+    changes = []
+    for field in ("amount", "category", "account", "date", "type"):
+        old, new = before.get(field), after.get(field)
+        if str(old) == str(new):
+            continue
+        if field == "amount":
+            old, new = _rp(float(old)), _rp(float(new))
+        changes.append(f"{labels[field]} {old} → {new}")
+    if not changes:
+        return []
+    if lang == "en":
+        return [f"Changed: {', '.join(changes)}."]
+    return [f"Yang berubah: {', '.join(changes)}."]
+
+
+def _explain_delete(details: Dict[str, Any], lang: str) -> List[str]:
+    label = _TYPE_LABELS[lang].get(details.get("type"), details.get("type"))
+    if lang == "en":
+        return [
+            f"Removed: {label.lower()} {_rp(details['amount'])} ({details['category']}, "
+            f"{details['date']}) from {details['account']}."
+        ]
+    return [
+        f"Yang dihapus: {label.lower()} {_rp(details['amount'])} ({details['category']}, "
+        f"{details['date']}) dari {details['account']}."
+    ]
+
+
+def _explain_goal(details: Dict[str, Any], lang: str, today: date) -> List[str]:
+    target = float(details["target_amount"])
+    current = float(details.get("current_amount") or 0)
+    pct = min(current / target * 100, 100) if target else 0
+    shown = details.get("target_date_display") or details.get("target_date")
+    lines = [
+        f"Progress: {_rp(current)} of {_rp(target)} ({pct:.0f}%)."
+        if lang == "en"
+        else f"Progres: {_rp(current)} dari {_rp(target)} ({pct:.0f}%)."
+    ]
+    months = _months_until(details.get("target_date"), today)
+    if months and target > current:
+        monthly = (target - current) / months
+        lines.append(
+            f"To reach it by {shown}, set aside about {_rp(monthly)} a month ({months} months)."
+            if lang == "en"
+            else f"Supaya tercapai {shown}, sisihkan sekitar {_rp(monthly)} per bulan ({months} bulan)."
+        )
+    return lines
+
+
+def _touched_accounts(results: List[Dict[str, Any]]) -> List[str]:
+    accounts = []
+    for res in results:
+        details = res.get("details") or {}
+        for part in (details, details.get("before") or {}, details.get("after") or {}):
+            for key in ("account", "from_account", "to_account"):
+                acc = part.get(key)
+                if acc and acc not in accounts:
+                    accounts.append(acc)
+    return accounts
+
+
+def _balance_lines(user_id: int, accounts: List[str], lang: str) -> List[str]:
+    if not accounts:
+        return []
+    try:
+        balances = get_account_balances(user_id)
+    except Exception as e:
+        get_db().rollback()
+        logger.warning("explain_balances_failed", user_id=user_id, error=str(e))
+        return []
+    by_account = {a["account"]: a["balance"] for a in balances["accounts"]}
+    known = [acc for acc in accounts if acc in by_account]
+    if not known:
+        return []
+    parts = ", ".join(f"{acc} {_rp(by_account[acc])}" for acc in known)
+    lines = [f"💰 New balance: {parts}." if lang == "en" else f"💰 Saldo sekarang: {parts}."]
+    negative = [acc for acc in known if by_account[acc] < 0]
+    if negative:
+        lines.append(
+            f"⚠️ {', '.join(negative)} is below zero — check for a missing income or transfer."
+            if lang == "en"
+            else f"⚠️ Saldo {', '.join(negative)} minus — cek apakah ada pemasukan/transfer yang belum dicatat."
+        )
+    return lines
+
+
+def explain_results(
+    user_id: int,
+    results: List[Dict[str, Any]],
+    lang: str,
+    today: Optional[date] = None,
+) -> str:
+    """Explanation of successful execute_action results (empty if nothing to add)"""
+    lang = lang if lang in ("id", "en") else "id"
+    # Deadlines and months left count from the user's (WIB) day
+    today = today or datetime.now(timezone(timedelta(hours=7))).date()
+    lines = []
+    for res in results:
+        details = res.get("details")
+        if not res.get("success") or not details:
+            continue
+        if "before" in details and "after" in details:
+            lines += _explain_update(details, lang)
+        elif "target_amount" in details:
+            lines += _explain_goal(details, lang, today)
+        elif "from_account" in details:
+            continue  # the status line already says from/to/amount
+        elif "type" in details and "transaction_id" in details:
+            lines += _explain_delete(details, lang)
+        elif "type" in details:
+            lines += _explain_transaction(details, lang)
+    lines += _balance_lines(user_id, _touched_accounts(results), lang)
+    return "\n".join(lines)
@@ -0,0 +1,355 @@
+"""LLM Router - circuit breaker, provider failover and hedged requests
+
+call_llm_with_retry retries one provider with 1s/2s/4s sleeps, which keeps a
+gunicorn thread blocked for 15s+ during a provider brownout. route_llm_call
+takes an ordered list of Attempts (requested provider first, then the other
+provider's default model) and:
+
+- skips providers whose circuit breaker is open. LLM_BREAKER_FAILURES
+  consecutive failures open the breaker for LLM_BREAKER_COOLDOWN seconds.
+  After that one probe request is let through (half-open): success closes
+  the breaker, failure re-opens it;
+- retries a provider at most LLM_PROVIDER_RETRIES times with a short delay,
+  then fails over to the next one;
+- with hedging, fires the next provider when the first one has not answered
+  within its observed p95 latency; the first success wins and the loser's
+  result is discarded (its stream is closed);
+- with a request Deadline, gives every call the time left as its timeout
+  and does not start a call or retry that the budget cannot cover
+  (LLM_MIN_CALL_SECONDS).
+
+Only the request itself goes through the router. Tool execution happens
+after the winner is known, so a hedged loser never writes anything.
+Breakers and latency windows are per worker; get_router_stats() feeds
+/api/admin/metrics.
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import (
+    LLM_BREAKER_COOLDOWN,
+    LLM_BREAKER_FAILURES,
+    LLM_HEDGE_DEFAULT_DELAY,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_WORKERS,
+    LLM_MIN_CALL_SECONDS,
+    LLM_PROVIDER_RETRIES,
+    LLM_RETRY_DELAY,
+)
+from core import Deadline, get_logger, incr, latency
+
+logger = get_logger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+@dataclass
+class Attempt:
+    """One provider/model to try; `call(model, timeout)` performs the request.
+
+    `timeout` is None without a deadline (the client's default applies).
+    """
+
+    provider: str
+    model: str
+    call: Callable[[str, Optional[float]], Any]
+    kind: str = "complete"  # "complete" or "stream" (time to open the stream)
+
+    @property
+    def latency_name(self) -> str:
+        return f"llm_{self.provider}_{self.kind}"
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe"""
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("llm_breaker_closed", provider=self.name)
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """Give back an allowed half-open probe that never made a call"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.trips += 1
+                    logger.warning(
+                        "llm_breaker_opened", provider=self.name, failures=self.failures
+                    )
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            open_for = (
+                round(time.monotonic() - self.opened_at, 1) if self.opened_at else None
+            )
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "open_for_seconds": open_for,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = _breakers[provider] = CircuitBreaker(
+                provider, LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN
+            )
+        return breaker
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _breakers_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=LLM_HEDGE_WORKERS, thread_name_prefix="llm-hedge"
+            )
+        return _executor
+
+
+def _is_client_error(e: Exception) -> bool:
+    # 4xx other than timeout/conflict/rate limit: the provider is healthy,
+    # the request is not (bad model id, oversized image, ...)
+    status = getattr(e, "status_code", None) or getattr(e, "code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in (408, 409, 429)
+
+
+def _out_of_time(deadline: Optional[Deadline], needed: float) -> bool:
+    if deadline is None or deadline.covers(needed):
+        return False
+    incr("llm_deadline_skips")
+    return True
+
+
+def _run(
+    attempt: Attempt, deadline: Optional[Deadline] = None
+) -> Optional[Tuple[Attempt, Any]]:
+    """Call one provider with a short retry budget; breaker already consulted.
+
+    The breaker's allow() may have handed out the half-open probe: a call
+    that is never made (the deadline ran out, e.g. while queued in the hedge
+    pool) gives it back, or the provider would stay rejected for good.
+    """
+    breaker = get_breaker(attempt.provider)
+    try:
+        return _attempt_calls(attempt, breaker, deadline)
+    finally:
+        breaker.release_probe()
+
+
+def _attempt_calls(
+    attempt: Attempt, breaker: CircuitBreaker, deadline: Optional[Deadline]
+) -> Optional[Tuple[Attempt, Any]]:
+    delay = LLM_RETRY_DELAY
+    for n in range(LLM_PROVIDER_RETRIES + 1):
+        if _out_of_time(deadline, LLM_MIN_CALL_SECONDS):
+            return None
+        started = time.perf_counter()
+        try:
+            result = attempt.call(
+                attempt.model, deadline.remaining() if deadline else None
+            )
+        except Exception as e:
+            if _is_client_error(e):
+                breaker.record_success()
+                incr(f"llm_{attempt.provider}_client_errors")
+                logger.warning(
+                    "llm_call_rejected",
+                    provider=attempt.provider,
+                    model=attempt.model,
+                    error=str(e),
+                    error_type=type(e).__name__,
+                )
+                return None
+            breaker.record_failure()
+            incr(f"llm_{attempt.provider}_failures")
+            logger.warning(
+                "llm_call_failed",
+                provider=attempt.provider,
+                model=attempt.model,
+                attempt=n + 1,
+                error=str(e),
+                error_type=type(e).__name__,
+            )
+            if n == LLM_PROVIDER_RETRIES or not breaker.allow():
+                return None
+            if _out_of_time(deadline, delay + LLM_MIN_CALL_SECONDS):
+                return None
+            time.sleep(delay)
+            delay *= 2.0
+            continue
+        latency(attempt.latency_name).record((time.perf_counter() - started) * 1000)
+        breaker.record_success()
+        return attempt, result
+    return None
+
+
+def _try(
+    attempt: Attempt, deadline: Optional[Deadline] = None
+) -> Optional[Tuple[Attempt, Any]]:
+    if _out_of_time(deadline, LLM_MIN_CALL_SECONDS):
+        return None
+    if not get_breaker(attempt.provider).allow():
+        incr(f"llm_{attempt.provider}_short_circuited")
+        return None
+    return _run(attempt, deadline)
+
+
+def hedge_delay(attempt: Attempt) -> float:
+    """Seconds to wait for `attempt` before hedging: its p95, floored"""
+    window = latency(attempt.latency_name)
+    p95 = window.percentile(95) if window.count >= LLM_HEDGE_MIN_SAMPLES else None
+    if p95 is None:
+        return LLM_HEDGE_DEFAULT_DELAY
+    return max(p95 / 1000, LLM_HEDGE_MIN_DELAY)
+
+
+def _close(result: Any) -> None:
+    close = getattr(result, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception:
+            pass
+
+
+def _discard(future) -> None:
+    # A hedged loser may still finish later: release its connection
+    def done(f):
+        if not f.cancelled() and f.exception() is None and f.result():
+            _close(f.result()[1])
+
+    future.add_done_callback(done)
+
+
+def _hedged(
+    primary: Attempt, secondary: Attempt, deadline: Optional[Deadline] = None
+) -> Optional[Tuple[Attempt, Any]]:
+    if not get_breaker(primary.provider).allow():
+        incr(f"llm_{primary.provider}_short_circuited")
+        return _try(secondary, deadline)
+
+    first = _pool().submit(_run, primary, deadline)
+    wait_for = hedge_delay(primary)
+    if deadline is not None:
+        wait_for = deadline.timeout(wait_for)
+    try:
+        served = first.result(timeout=wait_for)
+        return served if served else _try(secondary, deadline)
+    except FutureTimeout:
+        pass
+
+    if _out_of_time(deadline, LLM_MIN_CALL_SECONDS) or not get_breaker(
+        secondary.provider
+    ).allow():
+        return first.result()
+    incr("llm_hedges_fired")
+    logger.info("llm_hedge_fired", primary=primary.provider, secondary=secondary.provider)
+    pending = {first, _pool().submit(_run, secondary, deadline)}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for f in done:
+            served = f.result()
+            if served:
+                for loser in pending:
+                    _discard(loser)
+                if served[0] is secondary:
+                    incr("llm_hedges_won")
+                return served
+    return None
+
+
+def route_llm_call(
+    attempts: List[Attempt], hedge: bool = False, deadline: Optional[Deadline] = None
+) -> Optional[Tuple[Attempt, Any]]:
+    """(attempt that answered, its result), or None when every provider failed
+    or the deadline left no time for another call"""
+    served, rest = None, attempts
+    if hedge and len(attempts) > 1:
+        served, rest = _hedged(attempts[0], attempts[1], deadline), attempts[2:]
+    for attempt in rest:
+        if served:
+            break
+        served = _try(attempt, deadline)
+    if served is None:
+        incr("llm_router_exhausted")
+        return None
+    if served[0] is not attempts[0]:
+        incr("llm_failovers")
+        logger.warning(
+            "llm_failover",
+            requested=attempts[0].provider,
+            served=served[0].provider,
+            model=served[0].model,
+        )
+    return served
+
+
+def get_router_stats() -> Dict[str, Any]:
+    """Breaker state and request latency percentiles per provider"""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    result = {}
+    for provider, breaker in breakers.items():
+        result[provider] = {
+            "breaker": breaker.stats(),
+            "latency": {
+                kind: latency(f"llm_{provider}_{kind}").snapshot()
+                for kind in ("complete", "stream")
+            },
+        }
+    return result
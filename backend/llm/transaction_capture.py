@@ -0,0 +1,354 @@
+"""Local Transaction Capture - record simple expenses/incomes without the LLM
+
+Recognizes one-line transaction messages such as:
+- "makan siang 35rb pakai gopay"
+- "catat pengeluaran bensin 50.000 cash kemarin"
+- "terima gaji 8jt ke bca"
+
+capture_transaction() combines extract_amount_from_message, the category
+suggester and InputInterpreter. Every field gets its own confidence; the
+capture is only `complete` when all required fields are unambiguous (one
+amount, one exact account, a keyword category that no other category
+competes with, an explicit or implied date). Anything less is still useful
+to the LLM as a hint, so it is returned with the missing fields listed.
+
+Measured on the labeled corpus in tests/test_transaction_capture_corpus.py.
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from .amount_parser import extract_amount_from_message, parse_amount
+from .category_suggester import CATEGORY_KEYWORDS, get_category_suggestion
+from .input_interpreter import InputInterpreter, MatchConfidence
+from .query_engine import CATEGORY_WORDS, _DATE_RE, _find_accounts, _parse_day, _words
+from .validation_utils import AMOUNT_LIMITS, VALID_CATEGORIES_BY_TYPE
+
+REQUIRED_FIELDS = ("type", "amount", "category", "account", "date")
+
+# Anything that is not a plain "record this" message goes to the LLM
+_REJECT_RE = re.compile(
+    r"\?|\b(berapa|brp|apa|kenapa|gimana|bagaimana|kapan|tidak|nggak|ngga|gak|"
+    r"enggak|bukan|jangan|batal|cancel|hapus|delete|remove|ubah|ganti|edit|update|"
+    r"change|koreksi|transfer|pindah|kirim|tarik|topup|top-up|nabung|tabung|"
+    r"tabungan|target|goal|saldo|balance|total|rekap|hutang|utang|pinjam|pinjaman|"
+    r"minjem|cicil|split|patungan|bagi|besok|lusa|tomorrow|depan|next|rencana|"
+    r"mau|akan|will|budget|anggaran|if|kalau|kalo)\b"
+)
+
+_INCOME_RE = re.compile(
+    r"\b(gaji|gajian|salary|terima|menerima|diterima|dapat|dapet|pemasukan|"
+    r"income|received|receive|earned|dikasih|dibayar|bonus|thr|freelance|refund)\b"
+)
+_EXPENSE_RE = re.compile(
+    r"\b(beli|membeli|bayar|membayar|pengeluaran|expense|jajan|spent|spend|"
+    r"bought|buy|paid|pay|keluar)\b"
+)
+
+# Single-day words resolved against the caller's `today` (WIB), not server time
+_DAY_OFFSETS = {
+    "hari ini": 0, "today": 0, "tadi": 0, "barusan": 0, "sekarang": 0,
+    "kemarin": 1, "yesterday": 1,
+}
+_DAY_RE = re.compile(
+    r"\b(" + "|".join(sorted(_DAY_OFFSETS, key=len, reverse=True)) + r")"
+    r"(?:\s+(pagi|siang|sore|malam))?\b"
+)
+# Date-ish words the capture cannot resolve on its own
+_UNRESOLVED_DATE_RE = re.compile(
+    r"\b(minggu|bulan|tahun|week|month|year|senin|selasa|rabu|kamis|jumat|sabtu|"
+    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday|tanggal|tgl|hari|day|"
+    r"days|lalu|ago)\b"
+)
+
+_AMOUNT_RE = re.compile(
+    r"(?<![\w.,])(?:rp\.?\s*)?\d+(?:[.,]\d+)*(?:\s*(?:rb|ribu|k|jt|juta))?(?!\w)"
+)
+_AMOUNT_WORD_RE = re.compile(
+    r"\b(satu|dua|tiga|empat|lima|enam|tujuh|delapan|sembilan|sepuluh|sebelas|"
+    r"belas|puluh|ratus|ribu|juta|seratus|seribu|sejuta)\b"
+)
+
+# Aliases that also name a merchant ("beli baju di shopee"): only trusted
+# after a payment word
+_MERCHANT_ALIASES = {"shopee"}
+_PAYMENT_WORDS = {"pakai", "pake", "via", "lewat", "dengan", "pakek", "using", "with", "by"}
+
+# Words describing the command rather than the purchase
+_COMMAND_WORDS = {
+    "catat", "catet", "tambah", "tambahkan", "input", "masukkan", "simpan", "record",
+    "add", "log", "tolong", "dong", "ya", "yah", "deh", "sih", "aja", "saja", "pengeluaran",
+    "pemasukan", "expense", "income", "transaksi", "rp", "idr", "sebesar", "seharga",
+    "harga", "ke", "dari", "di", "akun", "rekening", "kategori", "category", "buat",
+    "untuk", "for", "on", "at", "sebanyak", "senilai", "tanggal", "tgl",
+}
+_GENERIC_VERBS = {
+    "beli", "membeli", "bayar", "membayar", "buy", "bought", "pay", "paid", "jajan",
+    "terima", "menerima", "diterima", "dapat", "dapet", "received", "receive", "dikasih",
+}
+
+# category_suggester's keyword groups -> categories the executor accepts
+_SUGGESTED_CATEGORY = {
+    "expense": {
+        "Makanan": "Makan",
+        "Transportasi": "Transport",
+        "Belanja": "Belanja",
+        "Hiburan": "Hiburan",
+        "Kesehatan": "Kesehatan",
+        "Tagihan": "Utilitas",
+        "Pendidikan": "Pendidikan",
+    },
+    "income": {"Gaji": "Gaji", "Investasi": "Investment"},
+}
+_INCOME_CATEGORY_WORDS = {"gajian": "Gaji", "bonus": "Bonus", "thr": "Bonus",
+                          "freelance": "Freelance", "refund": "Refund", "hadiah": "Gift",
+                          "gift": "Gift"}
+_KEYWORD_RES = {
+    group: re.compile(r"\b(" + "|".join(re.escape(k) for k in keywords) + r")\b")
+    for group, keywords in CATEGORY_KEYWORDS.items()
+}
+
+_interpreter = InputInterpreter()
+
+
+@dataclass
+class TransactionCapture:
+    """Fields extracted from a transaction message, with per-field confidence"""
+
+    args: Dict[str, Any] = field(default_factory=dict)
+    confidence: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def missing(self) -> List[str]:
+        return [f for f in REQUIRED_FIELDS if f not in self.args]
+
+    @property
+    def score(self) -> float:
+        """Lowest field confidence; 0.0 while a required field is missing"""
+        if self.missing:
+            return 0.0
+        return min(self.confidence.get(f, 0.0) for f in REQUIRED_FIELDS)
+
+    def is_complete(self, min_confidence: float) -> bool:
+        return not self.missing and self.score >= min_confidence
+
+    def hint(self, lang: str) -> str:
+        """Pre-extracted fields for the LLM prompt (it still has the last word)"""
+        fields = ", ".join(
+            f"{k}={v:.0f}" if k == "amount" else f"{k}={v}"
+            for k, v in self.args.items()
+            if k != "description"
+        )
+        if self.args.get("description"):
+            fields += f", description={self.args['description']}"
+        uncertain = [f for f in self.args if self.confidence.get(f, 1.0) < 1.0]
+        missing = ", ".join(self.missing + uncertain) or "-"
+        if lang == "en":
+            return (
+                f"\n\n[PRE-EXTRACTED] {fields}\nMissing/uncertain: {missing}\n"
+                "Verify these against the user's message before calling add_transaction; "
+                "ask for anything missing."
+            )
+        return (
+            f"\n\n[HASIL EKSTRAKSI] {fields}\nBelum pasti/kurang: {missing}\n"
+            "Cek ulang dengan pesan user sebelum memanggil add_transaction; "
+            "tanyakan field yang kurang."
+        )
+
+
+def _remove_spans(text: str, spans: List[Tuple[int, int]]) -> str:
+    for a, b in sorted(spans, reverse=True):
+        text = text[:a] + " " * (b - a) + text[b:]  # keep offsets stable
+    return text
+
+
+def _find_amount(text: str) -> Tuple[Optional[float], float, List[Tuple[int, int]]]:
+    """(amount, confidence, spans); low confidence when the message is ambiguous"""
+    candidates = list(_AMOUNT_RE.finditer(text))
+    spans = [m.span() for m in candidates]
+    if not candidates:
+        amount = extract_amount_from_message(text)
+        # Amounts in words ("lima puluh ribu") are readable but easy to misread
+        return amount, (0.6 if amount else 0.0), [
+            m.span() for m in _AMOUNT_WORD_RE.finditer(text)
+        ]
+    if len(candidates) > 1:
+        return None, 0.0, spans  # "2 porsi 30rb", "makan 20rb bensin 15rb"
+
+    amount = parse_amount(candidates[0].group(0))
+    if not amount or amount != extract_amount_from_message(text):
+        return amount, 0.3, spans
+    confidence = 1.0
+    if amount < 1000 and not re.search(r"[a-z]", candidates[0].group(0)):
+        confidence = 0.3  # "beli 2" is a quantity, not Rp 2
+    elif amount >= AMOUNT_LIMITS["large_threshold"]:
+        confidence = 0.5  # large amounts go through the LLM's confirmation
+    return amount, confidence, spans
+
+
+def _find_date(text: str, today: date) -> Tuple[Optional[str], float, List[Tuple[int, int]]]:
+    """(ISO date, confidence, spans); an unmentioned date means today"""
+    days = [(m.span(), _parse_day(m.group(1), today)) for m in _DATE_RE.finditer(text)]
+    rel = list(_DAY_RE.finditer(text))
+    spans = [s for s, _ in days] + [m.span() for m in rel]
+    if len(spans) > 1:
+        return None, 0.0, spans
+    if days:
+        day = days[0][1]
+        if day is None or day > today:
+            return None, 0.0, spans
+    elif rel:
+        day = today - timedelta(days=_DAY_OFFSETS[rel[0].group(1)])
+    else:
+        day = today
+    # "sabtu kemarin", "3 hari lalu": more than the resolved words say
+    if _UNRESOLVED_DATE_RE.search(_remove_spans(text, spans)):
+        return None, 0.0, spans
+
+    result = _interpreter.interpret_date(day.isoformat())
+    if result.confidence != MatchConfidence.EXACT or result.needs_confirmation:
+        return None, 0.0, spans
+    return result.interpreted_value, 1.0, spans
+
+
+def _find_account(words: List[str]) -> Tuple[Optional[str], float, set]:
+    accounts, used = _find_accounts(words)
+    if len(accounts) != 1:
+        return None, 0.0, used
+    start = min(used)
+    if words[start] in _MERCHANT_ALIASES and (
+        start == 0 or words[start - 1] not in _PAYMENT_WORDS
+    ):
+        return accounts[0], 0.4, used
+    return accounts[0], 1.0, used
+
+
+def _find_type(text: str) -> Optional[str]:
+    income = bool(_INCOME_RE.search(text))
+    expense = bool(_EXPENSE_RE.search(text))
+    if income and expense:
+        return "both"
+    return "income" if income else "expense" if expense else None
+
+
+def _keyword_categories(words: List[str]) -> Dict[str, set]:
+    """tx_type -> valid categories whose keywords (or names) appear in `words`"""
+    content = " ".join(w for w in words if w not in _GENERIC_VERBS)
+    found = {"expense": set(), "income": set()}
+    for group, pattern in _KEYWORD_RES.items():
+        if pattern.search(content):
+            for tx_type, mapping in _SUGGESTED_CATEGORY.items():
+                if group in mapping:
+                    found[tx_type].add(mapping[group])
+    for word in words:
+        if word in _INCOME_CATEGORY_WORDS:
+            found["income"].add(_INCOME_CATEGORY_WORDS[word])
+        category = CATEGORY_WORDS.get(word)
+        if category:
+            for tx_type, valid in VALID_CATEGORIES_BY_TYPE.items():
+                if category in valid:
+                    found[tx_type].add(category)
+    # "bonus" is its own income category, not a kind of salary
+    if "Bonus" in found["income"] and not {"gaji", "salary", "gajian"} & set(words):
+        found["income"].discard("Gaji")
+    return found
+
+
+def _find_category(
+    words: List[str], tx_type: Optional[str], user_id: Optional[int], db
+) -> Tuple[Optional[str], Optional[str], float]:
+    """(category, tx_type, confidence); tx_type is inferred when not stated"""
+    found = _keyword_categories(words)
+    if tx_type not in ("income", "expense"):
+        if tx_type is None and found["income"] and not found["expense"]:
+            tx_type = "income"
+        elif tx_type is None and found["expense"] and not found["income"]:
+            tx_type = "expense"
+        else:
+            return None, None, 0.0
+    candidates = found[tx_type]
+
+    description = " ".join(w for w in words if w not in _GENERIC_VERBS)
+    suggestion = (
+        get_category_suggestion(description, tx_type, user_id, db)
+        if description
+        else None
+    )
+    suggested = None
+    if suggestion:
+        suggested = _SUGGESTED_CATEGORY[tx_type].get(
+            suggestion["category"], suggestion["category"]
+        )
+        if suggested not in VALID_CATEGORIES_BY_TYPE[tx_type]:
+            suggested = None
+
+    if len(candidates) == 1:
+        category = next(iter(candidates))
+        # The user's own history disagreeing with the keywords is a red flag
+        if suggestion and suggestion["method"] == "history" and suggested != category:
+            return category, tx_type, 0.5
+        return category, tx_type, 1.0
+    if not candidates and suggestion and suggestion["method"] == "history" and suggested:
+        return suggested, tx_type, min(suggestion["confidence"], 1.0)
+    if suggested in candidates:
+        return suggested, tx_type, 0.6
+    return None, tx_type, 0.0
+
+
+def capture_transaction(
+    message: str, today: date, user_id: Optional[int] = None, db=None
+) -> Optional[TransactionCapture]:
+    """Extract add_transaction arguments from a one-line message.
+
+    Returns None when the message does not look like a single transaction
+    (no amount, a question, an edit/transfer/goal request, ...). `db` and
+    `user_id` enable the history-based category suggestion.
+    """
+    text = (message or "").lower().strip()
+    if not text or _REJECT_RE.search(text):
+        return None
+
+    capture = TransactionCapture()
+    date_value, date_conf, date_spans = _find_date(text, today)
+    amount, amount_conf, amount_spans = _find_amount(_remove_spans(text, date_spans))
+    if amount is None and amount_conf == 0.0 and not amount_spans:
+        return None  # nothing to record
+
+    rest = _remove_spans(_remove_spans(text, date_spans), amount_spans)
+    words = _words(rest)
+    account, account_conf, account_idx = _find_account(words)
+    # A payment word right before the account ("pakai gopay") belongs to it
+    for i in list(account_idx):
+        if i > 0 and words[i - 1] in _PAYMENT_WORDS:
+            account_idx.add(i - 1)
+    item_words = [
+        w for i, w in enumerate(words)
+        if i not in account_idx and w not in _COMMAND_WORDS and w not in _PAYMENT_WORDS
+    ]
+
+    tx_type = _find_type(text)
+    category, tx_type, category_conf = _find_category(item_words, tx_type, user_id, db)
+
+    if tx_type:
+        capture.args["type"] = tx_type
+        capture.confidence["type"] = 1.0
+    if amount:
+        capture.args["amount"] = amount
+        capture.confidence["amount"] = amount_conf
+    if category:
+        capture.args["category"] = category
+        capture.confidence["category"] = category_conf
+    if account:
+        capture.args["account"] = account
+        capture.confidence["account"] = account_conf
+    if date_value:
+        capture.args["date"] = date_value
+        capture.confidence["date"] = date_conf
+
+    description = " ".join(w for w in item_words if not w.isdigit())
+    if description:
+        capture.args["description"] = description[:1].upper() + description[1:]
+    return capture
+
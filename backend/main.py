@@ -1,30 +1,42 @@
 """Financial Advisor - Main Application"""
 
+import base64
+import hashlib
+import io
 import json
 import re
 import secrets
 import os
+import time
+from functools import wraps
 from datetime import datetime, date, timedelta, timezone
 
-try:
-    import google.generativeai as genai
-except Exception:
-    genai = None  # Optional: allow running without Google Generative AI
-from flask import Flask, request, jsonify, send_from_directory, g
+from flask import (
+    Flask,
+    Response,
+    request,
+    jsonify,
+    send_from_directory,
+    g,
+    stream_with_context,
+)
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from openai import OpenAI
 import requests as http_requests
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # Import modular components
-from auth import require_login, require_admin
+from auth import (
+    get_session_token,
+    require_admin,
+    require_login,
+    session_token_for_client,
+)
 from config import (
     BASE_DIR,
     FLASK_CONFIG,
-    GOOGLE_API_KEY,
     SMTP_HOST,
     SMTP_PORT,
     SMTP_USER,
@@ -33,20 +45,89 @@ from config import (
     APP_URL,
     RECAPTCHA_SITE_KEY,
     RECAPTCHA_SECRET_KEY,
+    IMPORT_MAX_ROWS,
+    LOCAL_QUERY_ENABLED,
+    LOCAL_QUERY_MIN_CONFIDENCE,
+    LOCAL_CAPTURE_ENABLED,
+    LOCAL_CAPTURE_HINTS,
+    LOCAL_CAPTURE_MIN_CONFIDENCE,
+    CHAT_LLM_EXPLANATION,
+    CHAT_LLM_EXPLANATION_TIMEOUT,
+    RESPONSE_CACHE_ENABLED,
+    DEFAULT_OPENAI_MODEL,
+    DEFAULT_GEMINI_MODEL,
+    LLM_FAILOVER_ENABLED,
+    LLM_HEDGE_ENABLED,
+    LLM_MIN_CALL_SECONDS,
+    LLM_READ_TIMEOUT,
+    GEMINI_TIMEOUT,
+    CHAT_DEADLINE_SECONDS,
+    CHAT_MAX_CONCURRENT,
+    CHAT_QUEUE_MAX,
+    CHAT_QUEUE_PER_USER,
+    CHAT_QUEUE_TIMEOUT,
+    CHAT_DEDUPE_ENABLED,
+    CHAT_DEDUPE_WINDOW,
+)
+from database import (
+    get_db,
+    close_db,
+    init_db,
+    get_pool_stats,
+    PoolTimeoutError,
+    set_request_deadline,
+)
+from financial_context import (
+    get_month_summary,
+    get_account_balances,
+    invalidate_financial_cache,
+    get_financial_cache_stats,
+)
+from data_export import EXPORT_FORMATS, EXPORT_TABLES, stream_export
+from transaction_import import StatementParser, ImportFormatError, import_transactions
+from transaction_rollups import (
+    add_to_rollups,
+    remove_from_rollups,
+    replace_in_rollups,
+    delete_user_rollups,
 )
-from database import get_db, close_db, init_db
-from financial_context import get_month_summary, build_financial_context
 from llm import (
     execute_action,
     TOOLS_DEFINITIONS,
     detect_intent,
     get_system_prompt,
-    call_llm_with_retry,
+    plan_query,
+    answer_query,
+    capture_transaction,
+    explain_results,
+    get_response_cache,
+    get_response_cache_stats,
+    invalidate_cached_responses,
+    is_cacheable,
+    get_openai_client,
+    get_gemini_model,
+    get_provider_stats,
+    provider_available,
+    Attempt,
+    route_llm_call,
+    get_router_stats,
 )
-from memory import build_memory_context, log_message, maybe_update_summary
+from idempotency import claim_key, store_response
+from session_cache import get_session_cache_stats, record_auth_change
+from memory import log_message
+from summary_worker import get_summary_worker_stats, init_summary_worker, schedule_summary
 from routes.memory_routes import memory_bp
-from core import get_logger
-from services import ConversationStateManager
+from core import (
+    get_logger,
+    incr,
+    latency,
+    metrics_snapshot,
+    Deadline,
+    DeadlineExceeded,
+    FairLimiter,
+    SingleFlight,
+)
+from services import ConversationStateManager, assemble_chat_context
 from llm import validate_action_arguments
 
 SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
@@ -132,33 +213,45 @@ def _dedupe_recent_transaction(
     account: str,
     window_seconds: int = 5,
 ):
-    """Prevent accidental double-record within a short window."""
+    """Prevent accidental double-record within a short window.
+
+    Fallback for clients that send no Idempotency-Key. The window is
+    checked by Postgres against created_at's own clock.
+    """
     try:
         row = db.execute(
             """
-            SELECT id, created_at FROM transactions
+            SELECT id FROM transactions
             WHERE user_id = %s AND date = %s AND type = %s AND category = %s AND amount = %s AND account = %s
-            ORDER BY created_at DESC LIMIT 1
+              AND created_at >= CURRENT_TIMESTAMP - make_interval(secs => %s)
+            ORDER BY id DESC LIMIT 1
             """,
-            (user_id, date_str, tx_type, category, amount, account),
+            (user_id, date_str, tx_type, category, amount, account, window_seconds),
         ).fetchone()
-        if not row:
-            return None
-        created_at = row.get("created_at") if isinstance(row, dict) else row[1]
-        if not created_at:
-            return None
-        try:
-            ca = created_at
-            if isinstance(ca, str):
-                ca = datetime.fromisoformat(ca.replace("Z", ""))
-        except Exception:
-            return None
-        delta = datetime.now(timezone(timedelta(hours=7))) - ca
-        if delta.total_seconds() <= window_seconds:
-            return row["id"] if isinstance(row, dict) else row[0]
     except Exception:
         return None
-    return None
+    return row["id"] if row else None
+
+
+def _idempotency_key():
+    """Client-supplied Idempotency-Key header, if any"""
+    key = (request.headers.get("Idempotency-Key") or "").strip()
+    return key or None
+
+
+def _request_fingerprint(data) -> str:
+    """Digest of a write's body: a reused key with another body is rejected"""
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _replayed(replay):
+    """Response for a duplicate write, from claim_key's (status, body)"""
+    status_code, body = replay
+    response = jsonify(body)
+    response.status_code = status_code
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
 
 
 # Initialize Flask app
@@ -172,6 +265,240 @@ app.config.update(FLASK_CONFIG)
 db_sqlalchemy = SQLAlchemy(app)
 migrate = Migrate(app, db_sqlalchemy)
 app.teardown_appcontext(close_db)
+init_summary_worker(app)
+
+
+@app.errorhandler(PoolTimeoutError)
+def handle_pool_timeout(error):
+    """All pooled DB connections are busy - ask the client to retry shortly"""
+    logger.warning("db_pool_exhausted", error=str(error), **get_pool_stats())
+    resp = jsonify(
+        {
+            "success": False,
+            "error": "Layanan sedang sibuk. Silakan coba lagi sebentar.",
+            "code": "SERVICE_UNAVAILABLE",
+        }
+    )
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
+
+
+@app.errorhandler(DeadlineExceeded)
+def handle_deadline_exceeded(error):
+    """A request ran out of its time budget - answer instead of timing out"""
+    incr("deadline_exceeded")
+    logger.warning("request_deadline_exceeded", stage=error.stage, path=request.path)
+    lang = request.values.get("lang") or (request.get_json(silent=True) or {}).get("lang")
+    return jsonify({"answer": _deadline_reply(lang), "degraded": True}), 200
+
+
+# LLM-bound chat requests may hold only part of this worker's threads;
+# the rest always serve balance/transactions and the other fast routes
+chat_limiter = FairLimiter(
+    "chat_admission",
+    CHAT_MAX_CONCURRENT,
+    CHAT_QUEUE_MAX,
+    CHAT_QUEUE_PER_USER,
+    CHAT_QUEUE_TIMEOUT,
+)
+
+
+def _chat_busy_response():
+    retry_after = chat_limiter.retry_after()
+    incr("chat_admission_rejected")
+    logger.warning(
+        "chat_admission_rejected",
+        user_id=g.user["id"],
+        retry_after=retry_after,
+        **chat_limiter.stats(),
+    )
+    resp = jsonify(
+        {
+            "success": False,
+            "error": "AI sedang melayani banyak permintaan. Silakan coba lagi sebentar.",
+            "error_code": "CHAT_BUSY",
+        }
+    )
+    resp.headers["Retry-After"] = str(retry_after)
+    return resp, 429
+
+
+def require_chat_slot(f):
+    """Admit the request through chat_limiter (after require_login); 429 when full"""
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        acquired = chat_limiter.acquire(g.user["id"])
+        if acquired is None:
+            return _chat_busy_response()
+        g.chat_slot = acquired
+        return f(*args, **kwargs)
+
+    return wrapper
+
+
+# Double-clicks and client retries of the same chat message share one reply
+chat_flights = SingleFlight(CHAT_DEDUPE_WINDOW)
+# A duplicate waits for at most the leader's queue wait plus its deadline
+CHAT_DEDUPE_WAIT = CHAT_QUEUE_TIMEOUT + CHAT_DEADLINE_SECONDS + 5
+
+
+def _chat_request_key(user_id):
+    """(single-flight key, idempotency key, previous idempotency key) of this
+    /api/chat request.
+
+    The flight key identifies a duplicate while the first copy is in flight
+    or retained; the idempotency key adds the CHAT_DEDUPE_WINDOW bucket so
+    it is the same string in every worker. A retry landing just past a
+    bucket boundary has a new key, so the key of the previous bucket is
+    returned as well. None for an empty message.
+    """
+    image_bytes = b""
+    if request.content_type and "multipart/form-data" in request.content_type:
+        fields = request.form
+        image = request.files.get("image")
+        if image:
+            image_bytes = image.read()
+            image.seek(0)
+        stream = fields.get("stream") in ("1", "true")
+    else:
+        fields = request.get_json(silent=True) or {}
+        stream = fields.get("stream") in (True, 1, "1", "true")
+    stream = stream or "text/event-stream" in (request.headers.get("Accept") or "")
+    message = (fields.get("message") or "").strip()
+    if not message and not image_bytes:
+        return None
+
+    digest = hashlib.sha256()
+    for part in ("model_provider", "model", "lang", "year", "month"):
+        digest.update(f"{fields.get(part)}\0".encode())
+    digest.update(message.encode() + b"\0" + image_bytes)
+    session_id = fields.get("session_id") or "-"
+    flight_key = (user_id, str(session_id), "sse" if stream else "json", digest.hexdigest())
+    bucket = int(time.time() // CHAT_DEDUPE_WINDOW)
+    base = f"chat:{':'.join(map(str, flight_key))}"
+    return flight_key, f"{base}:{bucket}", f"{base}:{bucket - 1}"
+
+
+_SHARED_CHAT_HEADERS = ("content-type", "cache-control")
+
+
+def _shared_chat_reply(resp, chunks):
+    """What duplicates of this reply get, or None when they should run on their own.
+
+    Only complete successful replies are shared. An error, a busy/overload
+    answer or a reply cut short by the deadline would otherwise be handed to
+    the client's retry for the whole retention window.
+    """
+    if not 200 <= resp.status_code < 300:
+        return None
+    try:
+        if resp.mimetype == "text/event-stream":
+            last = chunks[-1] if chunks else ""
+            if isinstance(last, bytes):
+                last = last.decode()
+            if not last.startswith("event: done\n"):
+                return None
+            final = json.loads(last.split("data: ", 1)[1])
+        else:
+            final = json.loads(b"".join(chunks))
+    except (ValueError, IndexError):
+        return None
+    if isinstance(final, dict) and final.get("degraded"):
+        return None
+    # Only headers about the reply itself: per-client ones (a refreshed session
+    # token, cookies) must not reach another device of the same user
+    headers = [
+        (k, v)
+        for k, v in resp.headers
+        if k.lower() in _SHARED_CHAT_HEADERS or k.lower().startswith("x-chat-")
+    ]
+    return resp.status_code, headers, chunks
+
+
+def _tee_chat_stream(body, flight_key, flight, resp):
+    """Pass the leader's SSE events through, then publish them to duplicates"""
+    events, complete = [], False
+    try:
+        for event in body:
+            events.append(event)
+            yield event
+        complete = True
+    finally:
+        close = getattr(body, "close", None)
+        if close:
+            close()
+        # A stream the client dropped is not shared: duplicates run on their own
+        chat_flights.finish(
+            flight_key, flight, _shared_chat_reply(resp, events) if complete else None
+        )
+
+
+def single_flight_chat(f):
+    """Run identical in-flight /api/chat requests once (after require_login).
+
+    The first request leads; duplicates wait for its reply and get a copy
+    (header X-Chat-Deduplicated) without an LLM call or a second write.
+    """
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        keys = _chat_request_key(g.user["id"]) if CHAT_DEDUPE_ENABLED else None
+        if keys is None:
+            return f(*args, **kwargs)
+        flight_key, g.chat_request_key, g.chat_previous_key = keys
+
+        flight, leader = chat_flights.begin(flight_key)
+        if not leader:
+            # A waiting duplicate holds a thread too: it takes a place in the
+            # chat queue, so duplicates cannot tie up the whole worker
+            if not chat_limiter.hold(g.user["id"]):
+                return _chat_busy_response()
+            try:
+                shared = chat_flights.wait(flight, CHAT_DEDUPE_WAIT)
+            finally:
+                chat_limiter.unhold(g.user["id"])
+            if shared is None:
+                # Leader failed or is stuck: answer this copy normally
+                return f(*args, **kwargs)
+            status, headers, body = shared
+            incr("chat_dedupe_shared")
+            logger.info("chat_duplicate_shared", user_id=g.user["id"], status=status)
+            resp = Response(list(body), status=status, headers=headers)
+            resp.headers["X-Chat-Deduplicated"] = "1"
+            return resp
+
+        try:
+            resp = app.make_response(f(*args, **kwargs))
+        except BaseException:
+            chat_flights.finish(flight_key, flight, None)
+            raise
+        if resp.is_streamed:
+            resp.response = _tee_chat_stream(resp.response, flight_key, flight, resp)
+        else:
+            chat_flights.finish(
+                flight_key, flight, _shared_chat_reply(resp, [resp.get_data()])
+            )
+        return resp
+
+    return wrapper
+
+
+@app.after_request
+def send_refreshed_session_token(response):
+    # A revalidated signed token is replaced; the client keeps the new one
+    token = g.pop("refreshed_session_token", None)
+    if token:
+        response.headers["X-Session-Token-Refresh"] = token
+    return response
+
+
+@app.teardown_request
+def release_chat_slot(exc=None):
+    # Runs after a streamed (SSE) body has finished, not when the view returns
+    acquired = g.pop("chat_slot", None)
+    if acquired is not None:
+        chat_limiter.release(acquired)
 
 # Initialize rate limiter (per IP)
 limiter = Limiter(
@@ -184,9 +511,6 @@ limiter = Limiter(
 # Register blueprints
 app.register_blueprint(memory_bp)
 
-# Initialize LLM clients
-client = OpenAI()
-
 
 # === Health Check Endpoint (for keep-alive monitoring) ===
 @app.route("/health", methods=["GET"])
@@ -202,6 +526,27 @@ def health_check():
     ), 200
 
 
+# === Runtime Metrics (per worker, admin only) ===
+@app.route("/api/admin/metrics", methods=["GET"])
+@require_admin
+def admin_metrics_api():
+    """Runtime statistics of the worker that served this request"""
+    return jsonify(
+        {
+            "db_pool": get_pool_stats(),
+            "caches": get_financial_cache_stats(),
+            "summary_worker": get_summary_worker_stats(),
+            "response_cache": get_response_cache_stats(),
+            "session_cache": get_session_cache_stats(),
+            "llm_providers": get_provider_stats(),
+            "llm_router": get_router_stats(),
+            "chat_admission": chat_limiter.stats(),
+            "chat_dedupe": chat_flights.stats(),
+            "runtime": metrics_snapshot(),
+        }
+    ), 200
+
+
 # === Public Config Endpoint (safe values only) ===
 @app.route("/api/public-config", methods=["GET"])
 def public_config():
@@ -681,15 +1026,6 @@ def parse_financial_intent(raw_text: str, today_str: str):
     }
 
 
-gemini_model = None
-if GOOGLE_API_KEY and genai is not None:
-    try:
-        genai.configure(api_key=GOOGLE_API_KEY)
-        gemini_model = genai.GenerativeModel("gemini-2.5-flash")
-    except Exception as e:
-        print(f"Warning: Gemini configuration failed: {e}")
-
-
 # === STATIC ROUTES ===
 @app.route("/")
 def index():
@@ -886,7 +1222,7 @@ def login_api():
     return jsonify(
         {
             "status": "ok",
-            "token": token,
+            "token": session_token_for_client(token, user, expires_at),
             "remember": remember,
             "user": {
                 "name": user["name"],
@@ -901,11 +1237,10 @@ def login_api():
 @require_login
 def logout_api():
     db = get_db()
-    token = request.headers.get("X-Session-Token") or request.cookies.get(
-        "session_token"
-    )
+    token = get_session_token()
     if token:
         db.execute("DELETE FROM sessions WHERE session_token = %s", (token,))
+        record_auth_change(db, g.user["id"])
         db.commit()
     return jsonify({"status": "ok"}), 200
 
@@ -933,14 +1268,19 @@ def delete_account_api():
         # Delete all user data (cascade will handle related tables if FK constraints exist)
         # Manual deletion for safety
         db.execute("DELETE FROM llm_logs WHERE user_id = %s", (user_id,))
+        db.execute("DELETE FROM llm_log_stats WHERE user_id = %s", (user_id,))
         db.execute("DELETE FROM chat_summaries WHERE user_id = %s", (user_id,))
         db.execute("DELETE FROM chat_log_embeddings WHERE user_id = %s", (user_id,))
         db.execute("DELETE FROM transactions WHERE user_id = %s", (user_id,))
+        delete_user_rollups(db, user_id)
         db.execute("DELETE FROM savings_goals WHERE user_id = %s", (user_id,))
         db.execute("DELETE FROM password_resets WHERE user_id = %s", (user_id,))
         db.execute("DELETE FROM sessions WHERE user_id = %s", (user_id,))
         db.execute("DELETE FROM users WHERE id = %s", (user_id,))
+        record_auth_change(db, user_id)
         db.commit()
+        invalidate_financial_cache(user_id)
+        invalidate_cached_responses(user_id)
 
         return jsonify(
             {"status": "ok", "message": get_message("account_deleted", lang)}
@@ -1108,6 +1448,7 @@ def password_reset_api():
             (password_hash, user_id),
         )
         db.execute("DELETE FROM password_resets WHERE user_id = %s", (user_id,))
+        record_auth_change(db, user_id)
         db.commit()
         return jsonify(
             {"status": "ok", "message": get_message("password_reset_success", lang)}
@@ -1185,6 +1526,7 @@ def update_profile_api():
 
         query = f"UPDATE users SET {', '.join(update_fields)} WHERE id = %s"
         db.execute(query, values)
+        record_auth_change(db, user_id)  # name is part of the cached session user
         db.commit()
 
         cur = db.execute(
@@ -1240,6 +1582,7 @@ def update_password_api():
             "UPDATE users SET password_hash = %s WHERE id = %s",
             (password_hash, user_id),
         )
+        record_auth_change(db, user_id)
         db.commit()
         return jsonify({"status": "ok", "message": "Password berhasil diupdate"}), 200
     except Exception as e:
@@ -1351,6 +1694,7 @@ def admin_user_detail_api(user_id):
                         "UPDATE users SET name = %s, email = %s, role = %s WHERE id = %s",
                         (name, email, role, user_id),
                     )
+            record_auth_change(db, user_id)
             db.commit()
             return jsonify(
                 {"status": "ok", "message": "User updated successfully"}
@@ -1363,9 +1707,14 @@ def admin_user_detail_api(user_id):
         try:
             db.execute("DELETE FROM sessions WHERE user_id = %s", (user_id,))
             db.execute("DELETE FROM transactions WHERE user_id = %s", (user_id,))
+            delete_user_rollups(db, user_id)
             db.execute("DELETE FROM savings_goals WHERE user_id = %s", (user_id,))
+            db.execute("DELETE FROM llm_log_stats WHERE user_id = %s", (user_id,))
             db.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            record_auth_change(db, user_id)
             db.commit()
+            invalidate_financial_cache(user_id)
+            invalidate_cached_responses(user_id)
             return jsonify(
                 {"status": "ok", "message": "User deleted successfully"}
             ), 200
@@ -1375,6 +1724,86 @@ def admin_user_detail_api(user_id):
 
 
 # === TRANSACTION ROUTES ===
+TX_PAGE_DEFAULT = 50
+TX_PAGE_MAX = 500
+TX_SEARCH_MAX = 100  # ranked results are paged by offset, keep pages shallow
+
+
+def _transaction_filters(user_id, args, include_q=True):
+    """WHERE clauses + params for the GET /api/transactions filters"""
+    params = [user_id]
+    where = ["user_id = %s"]
+
+    if args.get("account"):
+        where.append("account = %s")
+        params.append(args.get("account"))
+    if args.get("start_date"):
+        where.append("date >= %s")
+        params.append(args.get("start_date"))
+    if args.get("end_date"):
+        where.append("date <= %s")
+        params.append(args.get("end_date"))
+    if args.get("type"):
+        where.append("type = %s")
+        params.append(args.get("type"))
+    if args.get("category"):
+        where.append("category = %s")
+        params.append(args.get("category"))
+    if include_q and args.get("q"):
+        # Case-insensitive; served by the full-text and trigram GIN indexes
+        where.append(
+            "(search_vector @@ plainto_tsquery('simple', %s) OR description ILIKE %s)"
+        )
+        params.extend([args.get("q"), f"%{args.get('q')}%"])
+    return where, params
+
+
+def _transaction_row(r):
+    return {
+        "id": r["id"],
+        "date": r["date"],
+        "type": r["type"],
+        "category": r["category"],
+        "description": r["description"],
+        "amount": r["amount"],
+        "account": r["account"],
+        "created_at": r["created_at"],
+    }
+
+
+def _encode_tx_cursor(row):
+    """Opaque keyset cursor pointing at (date, id) of the last returned row"""
+    raw = json.dumps([str(row["date"]), row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_tx_cursor(value):
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+        tx_date, tx_id = json.loads(raw)
+        return [date.fromisoformat(tx_date), int(tx_id)]
+    except Exception:
+        return None
+
+
+def _stream_transactions(db, sql, params, jsonl):
+    """Yield transactions from a server-side cursor as JSON-lines or a JSON array"""
+    cur = db.stream(sql, params)
+    try:
+        if not jsonl:
+            yield "["
+        for i, r in enumerate(cur):
+            row = app.json.dumps(_transaction_row(r))
+            if jsonl:
+                yield row + "\n"
+            else:
+                yield ("," if i else "") + row
+        if not jsonl:
+            yield "]"
+    finally:
+        cur.close()
+
+
 @app.route("/api/transactions", methods=["GET", "POST"])
 @require_login
 def transactions_api():
@@ -1447,10 +1876,13 @@ def transactions_api():
                 }
             ), 400
 
-        # De-dupe guard for rapid duplicate submissions
-        dup_id = _dedupe_recent_transaction(
-            db, user_id, date_str, tx_type, category, amount, account
-        )
+        # De-dupe guard for rapid duplicate submissions without a key
+        idem_key = _idempotency_key()
+        dup_id = None
+        if not idem_key:
+            dup_id = _dedupe_recent_transaction(
+                db, user_id, date_str, tx_type, category, amount, account
+            )
         if dup_id:
             logger.info(
                 "transaction_dedup_hit",
@@ -1465,12 +1897,33 @@ def transactions_api():
             return jsonify({"status": "ok", "duplicate": True, "id": dup_id}), 200
 
         try:
+            if idem_key:
+                replay = claim_key(
+                    db, user_id, idem_key, "transactions", _request_fingerprint(data)
+                )
+                if replay:
+                    db.rollback()
+                    return _replayed(replay)
             db.execute(
                 """INSERT INTO transactions (user_id, date, type, category, description, amount, account)
                 VALUES (%s, %s, %s, %s, %s, %s, %s)""",
                 (user_id, date_str, tx_type, category, description, amount, account),
             )
+            add_to_rollups(
+                db,
+                user_id,
+                {
+                    "date": date_str,
+                    "type": tx_type,
+                    "category": category,
+                    "amount": amount,
+                    "account": account,
+                },
+            )
+            if idem_key:
+                store_response(db, user_id, idem_key, 200, {"status": "ok"})
             db.commit()
+            invalidate_financial_cache(user_id)
             logger.info(
                 "transaction_recorded",
                 user_id=user_id,
@@ -1495,46 +1948,187 @@ def transactions_api():
             return jsonify({"error": f"Transaksi gagal: {str(e)}"}), 500
 
     # GET with filters
-    params = [user_id]
-    where = ["user_id = %s"]
+    where, params = _transaction_filters(user_id, request.args)
 
-    if request.args.get("account"):
-        where.append("account = %s")
-        params.append(request.args.get("account"))
-    if request.args.get("start_date"):
-        where.append("date >= %s")
-        params.append(request.args.get("start_date"))
-    if request.args.get("end_date"):
-        where.append("date <= %s")
-        params.append(request.args.get("end_date"))
-    if request.args.get("type"):
-        where.append("type = %s")
-        params.append(request.args.get("type"))
-    if request.args.get("category"):
-        where.append("category = %s")
-        params.append(request.args.get("category"))
-    if request.args.get("q"):
-        where.append("description LIKE %s")
-        params.append(f"%{request.args.get('q')}%")
+    after = None
+    if request.args.get("cursor"):
+        after = _decode_tx_cursor(request.args.get("cursor"))
+        if after is None:
+            return jsonify({"error": "cursor tidak valid"}), 400
+        where.append("(date, id) < (%s, %s)")
+        params.extend(after)
 
     sql = f"""SELECT id, date, type, category, description, amount, account, created_at
         FROM transactions WHERE {" AND ".join(where)} ORDER BY date DESC, id DESC"""
 
-    cur = db.execute(sql, params)
-    rows = [
-        {
-            "id": r["id"],
-            "date": r["date"],
-            "type": r["type"],
-            "category": r["category"],
-            "description": r["description"],
-            "amount": r["amount"],
-            "account": r["account"],
-            "created_at": r["created_at"],
-        }
-        for r in cur.fetchall()
+    # JSON-lines straight from a server-side cursor (flat worker memory)
+    if request.args.get("stream") in ("1", "true", "jsonl"):
+        return Response(
+            stream_with_context(_stream_transactions(db, sql, params, jsonl=True)),
+            mimetype="application/x-ndjson",
+        )
+
+    # Keyset page: {"transactions": [...], "next_cursor": "..."}
+    if request.args.get("limit") or after is not None:
+        try:
+            limit = int(request.args.get("limit") or TX_PAGE_DEFAULT)
+        except ValueError:
+            return jsonify({"error": "limit harus berupa angka"}), 400
+        limit = max(1, min(limit, TX_PAGE_MAX))
+
+        cur = db.execute(sql + " LIMIT %s", params + [limit + 1])
+        rows = [_transaction_row(r) for r in cur.fetchall()]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_tx_cursor(rows[-1])
+        return jsonify({"transactions": rows, "next_cursor": next_cursor})
+
+    # Legacy full list (JSON array), streamed instead of materialized
+    return Response(
+        stream_with_context(_stream_transactions(db, sql, params, jsonl=False)),
+        mimetype="application/json",
+    )
+
+
+@app.route("/api/transactions/search", methods=["GET"])
+@require_login
+def transactions_search_api():
+    """Ranked search over descriptions: full-text first, trigram for typos"""
+    db = get_db()
+    user_id = g.user["id"]
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"error": "q wajib diisi"}), 400
+    try:
+        limit = int(request.args.get("limit") or TX_PAGE_DEFAULT)
+        offset = int(request.args.get("offset") or 0)
+    except ValueError:
+        return jsonify({"error": "limit/offset harus berupa angka"}), 400
+    limit = max(1, min(limit, TX_SEARCH_MAX))
+    offset = max(0, offset)
+
+    where, params = _transaction_filters(user_id, request.args, include_q=False)
+    sql = f"""SELECT id, date, type, category, description, amount, account, created_at,
+            ts_rank(search_vector, query) * 2
+              + word_similarity(%s, coalesce(description, '')) AS score
+        FROM transactions, plainto_tsquery('simple', %s) AS query
+        WHERE {" AND ".join(where)}
+          AND (search_vector @@ query OR description ILIKE %s OR %s <%% description)
+        ORDER BY score DESC, date DESC, id DESC
+        LIMIT %s OFFSET %s"""
+    cur = db.execute(
+        sql, [q, q] + params + [f"%{q}%", q, limit + 1, offset]
+    )
+
+    rows = []
+    for r in cur.fetchall():
+        row = _transaction_row(r)
+        row["score"] = round(float(r["score"] or 0), 4)
+        rows.append(row)
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_offset = offset + limit
+    return jsonify({"transactions": rows, "next_offset": next_offset})
+
+
+@app.route("/api/transactions/import", methods=["POST"])
+@require_login
+@limiter.limit("30 per hour")
+def transactions_import_api():
+    """Bulk import from CSV / bank statement (multipart field `file` or text/csv body).
+
+    Optional params: account (default account for statements without an
+    account column), year (for BCA "DD/MM" dates), encoding (default utf-8).
+    """
+    db = get_db()
+    user_id = g.user["id"]
+    params = request.form if request.files else request.args
+
+    upload = request.files.get("file")
+    raw_stream = upload.stream if upload else request.stream
+    try:
+        default_year = int(params.get("year")) if params.get("year") else None
+    except ValueError:
+        return jsonify({"error": "year harus berupa angka"}), 400
+
+    text_stream = io.TextIOWrapper(
+        raw_stream,
+        encoding=params.get("encoding") or "utf-8-sig",
+        errors="replace",
+        newline="",
+    )
+    parser = StatementParser(
+        text_stream,
+        default_account=params.get("account"),
+        default_year=default_year,
+        max_rows=IMPORT_MAX_ROWS,
+    )
+
+    try:
+        result = import_transactions(db, user_id, parser)
+        db.commit()
+    except ImportFormatError as e:
+        db.rollback()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.rollback()
+        logger.error("transaction_import_failed", exc=e, user_id=user_id)
+        return jsonify({"error": f"Import gagal: {str(e)}"}), 500
+
+    invalidate_financial_cache(user_id)
+    logger.info(
+        "transactions_imported",
+        user_id=user_id,
+        format=result["format"],
+        rows=result["rows"],
+        imported=result["imported"],
+        duplicates=result["duplicates"],
+        failed=result["failed"],
+    )
+    return jsonify({"status": "ok", **result})
+
+
+@app.route("/api/export", methods=["GET"])
+@require_login
+@limiter.limit("10 per hour")
+def export_api():
+    """Stream the user's data: ?format=csv|jsonl|zip&tables=transactions,llm_logs
+
+    csv exports a single table; zip bundles one file per table (?inner=csv|jsonl).
+    """
+    db = get_db()
+    user_id = g.user["id"]
+    fmt = (request.args.get("format") or "zip").lower()
+    inner = (request.args.get("inner") or "csv").lower()
+    tables = [
+        t.strip()
+        for t in (request.args.get("tables") or ",".join(EXPORT_TABLES)).split(",")
+        if t.strip()
     ]
-    return jsonify(rows)
+
+    if fmt not in EXPORT_FORMATS or inner not in ("csv", "jsonl"):
+        return jsonify({"error": "format harus csv, jsonl, atau zip"}), 400
+    unknown = [t for t in tables if t not in EXPORT_TABLES]
+    if unknown or not tables:
+        return jsonify(
+            {"error": f"Tabel tidak dikenal: {', '.join(unknown) or '-'}"}
+        ), 400
+    if fmt == "csv" and len(tables) != 1:
+        return jsonify(
+            {"error": "Format csv hanya untuk satu tabel, gunakan zip untuk beberapa"}
+        ), 400
+
+    mimetype, ext = EXPORT_FORMATS[fmt]
+    name = tables[0] if fmt == "csv" else "smartbudget-export"
+    filename = f"{name}-{_wib_today_iso()}.{ext}"
+    logger.info("export_started", user_id=user_id, format=fmt, tables=tables)
+    return Response(
+        stream_with_context(stream_export(db, user_id, tables, fmt, inner)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 @app.route("/api/transactions/<int:tx_id>", methods=["PUT", "DELETE"])
@@ -1543,10 +2137,14 @@ def transaction_detail_api(tx_id):
     db = get_db()
     user_id = g.user["id"]
 
+    # Lock the row so the rollup delta is computed from the values we replace
     cur = db.execute(
-        "SELECT id FROM transactions WHERE id = %s AND user_id = %s", (tx_id, user_id)
+        """SELECT id, date, type, category, amount, account FROM transactions
+        WHERE id = %s AND user_id = %s FOR UPDATE""",
+        (tx_id, user_id),
     )
-    if not cur.fetchone():
+    old_row = cur.fetchone()
+    if not old_row:
         return jsonify({"error": "Transaksi tidak ditemukan"}), 404
 
     if request.method == "PUT":
@@ -1570,14 +2168,29 @@ def transaction_detail_api(tx_id):
             WHERE id = %s AND user_id = %s""",
             (date_str, tx_type, category, description, amount, account, tx_id, user_id),
         )
+        replace_in_rollups(
+            db,
+            user_id,
+            old_row,
+            {
+                "date": date_str,
+                "type": tx_type,
+                "category": category,
+                "amount": amount,
+                "account": account,
+            },
+        )
         db.commit()
+        invalidate_financial_cache(user_id)
         return jsonify({"status": "ok", "message": "Transaksi berhasil diupdate"})
 
     elif request.method == "DELETE":
         db.execute(
             "DELETE FROM transactions WHERE id = %s AND user_id = %s", (tx_id, user_id)
         )
+        remove_from_rollups(db, user_id, old_row)
         db.commit()
+        invalidate_financial_cache(user_id)
         return jsonify({"status": "ok", "message": "Transaksi berhasil dihapus"})
 
 
@@ -1606,10 +2219,10 @@ def balance_api():
         params.append(account_filter)
 
     cur = db.execute(
-        f"""SELECT SUM(CASE WHEN type = 'income' THEN amount
-                           WHEN type = 'expense' THEN -amount
+        f"""SELECT SUM(CASE WHEN type = 'income' THEN total_amount
+                           WHEN type = 'expense' THEN -total_amount
                            ELSE 0 END) AS balance
-        FROM transactions WHERE {where_clause}""",
+        FROM transaction_rollups WHERE {where_clause}""",
         params,
     )
     row = cur.fetchone()
@@ -1629,46 +2242,7 @@ def balance_api():
 @require_login
 def accounts_api():
     user_id = g.user["id"]
-    db = get_db()
-    accounts_list = [
-        "Cash",
-        "BCA",
-        "Maybank",
-        "Seabank",
-        "Shopeepay",
-        "Gopay",
-        "Jago",
-        "ISaku",
-        "Ovo",
-        "Superbank",
-        "Blu Account (Saving)",
-    ]
-
-    accounts = []
-    total_all = 0.0
-    for acc in accounts_list:
-        cur = db.execute(
-            """SELECT SUM(CASE WHEN type = 'income' THEN amount
-                               WHEN type = 'expense' THEN -amount
-                               ELSE amount END) AS balance
-            FROM transactions WHERE user_id = %s AND account = %s""",
-            (user_id, acc),
-        )
-        row = cur.fetchone()
-
-        def _num(v):
-            if v is None:
-                return 0
-            try:
-                return float(v)
-            except Exception:
-                return 0
-
-        balance = _num(row["balance"] if row else None)
-        accounts.append({"account": acc, "balance": balance})
-        total_all += balance
-
-    return jsonify({"accounts": accounts, "total_all": total_all})
+    return jsonify(get_account_balances(user_id))
 
 
 @app.route("/api/transfer", methods=["POST"])
@@ -1732,7 +2306,15 @@ def transfer_api():
             }
         ), 400
 
+    idem_key = _idempotency_key()
     try:
+        if idem_key:
+            replay = claim_key(
+                db, user_id, idem_key, "transfer", _request_fingerprint(data)
+            )
+            if replay:
+                db.rollback()
+                return _replayed(replay)
         db.execute(
             """INSERT INTO transactions (user_id, date, type, category, description, amount, account)
             VALUES (%s, %s, %s, %s, %s, %s, %s)""",
@@ -1759,7 +2341,29 @@ def transfer_api():
                 to_account,
             ),
         )
+        for account, category, delta in (
+            (from_account, f"Ke {to_account}", -amount),
+            (to_account, f"Dari {from_account}", amount),
+        ):
+            add_to_rollups(
+                db,
+                user_id,
+                {
+                    "date": date_str,
+                    "type": "transfer",
+                    "category": category,
+                    "amount": delta,
+                    "account": account,
+                },
+            )
+        body = {
+            "status": "ok",
+            "message": f"Transfer {amount} dari {from_account} ke {to_account} berhasil",
+        }
+        if idem_key:
+            store_response(db, user_id, idem_key, 200, body)
         db.commit()
+        invalidate_financial_cache(user_id)
         logger.info(
             "transfer_recorded",
             user_id=user_id,
@@ -1768,12 +2372,7 @@ def transfer_api():
             to_account=to_account,
             date=date_str,
         )
-        return jsonify(
-            {
-                "status": "ok",
-                "message": f"Transfer {amount} dari {from_account} ke {to_account} berhasil",
-            }
-        )
+        return jsonify(body)
     except Exception as e:
         db.rollback()
         logger.error(
@@ -1960,8 +2559,16 @@ def transfer_to_savings_api():
             }
         ), 400
 
+    idem_key = _idempotency_key()
     try:
         db.execute("BEGIN")
+        if idem_key:
+            replay = claim_key(
+                db, user_id, idem_key, "transfer_to_savings", _request_fingerprint(data)
+            )
+            if replay:
+                db.rollback()
+                return _replayed(replay)
 
         goal_cur = db.execute(
             "SELECT name, current_amount FROM savings_goals WHERE id = %s AND user_id = %s",
@@ -1969,6 +2576,7 @@ def transfer_to_savings_api():
         )
         goal = goal_cur.fetchone()
         if not goal:
+            db.rollback()
             return jsonify({"error": "Target tabungan tidak ditemukan"}), 404
 
         db.execute(
@@ -1984,6 +2592,17 @@ def transfer_to_savings_api():
                 from_account,
             ),
         )
+        add_to_rollups(
+            db,
+            user_id,
+            {
+                "date": date_str,
+                "type": "expense",
+                "category": "Tabungan",
+                "amount": amount,
+                "account": from_account,
+            },
+        )
 
         new_amount = float(goal["current_amount"]) + float(amount)
         db.execute(
@@ -1991,61 +2610,810 @@ def transfer_to_savings_api():
             (new_amount, goal_id),
         )
 
+        body = {"status": "ok", "message": "Dana berhasil ditransfer ke tabungan."}
+        if idem_key:
+            store_response(db, user_id, idem_key, 200, body)
         db.commit()
-        return jsonify(
-            {"status": "ok", "message": "Dana berhasil ditransfer ke tabungan."}
-        )
+        invalidate_financial_cache(user_id)
+        return jsonify(body)
     except Exception as e:
         db.rollback()
         return jsonify({"error": f"Transfer ke tabungan gagal: {str(e)}"}), 500
 
 
-# === LLM CHAT ROUTE ===
-@app.route("/api/chat", methods=["POST"])
-@require_login
-@limiter.limit("20 per hour")  # 20 messages per hour per IP
-def chat_api():
-    user_id = g.user["id"]
-    # Use WIB date for prompts
-    today = datetime.now(timezone(timedelta(hours=7))).date()
+# === LLM CHAT HELPERS ===
+CLARIFICATION_TYPES = [
+    "need_category",
+    "need_type",
+    "need_amount",
+    "need_account",
+    "need_name",
+    "need_goal",
+    "need_date",
+    "no_updates",
+]
+
+# Map LLM tool names to conversation state machine intents
+TOOL_INTENT_MAP = {
+    "add_transaction": "add_transaction",
+    "edit_transaction": "edit_transaction",
+    "delete_transaction": "delete_transaction",
+    "transfer_funds": "transfer",
+    "create_savings_goal": "create_goal",
+}
 
-    # Handle both JSON and multipart form data (for image uploads)
-    image_file = None
-    image_data = None
-    data = {}  # Initialize data dict for both cases
+# Tool parameters copied into the conversation state after a successful call
+STATE_FIELDS = (
+    "amount",
+    "category",
+    "account",
+    "from_account",
+    "to_account",
+    "field_name",
+    "new_value",
+    "transaction_id",
+    "password",
+    "name",
+    "target_amount",
+    "deadline",
+    "confirm",
+)
 
-    if request.content_type and "multipart/form-data" in request.content_type:
-        # Image upload
-        user_message = (request.form.get("message") or "").strip()
-        lang = request.form.get("lang", "id")
-        provider = request.form.get("model_provider", "google")
-        model_id = request.form.get("model") or None
+GEMINI_ACTION_HINT = """Jika perlu lakukan aksi kembalikan JSON dalam blok ```json``` dengan field 'action' dan 'data'.
 
-        # Get session_id from form if present
-        session_id_str = request.form.get("session_id")
-        if session_id_str:
-            try:
-                data["session_id"] = int(session_id_str)
-            except (ValueError, TypeError):
-                data["session_id"] = None
+ATURAN KRITIS - WAJIB DIIKUTI:
+1. PEMASUKAN (income/record_income):
+   - 'amount' WAJIB
+   - 'category' WAJIB dan harus spesifik (Gaji, Bonus, Penjualan, Investasi - BUKAN "Lainnya")
+   - Jika kategori tidak disebutkan, TANYA DULU jangan langsung catat
 
-        if "image" in request.files:
-            image_file = request.files["image"]
-            if image_file and image_file.filename:
-                # Read image data
-                import base64
+2. PENGELUARAN (expense/record_expense):
+   - 'amount' WAJIB
+   - 'category' WAJIB (Makan, Transport, Belanja, dll.)
+   - Jika tidak jelas, TANYA DULU
 
-                image_bytes = image_file.read()
-                image_data = base64.b64encode(image_bytes).decode("utf-8")
-                # Reset file pointer if needed
-                image_file.seek(0)
-    else:
-        # Regular JSON request
-        data = request.get_json() or {}
+3. TRANSFER (transfer_funds):
+   - 'amount' WAJIB
+   - 'from_account' WAJIB (akun sumber)
+   - 'to_account' WAJIB (akun tujuan)
+   - Jika ada yang kurang, TANYA DULU
+
+4. TARGET TABUNGAN (create_savings_goal):
+   - 'name' WAJIB (nama target)
+   - 'target_amount' WAJIB (jumlah target)
+   - Jika ada yang kurang, TANYA DULU
+
+5. TRANSFER KE TABUNGAN (transfer_to_savings):
+   - 'amount' WAJIB
+   - 'from_account' WAJIB
+   - 'goal_id' WAJIB (ID target tabungan)
+   - Jika ada yang kurang, TANYA DULU
+
+PRINSIP: JANGAN mencatat apapun ke database jika informasi tidak lengkap. TANYA dulu untuk klarifikasi.
+
+Action tersedia:
+- add_transaction / record_expense / record_income
+- update_transaction (wajib: id)
+- delete_transaction (wajib: id)
+- transfer_funds
+- create_savings_goal
+- update_savings_goal (wajib: id)
+- transfer_to_savings"""
+
+# Appended to every Gemini prompt; built once instead of per request
+GEMINI_PROMPT_SUFFIX = "\n\n" + GEMINI_ACTION_HINT
+
+_GEMINI_JSON_RE = re.compile(r"```json\s*(.*?)\s*```", re.DOTALL)
+
+
+def _connection_error_reply(lang):
+    return (
+        "Maaf, sedang ada gangguan koneksi ke AI. Coba lagi sebentar ya!"
+        if lang == "id"
+        else "Sorry, there's a connection issue with AI. Please try again in a moment!"
+    )
+
+
+def _deadline_reply(lang):
+    return (
+        "Sorry, this is taking longer than usual. Please try again in a moment!"
+        if lang == "en"
+        else "Maaf, permintaan ini butuh waktu lebih lama dari biasanya. Coba lagi sebentar ya!"
+    )
+
+
+def _explain_prompt(lang):
+    return (
+        "Jelaskan hasil aksi finansial ini dengan singkat (maks 5 kalimat) dan friendly. Jangan sertakan simbol status (✓/✗)."
+        if lang != "en"
+        else "Explain the results of this financial action concisely (max 5 sentences) in a friendly way. Do not include status symbols (✓/✗)."
+    )
+
+
+def _explained_reply(user_id, answer, results, lang, today):
+    """Status lines plus the templated explanation of successful results"""
+    explanation = explain_results(user_id, results, lang, today)
+    return answer + "\n\n" + explanation if explanation else answer
+
+
+def _llm_explanation(model_id, base_prompt, answer, lang, deadline):
+    """Opt-in model-written extra after the templated reply; yields text pieces.
+
+    Bounded by CHAT_LLM_EXPLANATION_TIMEOUT and the request deadline, and
+    never retried: the reply is already complete without it.
+    """
+    if not deadline.covers(LLM_MIN_CALL_SECONDS):
+        incr("llm_deadline_skips")
+        return
+    started = time.perf_counter()
+    try:
+        stream = get_openai_client().chat.completions.create(
+            model=model_id,
+            messages=[
+                {"role": "system", "content": base_prompt},
+                {"role": "user", "content": f"{_explain_prompt(lang)}\n\n{answer}"},
+            ],
+            stream=True,
+            timeout=deadline.timeout(CHAT_LLM_EXPLANATION_TIMEOUT),
+        )
+        for chunk in stream:
+            if deadline.expired():
+                stream.close()
+                break
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        incr("chat_llm_explanation_errors")
+        logger.warning("llm_explanation_failed", model=model_id, error=str(e))
+    finally:
+        latency("chat_llm_explanation").record((time.perf_counter() - started) * 1000)
+
+
+def _openai_user_content(user_prompt, image_data):
+    if not image_data:
+        return user_prompt
+    return [
+        {"type": "text", "text": user_prompt},
+        {
+            "type": "image_url",
+            "image_url": {"url": f"data:image/jpeg;base64,{image_data}"},
+        },
+    ]
+
+
+def _gemini_content(prompt, image_data):
+    if not image_data:
+        return prompt
+    import PIL.Image
+
+    # Decode base64 image for Gemini vision
+    image = PIL.Image.open(io.BytesIO(base64.b64decode(image_data)))
+    return [prompt, image]
+
+
+def _llm_request(
+    provider, model_id, base_prompt, user_prompt, image_data, stream, deadline
+):
+    """Chat completion through the LLM router: the requested provider first,
+    then the other provider's default model, each call bounded by the time
+    left in `deadline`.
+
+    Returns (provider, model_id, response) of whichever provider answered,
+    or None when every provider failed or the budget ran out.
+    """
+
+    def openai_call(model, timeout):
+        return get_openai_client().chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": base_prompt},
+                {"role": "user", "content": _openai_user_content(user_prompt, image_data)},
+            ],
+            tools=TOOLS_DEFINITIONS,
+            tool_choice="auto",
+            stream=stream,
+            timeout=min(timeout or LLM_READ_TIMEOUT, LLM_READ_TIMEOUT),
+        )
+
+    def gemini_call(model, timeout):
+        return get_gemini_model(model).generate_content(
+            gemini_content,
+            request_options={"timeout": min(timeout or GEMINI_TIMEOUT, GEMINI_TIMEOUT)},
+            stream=stream,
+        )
+
+    kind = "stream" if stream else "complete"
+    calls = {
+        "openai": (openai_call, DEFAULT_OPENAI_MODEL),
+        "google": (gemini_call, DEFAULT_GEMINI_MODEL),
+    }
+    attempts = [Attempt(provider, model_id, calls[provider][0], kind)]
+    if LLM_FAILOVER_ENABLED:
+        for other, (call, default_model) in calls.items():
+            if other != provider and provider_available(other):
+                attempts.append(Attempt(other, default_model, call, kind))
+
+    gemini_content = None
+    if any(a.provider == "google" for a in attempts):
+        # Decoded up front: a bad image is not a provider failure
+        gemini_content = _gemini_content(
+            f"{base_prompt}\n\n{user_prompt}{GEMINI_PROMPT_SUFFIX}", image_data
+        )
+
+    served = route_llm_call(attempts, hedge=LLM_HEDGE_ENABLED, deadline=deadline)
+    if served is None:
+        return None
+    attempt, resp = served
+    return attempt.provider, attempt.model, resp
+
+
+def _run_action(user_id, fn_name, fn_args, lang, log_event):
+    """Validate LLM-provided arguments, then execute the action"""
+    is_valid, validation_result = validate_action_arguments(fn_name, fn_args)
+    if not is_valid:
+        logger.warning(log_event, action=fn_name, errors=validation_result)
+        return {
+            "success": False,
+            "message": f"Argumen tidak valid: {', '.join([e.get('msg', 'Unknown error') for e in validation_result])}",
+            "code": "INVALID_ARGUMENTS",
+        }
+    key, prior_key = _action_keys(fn_name)
+    return execute_action(
+        user_id,
+        fn_name,
+        validation_result,
+        lang=lang,
+        idempotency_key=key,
+        prior_idempotency_key=prior_key,
+    )
+
+
+def _action_keys(fn_name):
+    """(idempotency key, prior key) of the n-th write of this chat request.
+
+    Derived from the client's Idempotency-Key or the chat dedupe key, so a
+    retried message (in any worker) replays its writes instead of repeating
+    them. The prior key is the dedupe key of the previous bucket (None with a
+    client key). (None, None) outside a keyed chat request.
+    """
+    client_key = _idempotency_key()
+    base = client_key or g.get("chat_request_key")
+    if not base:
+        return None, None
+    g.chat_action_count = g.get("chat_action_count", 0) + 1
+    suffix = f":{fn_name}:{g.chat_action_count}"
+    prior = g.get("chat_previous_key")
+    return base + suffix, (prior + suffix if prior and not client_key else None)
+
+
+def _init_tool_state(user_id, session_id, first_tool_name, active_state):
+    """Start a conversation state flow for the tool's intent (if none active)"""
+    detected_intent = TOOL_INTENT_MAP.get(first_tool_name)
+    if detected_intent:
+        print(f"[DEBUG] Detected Intent for State Mgmt: {detected_intent}")
+        if not active_state or not active_state.get("success"):
+            success, init_result = ConversationStateManager.init_state(
+                user_id, session_id, detected_intent
+            )
+            if success:
+                print(f"[DEBUG] State initialized: {init_result}")
+    return detected_intent
+
+
+def _run_tool_call(user_id, session_id, fn_name, fn_args, lang, detected_intent):
+    """Execute one OpenAI tool call and record its fields in the conversation state"""
+    print(f"\n{'=' * 60}")
+    print(f"[DEBUG] Tool Call: {fn_name}")
+    print(f"[DEBUG] Arguments: {sanitize_for_logging(fn_args)}")
+    print(f"{'=' * 60}\n")
+
+    result = _run_action(
+        user_id, fn_name, fn_args, lang, "llm_argument_validation_failed"
+    )
+
+    print(f"\n{'=' * 60}")
+    print(f"[DEBUG] Tool Result: {result}")
+    print(f"{'=' * 60}\n")
+
+    if detected_intent and result.get("success"):
+        for field in STATE_FIELDS:
+            if field in fn_args:
+                success, _ = ConversationStateManager.update_field(
+                    session_id, field, fn_args[field]
+                )
+                if success:
+                    print(f"[DEBUG] State updated: {field}={fn_args[field]}")
+    return result
+
+
+def _tool_results_reply(results):
+    """Reply for executed tool calls: (answer, awaiting_clarification, explain)
+
+    `explain` is True when every call succeeded and the caller should append a
+    natural-language explanation to the status summary.
+    """
+    summary = "\n".join(
+        [("✓" if r["success"] else "✗") + " " + r["message"] for r in results]
+    )
+    # If any tool signals clarification, ask user immediately
+    any_ask = next(
+        (r.get("ask_user") for r in results if (not r["success"]) and r.get("ask_user")),
+        None,
+    )
+    if any_ask:
+        return any_ask, True, False
+    if any(
+        (not r["success"]) and (r.get("message") in CLARIFICATION_TYPES)
+        for r in results
+    ):
+        clarification_msg = next(
+            (r.get("ask_user") for r in results if r.get("message") in CLARIFICATION_TYPES),
+            "Mohon lengkapi informasi yang diperlukan.",
+        )
+        return clarification_msg, True, False
+    # If any failure without ask_user, return only summary to avoid mixed messages
+    if any(not r["success"] for r in results):
+        return summary, False, False
+    return summary, False, True
+
+
+def _parse_gemini_action(text):
+    """(json block match, action, data) from a Gemini reply, or None"""
+    jm = _GEMINI_JSON_RE.search(text)
+    if not jm:
+        return None
+    obj = json.loads(jm.group(1).strip())
+    action = obj.get("action")
+    data_obj = obj.get("data", {})
+    logger.debug(
+        "gemini_tool_call", action=action, arguments=sanitize_for_logging(data_obj)
+    )
+    return jm, action, data_obj
+
+
+def _gemini_action_reply(text, jm, res, lang):
+    """Reply for an executed Gemini action: (answer, meta, update_summary)"""
+    # Handle special case: need clarification (category, type, amount, account, name, goal, etc.)
+    if not res["success"] and res.get("message") in CLARIFICATION_TYPES:
+        answer = res.get("ask_user", "Mohon lengkapi informasi yang diperlukan.")
+        return answer, {"awaiting_clarification": True}, False
+
+    # If tool requests clarification, ask user and stop
+    if (not res.get("success")) and res.get("ask_user"):
+        return res.get("ask_user"), {"awaiting_clarification": True}, False
+
+    prefix = "✓" if res["success"] else "✗"
+    # On failure, avoid appending model's remaining text to prevent mixed messages
+    if not res["success"]:
+        return prefix + " " + res["message"], None, False
+
+    # Success: Let LLM explain naturally without forcing status prefix
+    remaining = text.replace(jm.group(0), "").strip()
+    explanation = remaining if remaining else "Berhasil!" if lang != "en" else "Done!"
+    answer = prefix + " " + res["message"]
+    if explanation and explanation.lower() not in ["berhasil!", "done!"]:
+        answer += "\n\n" + explanation
+    return answer, None, True
+
+
+def _finish_reply(user_id, session_id, answer, meta=None, update_summary=True):
+    """Persist the assistant reply (and queue a background summary refresh)"""
+    log_message(user_id, "assistant", answer, meta, session_id=session_id)
+    if update_summary:
+        schedule_summary(user_id)
+
+
+def _cache_answer(cache_scope, message, answer):
+    """Remember a plain LLM answer (no action block) for repeated questions"""
+    if cache_scope and answer and "```" not in answer:
+        get_response_cache().store(cache_scope, message, answer)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _local_query_answer(user_id, message, lang, today):
+    """(answer, plan) for a recognized aggregate question, or None for the LLM"""
+    if not LOCAL_QUERY_ENABLED:
+        return None
+    plan = plan_query(message, today)
+    if plan is None or plan.confidence < LOCAL_QUERY_MIN_CONFIDENCE:
+        incr("chat_local_query_fallbacks")
+        return None
+    try:
+        answer = answer_query(user_id, plan, lang)
+    except Exception as e:
+        get_db().rollback()
+        logger.error("local_query_failed", exc=e, user_id=user_id, kind=plan.kind)
+        incr("chat_local_query_errors")
+        return None
+    incr("chat_local_query_answers")
+    return answer, plan
+
+
+def _local_capture(user_id, message, lang, today):
+    """(answer, capture): answer is set when the transaction was recorded locally.
+
+    An incomplete capture is still returned so its fields can be passed to
+    the LLM as hints.
+    """
+    if not (LOCAL_CAPTURE_ENABLED or LOCAL_CAPTURE_HINTS):
+        return None, None
+    db = get_db()
+    try:
+        capture = capture_transaction(message, today, user_id, db)
+    except Exception as e:
+        db.rollback()
+        logger.error("local_capture_failed", exc=e, user_id=user_id)
+        return None, None
+    if capture is None:
+        return None, None
+    if not LOCAL_CAPTURE_ENABLED or not capture.is_complete(LOCAL_CAPTURE_MIN_CONFIDENCE):
+        incr("chat_local_capture_fallbacks")
+        return None, capture
+
+    result = _run_action(
+        user_id,
+        "add_transaction",
+        dict(capture.args),
+        lang,
+        "local_capture_validation_failed",
+    )
+    if not result.get("success"):
+        # Nothing was written; let the LLM handle (and explain) it
+        db.rollback()
+        incr("chat_local_capture_failures")
+        logger.warning(
+            "local_capture_rejected", user_id=user_id, code=result.get("code")
+        )
+        return None, capture
+    incr("chat_local_captures")
+    return _explained_reply(user_id, result["message"], [result], lang, today), capture
+
+
+def _local_reply(user_id, session_id, answer, meta, stream_mode, started):
+    """Persist and return an answer produced without the LLM (JSON or SSE)"""
+    _finish_reply(user_id, session_id, answer, meta)
+    total_ms = round((time.perf_counter() - started) * 1000, 1)
+    latency("chat_local_total").record(total_ms)
+    if stream_mode:
+        body = (
+            _sse("session", {"session_id": session_id})
+            + _sse("token", {"text": answer})
+            + _sse(
+                "done",
+                {
+                    "answer": answer,
+                    "session_id": session_id,
+                    "ttfb_ms": total_ms,
+                    "total_ms": total_ms,
+                },
+            )
+        )
+        return Response(
+            body,
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    return jsonify({"answer": answer, "session_id": session_id}), 200
+
+
+class _FenceFilter:
+    """Passes streamed Gemini text through until a ``` fence starts.
+
+    The action JSON block must not be shown while it is being generated;
+    anything after the first fence is held back and resolved once the full
+    reply is known.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._emitted = 0
+        self.fenced = False
+
+    def feed(self, piece):
+        self.text += piece
+        if self.fenced:
+            return ""
+        fence = self.text.find("```", self._emitted)
+        if fence != -1:
+            self.fenced = True
+            end = fence
+        else:
+            # Hold back a possible partial fence at the end
+            end = max(self._emitted, len(self.text) - 2)
+        visible = self.text[self._emitted : end]
+        self._emitted = end
+        return visible
+
+    def rest(self):
+        """Text not yet emitted (only meaningful when no action was found)"""
+        visible = self.text[self._emitted :]
+        self._emitted = len(self.text)
+        return visible
+
+
+def _chat_event_stream(
+    user_id,
+    session_id,
+    provider,
+    model_id,
+    lang,
+    base_prompt,
+    user_prompt,
+    image_data,
+    active_state,
+    started,
+    deadline,
+    user_message,
+    today,
+    cache_scope=None,
+):
+    """SSE body for /api/chat in stream mode.
+
+    Events: session, token {text}, tool_call {name, arguments},
+    tool_result {name, success, message}, done {answer, session_id, ttfb_ms},
+    error {error}. `done.answer` is the canonical reply persisted via
+    log_message; clients should replace the streamed text with it.
+
+    When `deadline` runs out mid-stream the reply is cut short: what was
+    streamed so far plus a note, `done.degraded` set, and no tool runs.
+    """
+    ttfb = {"ms": None}
+
+    def token(text):
+        if ttfb["ms"] is None:
+            ttfb["ms"] = round((time.perf_counter() - started) * 1000, 1)
+            latency("chat_sse_ttfb").record(ttfb["ms"])
+            logger.info(
+                "chat_stream_first_token",
+                user_id=user_id,
+                provider=provider,
+                model=model_id,
+                ttfb_ms=ttfb["ms"],
+            )
+        return _sse("token", {"text": text})
+
+    def done(answer, meta=None, update_summary=True):
+        _finish_reply(user_id, session_id, answer, meta, update_summary)
+        total_ms = round((time.perf_counter() - started) * 1000, 1)
+        latency("chat_sse_total").record(total_ms)
+        return _sse(
+            "done",
+            {
+                "answer": answer,
+                "session_id": session_id,
+                "ttfb_ms": ttfb["ms"],
+                "total_ms": total_ms,
+            },
+        )
+
+    def cut_short(partial):
+        incr("chat_deadline_cut_short")
+        logger.warning(
+            "chat_stream_deadline_exceeded",
+            user_id=user_id,
+            provider=provider,
+            elapsed_s=round(deadline.elapsed(), 1),
+        )
+        note = _deadline_reply(lang)
+        if not partial.strip():
+            # Nothing worth keeping in the conversation history
+            yield _sse(
+                "done",
+                {"answer": note, "session_id": session_id, "degraded": True},
+            )
+            return
+        yield token("\n\n⏳ " + note)
+        answer = f"{partial}\n\n⏳ {note}"
+        _finish_reply(user_id, session_id, answer, {"degraded": True}, False)
+        yield _sse(
+            "done",
+            {"answer": answer, "session_id": session_id, "degraded": True},
+        )
+
+    yield _sse("session", {"session_id": session_id})
+
+    try:
+        served = _llm_request(
+            provider, model_id, base_prompt, user_prompt, image_data, True, deadline
+        )
+        if served is None:
+            if not deadline.covers(LLM_MIN_CALL_SECONDS):
+                yield from cut_short("")
+                return
+            yield _sse("error", {"error": _connection_error_reply(lang)})
+            return
+        provider, model_id, resp = served
+
+        if provider == "openai":
+            content = []
+            tool_calls = {}  # index -> {"name", "arguments"} assembled from deltas
+            for chunk in resp:
+                if deadline.expired():
+                    # Partial tool call arguments are never executed
+                    resp.close()
+                    yield from cut_short("".join(content))
+                    return
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content.append(delta.content)
+                    yield token(delta.content)
+                for tc in delta.tool_calls or []:
+                    slot = tool_calls.setdefault(tc.index, {"name": "", "arguments": ""})
+                    if tc.function and tc.function.name:
+                        slot["name"] += tc.function.name
+                    if tc.function and tc.function.arguments:
+                        slot["arguments"] += tc.function.arguments
+
+            if not tool_calls:
+                answer = "".join(content)
+                _cache_answer(cache_scope, user_message, answer)
+                yield done(answer)
+                return
+
+            calls = [tool_calls[i] for i in sorted(tool_calls)]
+            detected_intent = _init_tool_state(
+                user_id, session_id, calls[0]["name"], active_state
+            )
+            results = []
+            for call in calls:
+                fn_args = json.loads(call["arguments"] or "{}")
+                yield _sse(
+                    "tool_call",
+                    {"name": call["name"], "arguments": sanitize_for_logging(fn_args)},
+                )
+                result = _run_tool_call(
+                    user_id, session_id, call["name"], fn_args, lang, detected_intent
+                )
+                results.append(result)
+                yield _sse(
+                    "tool_result",
+                    {
+                        "name": call["name"],
+                        "success": bool(result.get("success")),
+                        "message": result.get("message"),
+                    },
+                )
+
+            answer, awaiting, explain = _tool_results_reply(results)
+            if awaiting:
+                yield done(answer, {"awaiting_clarification": True}, update_summary=False)
+                return
+            if not explain:
+                yield done(answer)
+                return
+
+            answer = _explained_reply(user_id, answer, results, lang, today)
+            yield token(answer)
+            if CHAT_LLM_EXPLANATION:
+                extra = []
+                for piece in _llm_explanation(
+                    model_id, base_prompt, answer, lang, deadline
+                ):
+                    if not extra:
+                        yield token("\n\n")
+                    extra.append(piece)
+                    yield token(piece)
+                extra = "".join(extra).strip()
+                if extra:
+                    answer += "\n\n" + extra
+            yield done(answer)
+            return
+
+        # PROVIDER: GEMINI
+        fence = _FenceFilter()
+        shown = []
+        for chunk in resp:
+            if deadline.expired():
+                yield from cut_short("".join(shown))
+                return
+            try:
+                piece = chunk.text
+            except ValueError:
+                piece = ""  # chunk without text parts (e.g. safety block)
+            visible = fence.feed(piece or "")
+            if visible:
+                shown.append(visible)
+                yield token(visible)
+        text = fence.text
+
+        try:
+            parsed = _parse_gemini_action(text)
+            if parsed:
+                jm, action, data_obj = parsed
+                yield _sse(
+                    "tool_call",
+                    {"name": action, "arguments": sanitize_for_logging(data_obj)},
+                )
+                res = _run_action(
+                    user_id, action, data_obj, lang, "gemini_argument_validation_failed"
+                )
+                logger.debug("gemini_tool_result", action=action, result=res)
+                yield _sse(
+                    "tool_result",
+                    {
+                        "name": action,
+                        "success": bool(res.get("success")),
+                        "message": res.get("message"),
+                    },
+                )
+                answer, meta, update_summary = _gemini_action_reply(text, jm, res, lang)
+                yield done(answer, meta, update_summary)
+                return
+        except DeadlineExceeded:
+            raise
+        except Exception as je:
+            logger.warning("gemini_action_parse_failed", error=str(je))
+
+        rest = fence.rest()
+        if rest:
+            yield token(rest)
+        _cache_answer(cache_scope, user_message, text)
+        yield done(text)
+
+    except DeadlineExceeded:
+        yield from cut_short("")
+    except Exception as e:
+        logger.error("chat_stream_failed", exc=e, user_id=user_id, provider=provider)
+        yield _sse("error", {"error": f"{'OpenAI' if provider == 'openai' else 'Gemini'} error: {e}"})
+
+
+# === LLM CHAT ROUTE ===
+@app.route("/api/chat", methods=["POST"])
+@require_login
+@limiter.limit("20 per hour")  # 20 messages per hour per IP
+@single_flight_chat
+@require_chat_slot
+def chat_api():
+    started = time.perf_counter()
+    # One budget for every stage below: DB statements, LLM calls, retries
+    deadline = Deadline(CHAT_DEADLINE_SECONDS)
+    set_request_deadline(deadline)
+    user_id = g.user["id"]
+    # Use WIB date for prompts
+    today = datetime.now(timezone(timedelta(hours=7))).date()
+
+    # Handle both JSON and multipart form data (for image uploads)
+    image_file = None
+    image_data = None
+    data = {}  # Initialize data dict for both cases
+
+    if request.content_type and "multipart/form-data" in request.content_type:
+        # Image upload
+        user_message = (request.form.get("message") or "").strip()
+        lang = request.form.get("lang", "id")
+        provider = request.form.get("model_provider", "google")
+        model_id = request.form.get("model") or None
+        stream_mode = request.form.get("stream") in ("1", "true")
+
+        # Get session_id from form if present
+        session_id_str = request.form.get("session_id")
+        if session_id_str:
+            try:
+                data["session_id"] = int(session_id_str)
+            except (ValueError, TypeError):
+                data["session_id"] = None
+
+        if "image" in request.files:
+            image_file = request.files["image"]
+            if image_file and image_file.filename:
+                # Read image data
+                image_bytes = image_file.read()
+                image_data = base64.b64encode(image_bytes).decode("utf-8")
+                # Reset file pointer if needed
+                image_file.seek(0)
+    else:
+        # Regular JSON request
+        data = request.get_json() or {}
         user_message = (data.get("message") or "").strip()
         lang = data.get("lang", "id")
         provider = data.get("model_provider", "google")
         model_id = data.get("model") or None
+        stream_mode = data.get("stream") in (True, 1, "1", "true")
 
     print(f"\n{'=' * 60}")
     print("[DEBUG] === CHAT API ENDPOINT DIPANGGIL ===")
@@ -2057,6 +3425,9 @@ def chat_api():
     if not user_message and not image_data:
         return jsonify({"error": "message atau gambar harus diisi"}), 400
 
+    if "text/event-stream" in (request.headers.get("Accept") or ""):
+        stream_mode = True
+
     # Check if user has OCR enabled when image is uploaded
     if image_data:
         db = get_db()
@@ -2091,46 +3462,100 @@ def chat_api():
     # Use provided model_id or fallback to defaults
     if not model_id:
         if provider == "openai":
-            model_id = "gpt-4o-mini"
+            model_id = DEFAULT_OPENAI_MODEL
         else:
-            model_id = "gemini-2.5-flash"
+            model_id = DEFAULT_GEMINI_MODEL
 
     print(f"[DEBUG] Provider: {provider}")
     print(f"[DEBUG] Model: {model_id}")
     print(f"[DEBUG] Language: {lang}")
     print(f"[DEBUG] Year/Month: {year}/{month}\n")
 
-    # Get or create session
-    session_id = data.get("session_id")
-    if not session_id:
-        # Create new session
-        db = get_db()
-        db.execute(
-            "INSERT INTO chat_sessions (user_id, title) VALUES (%s, %s)",
-            (user_id, "New Chat"),
-        )
-        db.commit()
-        cur = db.execute(
-            "SELECT id FROM chat_sessions WHERE user_id = %s ORDER BY created_at DESC LIMIT 1",
-            (user_id,),
-        )
-        row = cur.fetchone()
-        session_id = row["id"] if row else None
-
-    # Log user message with session
-    log_message(user_id, "user", user_message, session_id=session_id)
-
-    ctx = build_financial_context(user_id, year, month)
-    mem_ctx = build_memory_context(user_id)
-    db = get_db()
-    row = db.execute("SELECT name FROM users WHERE id = %s", (user_id,)).fetchone()
-    user_name = row["name"] if row else "Teman"
+    # Session, user message log, name, memory, state and financial context
+    # in one batched round trip
+    chat_ctx = assemble_chat_context(
+        user_id, data.get("session_id"), user_message, year, month
+    )
+    session_id = chat_ctx.session_id
+    ctx = chat_ctx.financial
+    mem_ctx = chat_ctx.memory
+    user_name = chat_ctx.user_name
 
     wib = timezone(timedelta(hours=7))
     time_str = datetime.now(wib).strftime("%H:%M WIB, %A, %d %B %Y")
 
     # Detect intent and use appropriate prompt to save tokens
     intent = detect_intent(user_message)
+
+    # Aggregate questions (balances, totals, top categories) are answered
+    # from SQL/rollups with a template; low-confidence ones go to the LLM
+    if intent == "query" and not image_data and not chat_ctx.active_state.get("success"):
+        local = _local_query_answer(user_id, user_message, lang, today)
+        if local:
+            answer, plan = local
+            return _local_reply(
+                user_id,
+                session_id,
+                answer,
+                {"local_answer": plan.kind, "confidence": plan.confidence},
+                stream_mode,
+                started,
+            )
+
+    # One-line transactions ("makan siang 35rb pakai gopay") are recorded
+    # directly when every field is certain; otherwise the extracted fields
+    # are passed to the LLM as hints
+    capture = None
+    if (
+        intent in ("action", "general")
+        and not image_data
+        and not chat_ctx.active_state.get("success")
+    ):
+        answer, capture = _local_capture(user_id, user_message, lang, today)
+        if answer:
+            return _local_reply(
+                user_id,
+                session_id,
+                answer,
+                {"local_capture": True, "confidence": capture.score},
+                stream_mode,
+                started,
+            )
+
+    # Repeated stand-alone questions reuse an earlier LLM answer while the
+    # user's data (data_version) is unchanged
+    cache_scope = None
+    if (
+        RESPONSE_CACHE_ENABLED
+        and intent in ("query", "general")
+        and capture is None
+        and not image_data
+        and not chat_ctx.active_state.get("success")
+        and is_cacheable(user_message)
+    ):
+        cache_scope = (
+            user_id,
+            chat_ctx.data_version,
+            lang,
+            provider,
+            model_id,
+            year,
+            month,
+            today.isoformat(),
+        )
+        cached = get_response_cache().lookup(cache_scope, user_message)
+        if cached:
+            answer, match = cached
+            incr(f"chat_cached_answers_{match}")
+            return _local_reply(
+                user_id,
+                session_id,
+                answer,
+                {"cached_answer": match},
+                stream_mode,
+                started,
+            )
+
     base_prompt = get_system_prompt(intent, lang, user_name, time_str)
 
     user_prompt = (
@@ -2138,11 +3563,13 @@ def chat_api():
         if lang == "en"
         else f"Tanggal: {today.isoformat()}\nKonteks:\n{ctx}\n\nMemori:\n{mem_ctx}\n\nUser: {user_message}"
     )
+    if capture is not None and LOCAL_CAPTURE_HINTS:
+        user_prompt += capture.hint(lang)
 
     # === CONVERSATION STATE MANAGEMENT ===
     # Check if there's an active multi-turn conversation state for this session
     state_context = ""
-    active_state = ConversationStateManager.get_session_state(session_id)
+    active_state = chat_ctx.active_state
 
     if active_state and active_state.get("success"):
         state_data = active_state.get("state", {})
@@ -2165,44 +3592,54 @@ def chat_api():
 
     # === END STATE MANAGEMENT ===
 
-    # PROVIDER: OPENAI
-    if provider == "openai":
-        try:
-            # Build user message with image if provided
-            if image_data:
-                user_content = [
-                    {"type": "text", "text": user_prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_data}"},
-                    },
-                ]
-            else:
-                user_content = user_prompt
+    # Opt-in SSE mode: stream tokens and tool events as they arrive
+    if stream_mode:
+        return Response(
+            stream_with_context(
+                _chat_event_stream(
+                    user_id,
+                    session_id,
+                    provider,
+                    model_id,
+                    lang,
+                    base_prompt,
+                    user_prompt,
+                    image_data,
+                    active_state,
+                    started,
+                    deadline,
+                    user_message,
+                    today,
+                    cache_scope,
+                )
+            ),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
 
-            # Call OpenAI with retry logic (max 3 retries with exponential backoff)
-            resp = call_llm_with_retry(
-                client.chat.completions.create,
-                model=model_id,
-                messages=[
-                    {"role": "system", "content": base_prompt},
-                    {"role": "user", "content": user_content},
-                ],
-                tools=TOOLS_DEFINITIONS,
-                tool_choice="auto",
-                max_retries=3,
-                initial_delay=1.0,
-            )
+    if provider not in ("openai", "google"):
+        return jsonify({"error": "Provider tidak valid"}), 400
 
-            if resp is None:
-                # All retries failed
-                error_msg = (
-                    "Maaf, sedang ada gangguan koneksi ke AI. Coba lagi sebentar ya!"
-                    if lang == "id"
-                    else "Sorry, there's a connection issue with AI. Please try again in a moment!"
-                )
-                return jsonify({"reply": error_msg, "session_id": session_id}), 503
+    try:
+        served = _llm_request(
+            provider, model_id, base_prompt, user_prompt, image_data, False, deadline
+        )
+    except Exception as e:
+        return jsonify(
+            {"error": f"{'OpenAI' if provider == 'openai' else 'Gemini'} error: {e}"}
+        ), 500
+    if served is None and not deadline.covers(LLM_MIN_CALL_SECONDS):
+        raise DeadlineExceeded("llm")
+    if served is None:
+        # Every provider failed or has an open circuit breaker
+        return jsonify(
+            {"reply": _connection_error_reply(lang), "session_id": session_id}
+        ), 503
+    provider, model_id, resp = served
 
+    # PROVIDER: OPENAI
+    if provider == "openai":
+        try:
             msg = resp.choices[0].message
 
             if msg.tool_calls:
@@ -2211,435 +3648,97 @@ def chat_api():
                 print(f"[DEBUG] Jumlah tool calls: {len(msg.tool_calls)}")
                 print(f"{'=' * 60}\n")
 
-                results = []
-
-                # === MAP TOOL CALLS TO INTENTS FOR STATE MANAGEMENT ===
-                # Map LLM tool names to state machine intents
-                intent_map = {
-                    "add_transaction": "add_transaction",
-                    "edit_transaction": "edit_transaction",
-                    "delete_transaction": "delete_transaction",
-                    "transfer_funds": "transfer",
-                    "create_savings_goal": "create_goal",
-                }
-
                 # Detect intent from first tool call (usually only 1 per turn in multi-turn flows)
-                first_tool_name = msg.tool_calls[0].function.name
-                detected_intent = intent_map.get(first_tool_name)
-
-                if detected_intent:
-                    print(f"[DEBUG] Detected Intent for State Mgmt: {detected_intent}")
-                    # Check if we need to initialize state (only if no active state)
-                    if not active_state or not active_state.get("success"):
-                        success, init_result = ConversationStateManager.init_state(
-                            user_id, session_id, detected_intent
-                        )
-                        if success:
-                            print(f"[DEBUG] State initialized: {init_result}")
-
-                # === END INTENT DETECTION ===
-
-                for tc in msg.tool_calls:
-                    fn_name = tc.function.name
-                    fn_args = json.loads(tc.function.arguments)
-
-                    print(f"\n{'=' * 60}")
-                    print(f"[DEBUG] Tool Call: {fn_name}")
-                    print(f"[DEBUG] Arguments: {sanitize_for_logging(fn_args)}")
-                    print(f"{'=' * 60}\n")
-
-                    # Validate LLM arguments before execution
-                    is_valid, validation_result = validate_action_arguments(
-                        fn_name, fn_args
-                    )
-                    if not is_valid:
-                        # Validation failed
-                        error_msg = (
-                            f"Invalid arguments for {fn_name}: {validation_result}"
-                        )
-                        logger.warning(
-                            "llm_argument_validation_failed",
-                            action=fn_name,
-                            errors=validation_result,
-                        )
-                        result = {
-                            "success": False,
-                            "message": f"Argumen tidak valid: {', '.join([e.get('msg', 'Unknown error') for e in validation_result])}",
-                            "code": "INVALID_ARGUMENTS",
-                        }
-                    else:
-                        # Validation passed - execute with validated arguments
-                        result = execute_action(
-                            user_id, fn_name, validation_result, lang=lang
-                        )
-
-                    results.append(result)
-
-                    print(f"\n{'=' * 60}")
-                    print(f"[DEBUG] Tool Result: {result}")
-                    print(f"{'=' * 60}\n")
-
-                    # === UPDATE CONVERSATION STATE IF APPLICABLE ===
-                    if detected_intent and result.get("success"):
-                        # Extract field values from fn_args to update state
-                        # Map tool parameters to state manager field names
-                        param_to_field_map = {
-                            "amount": "amount",
-                            "category": "category",
-                            "account": "account",
-                            "from_account": "from_account",
-                            "to_account": "to_account",
-                            "field_name": "field_name",
-                            "new_value": "new_value",
-                            "transaction_id": "transaction_id",
-                            "password": "password",
-                            "name": "name",
-                            "target_amount": "target_amount",
-                            "deadline": "deadline",
-                            "confirm": "confirm",
-                        }
-
-                        # Update state with each extracted field
-                        for param_key, state_field in param_to_field_map.items():
-                            if param_key in fn_args:
-                                value = fn_args[param_key]
-                                success, update_result = (
-                                    ConversationStateManager.update_field(
-                                        session_id, state_field, value
-                                    )
-                                )
-                                if success:
-                                    print(
-                                        f"[DEBUG] State updated: {state_field}={value}"
-                                    )
-
-                    # === END STATE UPDATE ===
-
-                summary = "\n".join(
-                    [
-                        ("✓" if r["success"] else "✗") + " " + r["message"]
-                        for r in results
-                    ]
-                )
-                # If any tool signals clarification, ask user immediately
-                clarification_types = [
-                    "need_category",
-                    "need_type",
-                    "need_amount",
-                    "need_account",
-                    "need_name",
-                    "need_goal",
-                    "need_date",
-                    "no_updates",
-                ]
-                any_ask = next(
-                    (
-                        r.get("ask_user")
-                        for r in results
-                        if (not r["success"]) and r.get("ask_user")
-                    ),
-                    None,
+                detected_intent = _init_tool_state(
+                    user_id, session_id, msg.tool_calls[0].function.name, active_state
                 )
-                if any_ask:
-                    log_message(
+                results = [
+                    _run_tool_call(
                         user_id,
-                        "assistant",
-                        any_ask,
-                        {"awaiting_clarification": True},
-                        session_id=session_id,
-                    )
-                    return jsonify({"answer": any_ask, "session_id": session_id}), 200
-                needs_clarification = any(
-                    (not r["success"]) and (r.get("message") in clarification_types)
-                    for r in results
-                )
-                if needs_clarification:
-                    clarification_msg = next(
-                        (
-                            r.get("ask_user")
-                            for r in results
-                            if r.get("message") in clarification_types
-                        ),
-                        "Mohon lengkapi informasi yang diperlukan.",
+                        session_id,
+                        tc.function.name,
+                        json.loads(tc.function.arguments),
+                        lang,
+                        detected_intent,
                     )
-                    log_message(
+                    for tc in msg.tool_calls
+                ]
+
+                answer, awaiting, explain = _tool_results_reply(results)
+                if awaiting:
+                    _finish_reply(
                         user_id,
-                        "assistant",
-                        clarification_msg,
+                        session_id,
+                        answer,
                         {"awaiting_clarification": True},
-                        session_id=session_id,
+                        update_summary=False,
                     )
-                    return jsonify(
-                        {"answer": clarification_msg, "session_id": session_id}
-                    ), 200
-
-                # If any failure without ask_user, return only summary to avoid mixed messages
-                if any(not r["success"] for r in results):
-                    log_message(user_id, "assistant", summary, session_id=session_id)
-                    maybe_update_summary(user_id)
-                    return jsonify({"answer": summary, "session_id": session_id}), 200
-
-                # All successful - ask LLM to explain results naturally without status lines
-                explain_prompt = (
-                    "Jelaskan hasil aksi finansial ini dengan singkat (maks 5 kalimat) dan friendly. Jangan sertakan simbol status (✓/✗)."
-                    if lang != "en"
-                    else "Explain the results of this financial action concisely (max 5 sentences) in a friendly way. Do not include status symbols (✓/✗)."
-                )
-                follow = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": base_prompt},
-                        {"role": "user", "content": explain_prompt},
-                    ],
-                )
-                # Only add status summary if there's actual information to show
-                explanation = follow.choices[0].message.content.strip()
-                # For truly successful actions, show status once then explain
-                answer = summary + "\n\n" + explanation if explanation else summary
-                log_message(user_id, "assistant", answer, session_id=session_id)
-                maybe_update_summary(user_id)
+                    return jsonify({"answer": answer, "session_id": session_id}), 200
+                if not explain:
+                    _finish_reply(user_id, session_id, answer)
+                    return jsonify({"answer": answer, "session_id": session_id}), 200
+
+                # All successful - explain from the structured results; the
+                # model-written extra is only offered in stream mode
+                answer = _explained_reply(user_id, answer, results, lang, today)
+                _finish_reply(user_id, session_id, answer)
                 return jsonify({"answer": answer, "session_id": session_id}), 200
 
             # Fallback: no tool calls
             # DISABLED auto-parse untuk mencegah double recording
             # Biarkan LLM handle dengan response text biasa
             answer = msg.content
-            log_message(user_id, "assistant", answer, session_id=session_id)
-            maybe_update_summary(user_id)
+            _cache_answer(cache_scope, user_message, answer)
+            _finish_reply(user_id, session_id, answer)
             return jsonify({"answer": answer, "session_id": session_id}), 200
 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             return jsonify({"error": f"OpenAI error: {e}"}), 500
 
     # PROVIDER: GEMINI
     if provider == "google":
         try:
-            # Initialize Gemini model dynamically with selected model_id
-            current_gemini_model = genai.GenerativeModel(model_id)
-
-            safety = [
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_NONE",
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_NONE",
-                },
-            ]
-            hint = """Jika perlu lakukan aksi kembalikan JSON dalam blok ```json``` dengan field 'action' dan 'data'.
-
-ATURAN KRITIS - WAJIB DIIKUTI:
-1. PEMASUKAN (income/record_income):
-   - 'amount' WAJIB
-   - 'category' WAJIB dan harus spesifik (Gaji, Bonus, Penjualan, Investasi - BUKAN "Lainnya")
-   - Jika kategori tidak disebutkan, TANYA DULU jangan langsung catat
-
-2. PENGELUARAN (expense/record_expense):
-   - 'amount' WAJIB
-   - 'category' WAJIB (Makan, Transport, Belanja, dll.)
-   - Jika tidak jelas, TANYA DULU
-
-3. TRANSFER (transfer_funds):
-   - 'amount' WAJIB
-   - 'from_account' WAJIB (akun sumber)
-   - 'to_account' WAJIB (akun tujuan)
-   - Jika ada yang kurang, TANYA DULU
-
-4. TARGET TABUNGAN (create_savings_goal):
-   - 'name' WAJIB (nama target)
-   - 'target_amount' WAJIB (jumlah target)
-   - Jika ada yang kurang, TANYA DULU
-
-5. TRANSFER KE TABUNGAN (transfer_to_savings):
-   - 'amount' WAJIB
-   - 'from_account' WAJIB
-   - 'goal_id' WAJIB (ID target tabungan)
-   - Jika ada yang kurang, TANYA DULU
-
-PRINSIP: JANGAN mencatat apapun ke database jika informasi tidak lengkap. TANYA dulu untuk klarifikasi.
-
-Action tersedia:
-- add_transaction / record_expense / record_income
-- update_transaction (wajib: id)
-- delete_transaction (wajib: id)
-- transfer_funds
-- create_savings_goal
-- update_savings_goal (wajib: id)
-- transfer_to_savings"""
-            prompt = f"{base_prompt}\n\n{user_prompt}\n\n{hint}"
-
-            # Build content with image if provided
-            if image_data:
-                import PIL.Image
-                import io
-                import base64
-
-                # Decode base64 image
-                image_bytes = base64.b64decode(image_data)
-                image = PIL.Image.open(io.BytesIO(image_bytes))
-
-                # For Gemini vision with retry
-                resp = call_llm_with_retry(
-                    current_gemini_model.generate_content,
-                    [prompt, image],
-                    safety_settings=safety,
-                    stream=False,
-                    max_retries=3,
-                    initial_delay=1.0,
-                )
-            else:
-                resp = call_llm_with_retry(
-                    current_gemini_model.generate_content,
-                    prompt,
-                    safety_settings=safety,
-                    stream=False,
-                    max_retries=3,
-                    initial_delay=1.0,
-                )
-
-            if resp is None:
-                # All retries failed
-                error_msg = (
-                    "Maaf, sedang ada gangguan koneksi ke AI. Coba lagi sebentar ya!"
-                    if lang == "id"
-                    else "Sorry, there's a connection issue with AI. Please try again in a moment!"
-                )
-                return jsonify({"reply": error_msg, "session_id": session_id}), 503
-
             text = resp.text
 
-            # Fixed regex to properly extract JSON from code block
-            jm = re.search(r"```json\s*(.*?)\s*```", text, re.DOTALL)
-            if jm:
-                try:
-                    json_str = jm.group(1).strip()
-                    print(f"\n{'=' * 60}")
-                    print("[DEBUG] GEMINI: JSON action block ditemukan!")
-                    print(f"[DEBUG] JSON content: {json_str}")
-                    print(f"{'=' * 60}\n")
-
-                    obj = json.loads(json_str)
-                    action = obj.get("action")
-                    data_obj = obj.get("data", {})
-
-                    print(f"\n{'=' * 60}")
-                    print(f"[DEBUG] GEMINI Tool Call: {action}")
-                    print(f"[DEBUG] GEMINI Arguments: {sanitize_for_logging(data_obj)}")
-                    print(f"{'=' * 60}\n")
-
-                    # Validate LLM arguments before execution
-                    is_valid, validation_result = validate_action_arguments(
-                        action, data_obj
+            try:
+                parsed = _parse_gemini_action(text)
+                if parsed:
+                    jm, action, data_obj = parsed
+                    res = _run_action(
+                        user_id,
+                        action,
+                        data_obj,
+                        lang,
+                        "gemini_argument_validation_failed",
                     )
-                    if not is_valid:
-                        # Validation failed
-                        logger.warning(
-                            "gemini_argument_validation_failed",
-                            action=action,
-                            errors=validation_result,
-                        )
-                        res = {
-                            "success": False,
-                            "message": f"Argumen tidak valid: {', '.join([e.get('msg', 'Unknown error') for e in validation_result])}",
-                            "code": "INVALID_ARGUMENTS",
-                        }
-                    else:
-                        # Validation passed - execute with validated arguments
-                        res = execute_action(
-                            user_id, action, validation_result, lang=lang
-                        )
-
-                    print(f"\n{'=' * 60}")
-                    print(f"[DEBUG] GEMINI Tool Result: {res}")
-                    print(f"{'=' * 60}\n")
-
-                    # Handle special case: need clarification (category, type, amount, account, name, goal, etc.)
-                    clarification_types = [
-                        "need_category",
-                        "need_type",
-                        "need_amount",
-                        "need_account",
-                        "need_name",
-                        "need_goal",
-                        "need_date",
-                        "no_updates",
-                    ]
-                    if not res["success"] and res.get("message") in clarification_types:
-                        answer = res.get(
-                            "ask_user", "Mohon lengkapi informasi yang diperlukan."
-                        )
-                        log_message(
-                            user_id,
-                            "assistant",
-                            answer,
-                            {"awaiting_clarification": True},
-                            session_id=session_id,
-                        )
-                        return jsonify(
-                            {"answer": answer, "session_id": session_id}
-                        ), 200
-
-                    # If tool requests clarification, ask user and stop
-                    if (not res.get("success")) and res.get("ask_user"):
-                        answer = res.get("ask_user")
-                        log_message(
-                            user_id,
-                            "assistant",
-                            answer,
-                            {"awaiting_clarification": True},
-                            session_id=session_id,
-                        )
-                        return jsonify(
-                            {"answer": answer, "session_id": session_id}
-                        ), 200
-
-                    prefix = "✓" if res["success"] else "✗"
-                    remaining = text.replace(jm.group(0), "").strip()
-                    # On failure, avoid appending model's remaining text to prevent mixed messages
-                    if not res["success"]:
-                        answer = prefix + " " + res["message"]
-                        log_message(user_id, "assistant", answer, session_id=session_id)
-                        return jsonify(
-                            {"answer": answer, "session_id": session_id}
-                        ), 200
-
-                    # Success: Let LLM explain naturally without forcing status prefix
-                    # Extract just the explanation part without JSON
-                    explanation = (
-                        remaining
-                        if remaining
-                        else "Berhasil!"
-                        if lang != "en"
-                        else "Done!"
+
+                    logger.debug("gemini_tool_result", action=action, result=res)
+
+                    answer, meta, update_summary = _gemini_action_reply(
+                        text, jm, res, lang
                     )
-                    answer = prefix + " " + res["message"]
-                    if explanation and explanation.lower() not in [
-                        "berhasil!",
-                        "done!",
-                    ]:
-                        answer += "\n\n" + explanation
-                    log_message(user_id, "assistant", answer, session_id=session_id)
-                    maybe_update_summary(user_id)
+                    _finish_reply(user_id, session_id, answer, meta, update_summary)
                     return jsonify({"answer": answer, "session_id": session_id}), 200
-                except Exception as je:
-                    print(f"[DEBUG] Gemini JSON parse error: {je}")
+            except DeadlineExceeded:
+                raise
+            except Exception as je:
+                logger.warning("gemini_action_parse_failed", error=str(je))
 
             # Fallback: no JSON action block found
             # DISABLED auto-parse untuk mencegah double recording
             # Biarkan Gemini handle dengan response text biasa
             answer = text
-            log_message(user_id, "assistant", answer, session_id=session_id)
-            maybe_update_summary(user_id)
+            _cache_answer(cache_scope, user_message, answer)
+            _finish_reply(user_id, session_id, answer)
             return jsonify({"answer": answer, "session_id": session_id}), 200
 
+        except DeadlineExceeded:
+            raise
         except Exception as ge:
             return jsonify({"error": f"Gemini error: {ge}"}), 500
 
-    return jsonify({"error": "Provider tidak valid"}), 400
-
 
 # === MAIN ===
 if __name__ == "__main__":
@@ -5,8 +5,9 @@ import json
 from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Optional
 
-from openai import OpenAI
+from config import MEMORY_SUMMARY_INCREMENTAL
 from database import get_db
+from llm.providers import get_openai_client
 
 # Default constants (can be overridden per user via llm_memory_config)
 SUMMARY_THRESHOLD = 12  # regenerate summary after this many new interactions
@@ -38,7 +39,24 @@ def get_effective_config(user_id: int) -> Dict[str, int]:
 OPENAI_TIMEOUT_SEC = 10
 OPENAI_MAX_RETRIES = 2
 
-client = OpenAI()
+# The log row and both message counters in one statement
+_LOG_MESSAGE_SQL = """
+WITH logged AS (
+    INSERT INTO llm_logs (user_id, session_id, role, content, meta_json)
+    VALUES (?, ?, ?, ?, ?)
+    RETURNING user_id, session_id, created_at
+), session_stats AS (
+    UPDATE chat_sessions s
+    SET message_count = s.message_count + 1, last_message_at = logged.created_at
+    FROM logged
+    WHERE s.id = logged.session_id
+)
+INSERT INTO llm_log_stats (user_id, message_count, last_message_at)
+SELECT user_id, 1, created_at FROM logged
+ON CONFLICT (user_id) DO UPDATE
+SET message_count = llm_log_stats.message_count + 1,
+    last_message_at = EXCLUDED.last_message_at
+"""
 
 
 def log_message(
@@ -48,15 +66,75 @@ def log_message(
     meta: Optional[dict] = None,
     session_id: Optional[int] = None,
 ) -> None:
-    """Persist a single message into llm_logs"""
+    """Persist a single message into llm_logs (and bump the message counters)"""
     db = get_db()
     db.execute(
-        "INSERT INTO llm_logs (user_id, session_id, role, content, meta_json) VALUES (?, ?, ?, ?, ?)",
+        _LOG_MESSAGE_SQL,
         (user_id, session_id, role, content, json.dumps(meta) if meta else None),
     )
     db.commit()
 
 
+def count_user_logs(user_id: int) -> int:
+    """Number of llm_logs rows of the user, from the maintained counter"""
+    db = get_db()
+    row = db.execute(
+        "SELECT message_count FROM llm_log_stats WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return row["message_count"] if row else 0
+
+
+def delete_logs(db, user_id: int, where: str = "TRUE", params=()) -> int:
+    """Delete the user's llm_logs rows matching `where`, keeping counters in step.
+
+    Returns the number of deleted rows; the caller commits.
+    """
+    rows = db.execute(
+        f"""
+        WITH gone AS (
+            DELETE FROM llm_logs WHERE user_id = ? AND ({where}) RETURNING session_id
+        )
+        SELECT session_id, COUNT(*) AS n FROM gone GROUP BY session_id
+        """,
+        [user_id, *params],
+    ).fetchall()
+    deleted = sum(r["n"] for r in rows)
+    if not deleted:
+        return 0
+
+    per_session = [r for r in rows if r["session_id"] is not None]
+    if per_session:
+        db.execute(
+            """
+            UPDATE chat_sessions s
+            SET message_count = GREATEST(s.message_count - d.n, 0),
+                last_message_at = (
+                    SELECT created_at FROM llm_logs l
+                    WHERE l.session_id = s.id ORDER BY l.id DESC LIMIT 1
+                )
+            FROM unnest(?::integer[], ?::integer[]) AS d(session_id, n)
+            WHERE s.id = d.session_id
+            """,
+            (
+                [r["session_id"] for r in per_session],
+                [r["n"] for r in per_session],
+            ),
+        )
+    db.execute(
+        """
+        UPDATE llm_log_stats
+        SET message_count = GREATEST(message_count - ?, 0),
+            last_message_at = (
+                SELECT created_at FROM llm_logs
+                WHERE user_id = ? ORDER BY id DESC LIMIT 1
+            )
+        WHERE user_id = ?
+        """,
+        (deleted, user_id, user_id),
+    )
+    return deleted
+
+
 def get_recent_dialogue(
     user_id: int, limit: Optional[int] = None, session_id: Optional[int] = None
 ) -> List[Dict]:
@@ -86,7 +164,7 @@ def get_recent_dialogue(
 def get_memory_summary(user_id: int) -> Optional[Dict]:
     db = get_db()
     cur = db.execute(
-        "SELECT summary_text, interaction_count, updated_at FROM llm_memory_summary WHERE user_id = ?",
+        "SELECT summary_text, interaction_count, last_log_id, updated_at FROM llm_memory_summary WHERE user_id = ?",
         (user_id,),
     )
     row = cur.fetchone()
@@ -95,92 +173,194 @@ def get_memory_summary(user_id: int) -> Optional[Dict]:
     return {
         "summary_text": row["summary_text"],
         "interaction_count": row["interaction_count"],
+        "last_log_id": row["last_log_id"] or 0,
         "updated_at": row["updated_at"],
     }
 
 
-def maybe_update_summary(user_id: int) -> Optional[Dict]:
-    """Regenerate summary if accumulated new interactions exceeds threshold (per-user configurable)."""
-    db = get_db()
-    cfg = get_effective_config(user_id)
-    current = get_memory_summary(user_id)
+SUMMARY_SYSTEM_PROMPT = (
+    "Ringkas preferensi user, pola pemasukan/pengeluaran, akun yang sering dipakai, kategori dominan, tujuan tabungan. "
+    "Jangan sebut hal yang tidak ada. Format poin singkat maksimum 10 baris."
+)
 
-    cur = db.execute("SELECT COUNT(*) AS c FROM llm_logs WHERE user_id = ?", (user_id,))
-    total_logs = cur.fetchone()["c"] or 0
+# Incremental refresh: previous summary + only the logs after last_log_id
+SUMMARY_UPDATE_PROMPT = (
+    "Perbarui ringkasan memori user berdasarkan percakapan baru. "
+    "Pertahankan poin lama yang masih berlaku, ubah yang sudah tidak sesuai, tambahkan hal baru: "
+    "preferensi user, pola pemasukan/pengeluaran, akun yang sering dipakai, kategori dominan, tujuan tabungan. "
+    "Jangan sebut hal yang tidak ada. Format poin singkat maksimum 10 baris."
+)
 
-    last_count = current["interaction_count"] if current else 0
-    if current and total_logs - last_count < cfg["summary_threshold"]:
-        return current
+SUMMARY_FAILED_PREFIX = "(Gagal membuat ringkasan otomatis"
 
-    cur = db.execute(
-        "SELECT role, content FROM llm_logs WHERE user_id = ? ORDER BY id DESC LIMIT ?",
-        (user_id, cfg["max_source"]),
-    )
-    rows = cur.fetchall()
-    # Build plain text conversation
+
+def _convo_text(rows) -> str:
+    """Plain text conversation from chronological log rows"""
     convo_lines = []
-    for r in reversed(rows):  # chronological
+    for r in rows:
         tag = "U:" if r["role"] == "user" else "A:"
         # truncate very long lines
         content = r["content"]
         if len(content) > 500:
             content = content[:500] + "..."
         convo_lines.append(f"{tag} {content}")
-    convo_text = "\n".join(convo_lines)
+    return "\n".join(convo_lines)
+
+
+def load_summary_source(user_id: int) -> Optional[Dict]:
+    """Collect what a summary refresh needs, or None if below the threshold.
+
+    With a usable previous summary only the logs after its last_log_id
+    (oldest first, at most max_source) are loaded; otherwise the last
+    max_source logs are summarized from scratch. A summary without a
+    last_log_id (written before the column existed) is rebuilt once, so old
+    history is not replayed as new. Only reads the database;
+    the caller may release the connection before calling generate_summary().
+    """
+    db = get_db()
+    cfg = get_effective_config(user_id)
+    current = get_memory_summary(user_id)
 
-    # Summarization prompt (Indonesian focus)
-    system_prompt = (
-        "Ringkas preferensi user, pola pemasukan/pengeluaran, akun yang sering dipakai, kategori dominan, tujuan tabungan. "
-        "Jangan sebut hal yang tidak ada. Format poin singkat maksimum 10 baris."
+    previous = current["summary_text"] if current else None
+    incremental = (
+        MEMORY_SUMMARY_INCREMENTAL
+        and bool(previous)
+        and not previous.startswith(SUMMARY_FAILED_PREFIX)
+        and bool(current["last_log_id"])
     )
 
-    summary_text = None
+    if incremental:
+        last_log_id = current["last_log_id"]
+        # Bounded count: stops scanning once the threshold is reached
+        cur = db.execute(
+            """
+            SELECT COUNT(*) AS c FROM (
+                SELECT 1 FROM llm_logs WHERE user_id = ? AND id > ? LIMIT ?
+            ) AS new_logs
+            """,
+            (user_id, last_log_id, cfg["summary_threshold"]),
+        )
+        if (cur.fetchone()["c"] or 0) < cfg["summary_threshold"]:
+            return None
+
+        cur = db.execute(
+            "SELECT id, role, content FROM llm_logs WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (user_id, last_log_id, cfg["max_source"]),
+        )
+        rows = cur.fetchall()
+        # The counter, as in full mode: a running sum would drift past it
+        # once logs are deleted, and full mode compares against the counter
+        interaction_count = count_user_logs(user_id)
+    else:
+        total_logs = count_user_logs(user_id)
+
+        last_count = current["interaction_count"] if current else 0
+        if current and total_logs - last_count < cfg["summary_threshold"]:
+            return None
+
+        cur = db.execute(
+            "SELECT id, role, content FROM llm_logs WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (user_id, cfg["max_source"]),
+        )
+        rows = list(reversed(cur.fetchall()))  # chronological
+        interaction_count = total_logs
+        previous = None
+
+    if not rows:
+        return None
+
+    return {
+        "previous_summary": previous,
+        "convo_text": _convo_text(rows),
+        "interaction_count": interaction_count,
+        "last_log_id": rows[-1]["id"],
+    }
+
+
+def _summary_messages(source: Dict) -> List[Dict]:
+    if source.get("previous_summary"):
+        return [
+            {"role": "system", "content": SUMMARY_UPDATE_PROMPT},
+            {
+                "role": "user",
+                "content": (
+                    f"RINGKASAN SEBELUMNYA:\n{source['previous_summary']}\n\n"
+                    f"PERCAKAPAN BARU:\n{source['convo_text']}"
+                ),
+            },
+        ]
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": source["convo_text"]},
+    ]
+
+
+def generate_summary(source: Dict, max_retries: int = OPENAI_MAX_RETRIES) -> str:
+    """Call the summarization model; raises the last error if every attempt fails."""
     last_error = None
-    for attempt in range(OPENAI_MAX_RETRIES + 1):
+    for attempt in range(max_retries + 1):
         try:
-            resp = client.chat.completions.create(
+            resp = get_openai_client().chat.completions.create(
                 model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": convo_text},
-                ],
+                messages=_summary_messages(source),
                 temperature=0.2,
                 timeout=OPENAI_TIMEOUT_SEC,
             )
-            summary_text = resp.choices[0].message.content.strip()
-            break
+            return resp.choices[0].message.content.strip()
         except Exception as e:
             last_error = e
+    raise last_error
 
-    if summary_text is None:
-        summary_text = f"(Gagal membuat ringkasan otomatis: {last_error})"
 
-    # Upsert summary
-    if current:
-        db.execute(
-            "UPDATE llm_memory_summary SET summary_text = ?, interaction_count = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?",
-            (summary_text, total_logs, user_id),
-        )
-    else:
-        db.execute(
-            "INSERT INTO llm_memory_summary (user_id, summary_text, interaction_count) VALUES (?, ?, ?)",
-            (user_id, summary_text, total_logs),
-        )
+def store_summary(user_id: int, summary_text: str, source: Dict) -> Dict:
+    """Upsert the summary and its high-water mark; never moves the mark back."""
+    db = get_db()
+    db.execute(
+        """
+        INSERT INTO llm_memory_summary (user_id, summary_text, interaction_count, last_log_id)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE
+        SET summary_text = EXCLUDED.summary_text,
+            interaction_count = EXCLUDED.interaction_count,
+            last_log_id = EXCLUDED.last_log_id,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE llm_memory_summary.last_log_id <= EXCLUDED.last_log_id
+        """,
+        (user_id, summary_text, source["interaction_count"], source["last_log_id"]),
+    )
     db.commit()
 
     wib = timezone(timedelta(hours=7))
     return {
         "summary_text": summary_text,
-        "interaction_count": total_logs,
+        "interaction_count": source["interaction_count"],
+        "last_log_id": source["last_log_id"],
         "updated_at": datetime.now(wib).isoformat(),
     }
 
 
-def build_memory_context(user_id: int) -> str:
-    """Compose memory context string combining summary + recent dialogue (respect config)."""
-    summary = get_memory_summary(user_id)
-    recent = get_recent_dialogue(user_id)
+def maybe_update_summary(user_id: int) -> Optional[Dict]:
+    """Regenerate summary if accumulated new interactions exceeds threshold (per-user configurable).
 
+    Runs inline; chat replies use summary_worker.schedule_summary() instead.
+    """
+    source = load_summary_source(user_id)
+    if source is None:
+        return get_memory_summary(user_id)
+
+    try:
+        summary_text = generate_summary(source)
+    except Exception as e:
+        if source["previous_summary"]:
+            # Keep the old summary; the same logs are retried next time
+            return get_memory_summary(user_id)
+        summary_text = f"{SUMMARY_FAILED_PREFIX}: {e})"
+
+    return store_summary(user_id, summary_text, source)
+
+
+def format_memory_context(summary: Optional[Dict], recent: List[Dict]) -> str:
+    """Render a memory summary + chronological recent dialogue for the prompt."""
     parts = []
     if summary and summary.get("summary_text"):
         parts.append("RINGKASAN MEMORI:")
@@ -196,11 +376,22 @@ def build_memory_context(user_id: int) -> str:
     return "\n".join(parts)
 
 
+def build_memory_context(user_id: int) -> str:
+    """Compose memory context string combining summary + recent dialogue (respect config)."""
+    return format_memory_context(get_memory_summary(user_id), get_recent_dialogue(user_id))
+
+
 __all__ = [
     "log_message",
+    "count_user_logs",
+    "delete_logs",
     "get_recent_dialogue",
     "get_memory_summary",
     "maybe_update_summary",
+    "load_summary_source",
+    "generate_summary",
+    "store_summary",
     "build_memory_context",
+    "format_memory_context",
     "get_effective_config",
 ]
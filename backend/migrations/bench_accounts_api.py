@@ -0,0 +1,106 @@
+"""Before/after latency benchmark for the /api/accounts balance query
+
+"before" replays the old per-account loop (11 SUM queries over transactions),
+"after" runs the single grouped query over transaction_rollups, and "cached"
+goes through get_account_balances() the way accounts_api does. Reuses the
+synthetic dataset of check_hot_path_indexes.py.
+
+Run against a scratch database, never production:
+    python migrations/bench_accounts_api.py --seed
+    python migrations/bench_accounts_api.py --iterations 200
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from flask import Flask  # noqa: E402
+
+from database import _connect, _PgAdapter, close_db  # noqa: E402
+from financial_context import (  # noqa: E402
+    DASHBOARD_ACCOUNTS,
+    _load_account_balances,
+    get_account_balances,
+    invalidate_financial_cache,
+)
+from migrations.check_hot_path_indexes import SEED_EMAIL_DOMAIN, seed  # noqa: E402
+from transaction_rollups import rebuild_rollups  # noqa: E402
+
+LEGACY_ACCOUNT_SQL = """SELECT SUM(CASE WHEN type = 'income' THEN amount
+                                   WHEN type = 'expense' THEN -amount
+                                   ELSE amount END) AS balance
+                FROM transactions WHERE user_id = %s AND account = %s"""
+
+
+def _legacy_balances(db, user_id):
+    """The pre-rollup accounts_api: one round trip per account"""
+    for acc in DASHBOARD_ACCOUNTS:
+        db.execute(LEGACY_ACCOUNT_SQL, (user_id, acc)).fetchone()
+
+
+def _timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean": statistics.fmean(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", action="store_true", help="insert seed data first")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    db = _PgAdapter(_connect())
+    try:
+        if args.seed:
+            seed(db.cursor(), args.users, args.rows)
+            print("📝 Rebuilding transaction rollups...")
+            rebuild_rollups(db)
+            db.commit()
+
+        row = db.execute(
+            "SELECT id FROM users WHERE email LIKE %s ORDER BY id LIMIT 1",
+            (f"%@{SEED_EMAIL_DOMAIN}",),
+        ).fetchone()
+        if not row:
+            print("❌ No seeded users found. Run with --seed first.")
+            return 1
+        user_id = row["id"]
+
+        before = _timed(lambda: _legacy_balances(db, user_id), args.iterations)
+    finally:
+        db.close()
+
+    app = Flask(__name__)
+    app.teardown_appcontext(close_db)
+    with app.app_context():
+        after = _timed(lambda: _load_account_balances(user_id), args.iterations)
+        invalidate_financial_cache(user_id)
+        cached = _timed(lambda: get_account_balances(user_id), args.iterations)
+
+    print(f"⏱️  /api/accounts balances, user {user_id}, {args.iterations} iterations")
+    for name, result in (("before", before), ("after", after), ("cached", cached)):
+        print(
+            f"   {name:7s} mean {result['mean']:8.2f} ms   "
+            f"p50 {result['p50']:8.2f} ms   p95 {result['p95']:8.2f} ms"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
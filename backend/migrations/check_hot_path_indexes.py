@@ -0,0 +1,236 @@
+"""EXPLAIN-based check that the dashboard hot queries use the hot path indexes
+
+Seeds a synthetic dataset (1M transactions spread over 1,000 users by default,
+plus llm_logs and sessions rows), runs EXPLAIN on every hot query for one of
+the seeded users and fails if the planner does not pick an index scan on the
+expected index.
+
+Run against a scratch database, never production:
+    python migrations/check_hot_path_indexes.py --seed
+    python migrations/check_hot_path_indexes.py            # reuse seeded data
+    python migrations/check_hot_path_indexes.py --cleanup  # remove seeded rows
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.environ.get("DATABASE_URL")
+if not DATABASE_URL:
+    raise ValueError("DATABASE_URL not set!")
+
+if DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+
+SEED_EMAIL_DOMAIN = "explain-check.local"
+ACCOUNTS = ["Cash", "BCA", "Maybank", "Seabank", "Gopay", "Ovo", "Jago"]
+CATEGORIES = ["Makan", "Transport", "Belanja", "Hiburan", "Tagihan", "Gaji"]
+
+INDEX_SCAN_NODES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+# (name, sql, acceptable indexes). %(uid)s is bound to a seeded user id.
+HOT_QUERIES = [
+    (
+        "get_month_summary",
+        """SELECT SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END),
+                  SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END)
+           FROM transactions
+           WHERE user_id = %(uid)s AND date >= '2025-06-01' AND date < '2025-07-01'""",
+        {"idx_transactions_user_date"},
+    ),
+    (
+        "transactions_api list",
+        """SELECT id, date, type, category, description, amount, account, created_at
+           FROM transactions WHERE user_id = %(uid)s
+           ORDER BY date DESC, id DESC LIMIT 50""",
+        {"idx_transactions_user_date"},
+    ),
+    (
+        "balance_api (account)",
+        """SELECT SUM(CASE WHEN type = 'income' THEN amount
+                           WHEN type = 'expense' THEN -amount ELSE 0 END)
+           FROM transactions
+           WHERE user_id = %(uid)s AND type IN ('income', 'expense') AND account = 'BCA'""",
+        {"idx_transactions_user_account", "idx_transactions_user_type_category"},
+    ),
+    (
+        "accounts_api",
+        """SELECT account, SUM(amount) FROM transactions
+           WHERE user_id = %(uid)s GROUP BY account""",
+        {
+            "idx_transactions_user_account",
+            "idx_transactions_user_date",
+            "idx_transactions_user_type_category",
+        },
+    ),
+    (
+        "_dedupe_recent_transaction",
+        """SELECT id FROM transactions
+           WHERE user_id = %(uid)s AND date = '2025-06-15' AND type = 'expense'
+             AND category = 'Makan' AND amount = 25000 AND account = 'Cash'
+             AND created_at >= CURRENT_TIMESTAMP - make_interval(secs => 5)
+           ORDER BY id DESC LIMIT 1""",
+        {
+            "idx_transactions_user_date",
+            "idx_transactions_user_account",
+            "idx_transactions_user_type_category",
+        },
+    ),
+    (
+        "suggest_category_from_history",
+        """SELECT category, description, COUNT(*) AS freq
+           FROM transactions
+           WHERE user_id = %(uid)s AND type = 'expense' AND description IS NOT NULL
+           GROUP BY category, description ORDER BY freq DESC LIMIT 50""",
+        {"idx_transactions_user_type_category"},
+    ),
+    (
+        "get_recent_dialogue",
+        """SELECT role, content, created_at FROM llm_logs
+           WHERE user_id = %(uid)s ORDER BY id DESC LIMIT 8""",
+        {"idx_llm_logs_user_id"},
+    ),
+    (
+        "expired sessions",
+        """SELECT id FROM sessions WHERE expires_at < '2000-01-02'""",
+        {"idx_sessions_expires"},
+    ),
+]
+
+
+def seed(cur, users, rows):
+    """Insert synthetic users, transactions, llm_logs and sessions"""
+    print(f"🌱 Seeding {users} users and {rows} transactions...")
+    cur.execute(
+        """INSERT INTO users (name, email, password_hash)
+           SELECT 'Seed ' || n, 'seed-' || n || '@' || %s, 'x'
+           FROM generate_series(1, %s) AS n
+           ON CONFLICT (email) DO NOTHING""",
+        (SEED_EMAIL_DOMAIN, users),
+    )
+    cur.execute(
+        """INSERT INTO transactions (user_id, date, type, category, description, amount, account)
+           SELECT u.ids[1 + (n %% array_length(u.ids, 1))],
+                  DATE '2022-01-01' + (n %% 1400),
+                  CASE WHEN n %% 5 = 0 THEN 'income' ELSE 'expense' END,
+                  (%s::text[])[1 + (n %% %s)],
+                  'seed transaksi ' || (n %% 97),
+                  1000 + (n %% 500) * 1000,
+                  (%s::text[])[1 + (n %% %s)]
+           FROM generate_series(1, %s) AS n,
+                (SELECT array_agg(id) AS ids FROM users WHERE email LIKE %s) AS u""",
+        (
+            CATEGORIES,
+            len(CATEGORIES),
+            ACCOUNTS,
+            len(ACCOUNTS),
+            rows,
+            f"%@{SEED_EMAIL_DOMAIN}",
+        ),
+    )
+    cur.execute(
+        """INSERT INTO llm_logs (user_id, role, content)
+           SELECT u.ids[1 + (n %% array_length(u.ids, 1))],
+                  CASE WHEN n %% 2 = 0 THEN 'user' ELSE 'assistant' END,
+                  'seed message ' || n
+           FROM generate_series(1, %s) AS n,
+                (SELECT array_agg(id) AS ids FROM users WHERE email LIKE %s) AS u""",
+        (rows // 5, f"%@{SEED_EMAIL_DOMAIN}"),
+    )
+    cur.execute(
+        """INSERT INTO sessions (user_id, session_token, expires_at)
+           SELECT u.ids[1 + (n %% array_length(u.ids, 1))],
+                  'seed-' || md5(random()::text || n),
+                  TIMESTAMP '2030-01-01' + (n || ' minutes')::interval
+           FROM generate_series(1, %s) AS n,
+                (SELECT array_agg(id) AS ids FROM users WHERE email LIKE %s) AS u""",
+        (rows // 10, f"%@{SEED_EMAIL_DOMAIN}"),
+    )
+    for table in ("users", "transactions", "llm_logs", "sessions"):
+        cur.execute(f"ANALYZE {table}")
+    print("✅ Seed data ready")
+
+
+def cleanup(cur):
+    """Delete everything created by seed()"""
+    pattern = f"%@{SEED_EMAIL_DOMAIN}"
+    for table in ("sessions", "llm_logs", "transaction_rollups", "transactions"):
+        cur.execute(
+            f"DELETE FROM {table} WHERE user_id IN (SELECT id FROM users WHERE email LIKE %s)",
+            (pattern,),
+        )
+    cur.execute("DELETE FROM users WHERE email LIKE %s", (pattern,))
+    print("🧹 Seed data removed")
+
+
+def _index_nodes(plan):
+    """Yield (node_type, index_name, relation) for every node in a plan tree"""
+    yield plan.get("Node Type"), plan.get("Index Name"), plan.get("Relation Name")
+    for child in plan.get("Plans", []):
+        yield from _index_nodes(child)
+
+
+def check(cur):
+    """EXPLAIN each hot query and report whether it hits an expected index"""
+    cur.execute(
+        "SELECT id FROM users WHERE email LIKE %s ORDER BY id LIMIT 1",
+        (f"%@{SEED_EMAIL_DOMAIN}",),
+    )
+    row = cur.fetchone()
+    if not row:
+        print("❌ No seeded users found. Run with --seed first.")
+        return False
+    uid = row[0]
+
+    all_ok = True
+    for name, sql, expected in HOT_QUERIES:
+        cur.execute("EXPLAIN (FORMAT JSON) " + sql, {"uid": uid})
+        plan = cur.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        nodes = list(_index_nodes(plan[0]["Plan"]))
+        used = {idx for node, idx, _ in nodes if node in INDEX_SCAN_NODES and idx}
+        seq_scans = {rel for node, _, rel in nodes if node == "Seq Scan"}
+
+        ok = bool(used & expected) and not seq_scans
+        all_ok = all_ok and ok
+        status = "✅" if ok else "❌"
+        detail = ", ".join(sorted(used)) or "no index"
+        if seq_scans:
+            detail += f"; Seq Scan on {', '.join(sorted(seq_scans))}"
+        print(f"{status} {name:32s} {detail}")
+
+    return all_ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", action="store_true", help="insert seed data first")
+    parser.add_argument("--cleanup", action="store_true", help="remove seed data")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(DATABASE_URL)
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        if args.cleanup:
+            cleanup(cur)
+            return 0
+        if args.seed:
+            seed(cur, args.users, args.rows)
+        return 0 if check(cur) else 1
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
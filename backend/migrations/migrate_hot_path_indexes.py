@@ -0,0 +1,122 @@
+"""Migration: composite indexes for transaction, llm_logs and sessions hot paths
+
+Every dashboard query filters transactions by user_id plus date / account /
+type / category, but the table had no index at all. Indexes are built with
+CREATE INDEX CONCURRENTLY so the migration can run against a live database
+without blocking writes. Run it before deploying the matching schema.sql.
+
+Usage:
+    python migrations/migrate_hot_path_indexes.py
+"""
+
+import os
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.environ.get("DATABASE_URL")
+if not DATABASE_URL:
+    raise ValueError("DATABASE_URL not set!")
+
+# Convert postgres:// to postgresql://
+if DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+
+MIGRATION_VERSION = "0001_hot_path_indexes"
+
+# CONCURRENTLY cannot run inside a transaction block, so each statement is
+# executed on its own in autocommit mode.
+MIGRATION_STATEMENTS = [
+    # Month summaries, recent transactions, listing ORDER BY date DESC, id DESC
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_user_date
+       ON transactions(user_id, date DESC, id DESC)""",
+    # /api/accounts, /api/balance?account=, transfer balance checks
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_user_account
+       ON transactions(user_id, account)""",
+    # suggest_category_from_history and per-type aggregates
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_user_type_category
+       ON transactions(user_id, type, category)""",
+    # Recent dialogue / summary source (ORDER BY id DESC LIMIT n)
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_llm_logs_user_id
+       ON llm_logs(user_id, id DESC)""",
+    # Superseded by idx_llm_logs_user_id (same leading column)
+    "DROP INDEX CONCURRENTLY IF EXISTS idx_llm_logs_user",
+    # Expired session cleanup
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sessions_expires
+       ON sessions(expires_at)""",
+]
+
+INDEX_NAMES = [
+    "idx_transactions_user_date",
+    "idx_transactions_user_account",
+    "idx_transactions_user_type_category",
+    "idx_llm_logs_user_id",
+    "idx_sessions_expires",
+]
+
+VERSION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version TEXT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def apply_migration():
+    """Apply migration to Neon PostgreSQL"""
+    conn = None
+    try:
+        print("🔗 Connecting to Neon PostgreSQL...")
+        conn = psycopg2.connect(DATABASE_URL)
+        conn.autocommit = True
+        cur = conn.cursor()
+
+        cur.execute(VERSION_TABLE_SQL)
+        cur.execute(
+            "SELECT 1 FROM schema_migrations WHERE version = %s",
+            (MIGRATION_VERSION,),
+        )
+        if cur.fetchone():
+            print(f"ℹ️  Migration {MIGRATION_VERSION} already applied, skipping...")
+            return
+
+        for statement in MIGRATION_STATEMENTS:
+            print(f"📝 {' '.join(statement.split())}")
+            cur.execute(statement)
+
+        # A failed concurrent build leaves an INVALID index that IF NOT EXISTS
+        # would silently keep on the next run
+        cur.execute(
+            """SELECT c.relname FROM pg_index i
+               JOIN pg_class c ON c.oid = i.indexrelid
+               WHERE NOT i.indisvalid AND c.relname = ANY(%s)""",
+            (INDEX_NAMES,),
+        )
+        invalid = [row[0] for row in cur.fetchall()]
+        if invalid:
+            raise RuntimeError(
+                f"Invalid indexes left by an interrupted build: {', '.join(invalid)}. "
+                "Drop them and run this migration again."
+            )
+
+        cur.execute(
+            "INSERT INTO schema_migrations (version) VALUES (%s)",
+            (MIGRATION_VERSION,),
+        )
+
+        print(f"✅ Migration {MIGRATION_VERSION} applied successfully!")
+        print(f"   - Indexes: {', '.join(INDEX_NAMES)}")
+
+        cur.close()
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        raise
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+if __name__ == "__main__":
+    apply_migration()
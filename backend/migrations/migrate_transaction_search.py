@@ -0,0 +1,111 @@
+"""Migration: full-text + trigram search over transaction descriptions
+
+Adds a generated `search_vector` column (to_tsvector('simple', description ||
+category)) with a GIN index, and a pg_trgm GIN index on description for
+substring / typo matches. The 'simple' configuration is used because
+descriptions mix Indonesian and English and Postgres ships no Indonesian
+stemmer.
+
+Adding the STORED generated column rewrites the transactions table under an
+exclusive lock, so run this in a quiet period. The indexes are then built
+CONCURRENTLY. Run it before deploying the matching schema.sql.
+
+Usage:
+    python migrations/migrate_transaction_search.py
+"""
+
+import os
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.environ.get("DATABASE_URL")
+if not DATABASE_URL:
+    raise ValueError("DATABASE_URL not set!")
+
+# Convert postgres:// to postgresql://
+if DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+
+MIGRATION_VERSION = "0003_transaction_search"
+
+# Executed one by one in autocommit mode (CONCURRENTLY needs it)
+MIGRATION_STATEMENTS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """ALTER TABLE transactions ADD COLUMN IF NOT EXISTS search_vector tsvector
+       GENERATED ALWAYS AS (
+           to_tsvector('simple', coalesce(description, '') || ' ' || coalesce(category, ''))
+       ) STORED""",
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_search
+       ON transactions USING GIN (search_vector)""",
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_description_trgm
+       ON transactions USING GIN (description gin_trgm_ops)""",
+    "ANALYZE transactions",
+]
+
+INDEX_NAMES = ["idx_transactions_search", "idx_transactions_description_trgm"]
+
+VERSION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version TEXT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def apply_migration():
+    """Apply migration to Neon PostgreSQL"""
+    conn = None
+    try:
+        print("🔗 Connecting to Neon PostgreSQL...")
+        conn = psycopg2.connect(DATABASE_URL)
+        conn.autocommit = True
+        cur = conn.cursor()
+
+        cur.execute(VERSION_TABLE_SQL)
+        cur.execute(
+            "SELECT 1 FROM schema_migrations WHERE version = %s",
+            (MIGRATION_VERSION,),
+        )
+        if cur.fetchone():
+            print(f"ℹ️  Migration {MIGRATION_VERSION} already applied, skipping...")
+            return
+
+        for statement in MIGRATION_STATEMENTS:
+            print(f"📝 {' '.join(statement.split())}")
+            cur.execute(statement)
+
+        cur.execute(
+            """SELECT c.relname FROM pg_index i
+               JOIN pg_class c ON c.oid = i.indexrelid
+               WHERE NOT i.indisvalid AND c.relname = ANY(%s)""",
+            (INDEX_NAMES,),
+        )
+        invalid = [row[0] for row in cur.fetchall()]
+        if invalid:
+            raise RuntimeError(
+                f"Invalid indexes left by an interrupted build: {', '.join(invalid)}. "
+                "Drop them and run this migration again."
+            )
+
+        cur.execute(
+            "INSERT INTO schema_migrations (version) VALUES (%s)",
+            (MIGRATION_VERSION,),
+        )
+
+        print(f"✅ Migration {MIGRATION_VERSION} applied successfully!")
+        print(f"   - Indexes: {', '.join(INDEX_NAMES)}")
+
+        cur.close()
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        raise
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+if __name__ == "__main__":
+    apply_migration()
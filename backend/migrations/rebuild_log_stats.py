@@ -0,0 +1,119 @@
+"""Create and backfill the chat message counters
+
+Recomputes llm_log_stats (per user) and chat_sessions.message_count /
+last_message_at from llm_logs. startup.sh runs it with --if-needed, so the
+initial backfill happens on the first deploy of the code that maintains the
+counters in memory.log_message; it can be re-run at any time to repair
+drift. llm_logs is locked against writes while it runs.
+
+Usage:
+    python migrations/rebuild_log_stats.py              # all users
+    python migrations/rebuild_log_stats.py --user 42    # one user
+    python migrations/rebuild_log_stats.py --if-needed  # first deploy only
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import _connect, _PgAdapter  # noqa: E402
+
+MIGRATION_VERSION = "0004_log_stats"
+
+SCHEMA_STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS llm_log_stats (
+        user_id INTEGER PRIMARY KEY,
+        message_count BIGINT NOT NULL DEFAULT 0,
+        last_message_at TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )""",
+    "ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP",
+]
+
+VERSION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version TEXT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def rebuild_log_stats(db, user_id=None):
+    """Recompute the counters; returns (users, sessions) rows written"""
+    where, params = ("WHERE user_id = %s", (user_id,)) if user_id else ("", ())
+
+    # Block log writers so no increment lands between count and write
+    db.execute("LOCK TABLE llm_logs IN SHARE MODE")
+    db.execute(f"DELETE FROM llm_log_stats {where}", params)
+    users = db.execute(
+        f"""INSERT INTO llm_log_stats (user_id, message_count, last_message_at)
+            SELECT user_id, COUNT(*), MAX(created_at) FROM llm_logs {where}
+            GROUP BY user_id""",
+        params,
+    ).rowcount
+    sessions = db.execute(
+        f"""UPDATE chat_sessions s
+            SET message_count = COALESCE(c.n, 0), last_message_at = c.last_at
+            FROM chat_sessions s2
+            LEFT JOIN (
+                SELECT session_id, COUNT(*) AS n, MAX(created_at) AS last_at
+                FROM llm_logs {where} GROUP BY session_id
+            ) c ON c.session_id = s2.id
+            WHERE s.id = s2.id {"AND s.user_id = %s" if user_id else ""}""",
+        params * 2,
+    ).rowcount
+    return users, sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild chat message counters")
+    parser.add_argument("--user", type=int, help="only rebuild this user id")
+    parser.add_argument(
+        "--if-needed",
+        action="store_true",
+        help="skip if the initial backfill was already recorded",
+    )
+    args = parser.parse_args()
+
+    db = _PgAdapter(_connect())
+    try:
+        for statement in SCHEMA_STATEMENTS:
+            db.execute(statement)
+        db.execute(VERSION_TABLE_SQL)
+        db.commit()
+
+        if args.if_needed:
+            row = db.execute(
+                "SELECT 1 FROM schema_migrations WHERE version = %s",
+                (MIGRATION_VERSION,),
+            ).fetchone()
+            if row:
+                print(f"ℹ️  {MIGRATION_VERSION} already applied, skipping...")
+                return 0
+
+        scope = f"user {args.user}" if args.user else "all users"
+        print(f"📝 Rebuilding chat message counters for {scope}...")
+        users, sessions = rebuild_log_stats(db, args.user)
+
+        if args.user is None:
+            db.execute(
+                "INSERT INTO schema_migrations (version) VALUES (%s) ON CONFLICT DO NOTHING",
+                (MIGRATION_VERSION,),
+            )
+        db.commit()
+        print(f"✅ Counters rebuilt: {users} users, {sessions} sessions")
+        return 0
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Counter rebuild failed: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Create and backfill the transaction_rollups table
+
+Recomputes the monthly rollups from raw transactions. Safe to run while the
+app is serving traffic: writers block on the table lock for the duration of
+the rebuild and then apply their deltas on top of the rebuilt rows.
+
+Usage:
+    python migrations/rebuild_transaction_rollups.py              # all users
+    python migrations/rebuild_transaction_rollups.py --user 42    # one user
+    python migrations/rebuild_transaction_rollups.py --if-needed  # first deploy only
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import _connect, _PgAdapter  # noqa: E402
+from transaction_rollups import rebuild_rollups  # noqa: E402
+
+MIGRATION_VERSION = "0002_transaction_rollups"
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS transaction_rollups (
+    user_id INTEGER NOT NULL,
+    month DATE NOT NULL,
+    account TEXT NOT NULL DEFAULT '',
+    type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    total_amount NUMERIC NOT NULL DEFAULT 0,
+    tx_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, month, account, type, category),
+    FOREIGN KEY (user_id) REFERENCES users(id)
+)
+"""
+
+VERSION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version TEXT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild transaction rollups")
+    parser.add_argument("--user", type=int, help="only rebuild this user id")
+    parser.add_argument(
+        "--if-needed",
+        action="store_true",
+        help="skip if the initial backfill was already recorded",
+    )
+    args = parser.parse_args()
+
+    db = _PgAdapter(_connect())
+    try:
+        db.execute(CREATE_TABLE_SQL)
+        db.execute(VERSION_TABLE_SQL)
+        db.commit()
+
+        if args.if_needed:
+            row = db.execute(
+                "SELECT 1 FROM schema_migrations WHERE version = %s",
+                (MIGRATION_VERSION,),
+            ).fetchone()
+            if row:
+                print(f"ℹ️  {MIGRATION_VERSION} already applied, skipping...")
+                return 0
+
+        scope = f"user {args.user}" if args.user else "all users"
+        print(f"📝 Rebuilding transaction rollups for {scope}...")
+        buckets = rebuild_rollups(db, args.user)
+
+        if args.user is None:
+            db.execute(
+                "INSERT INTO schema_migrations (version) VALUES (%s) ON CONFLICT DO NOTHING",
+                (MIGRATION_VERSION,),
+            )
+        db.commit()
+        print(f"✅ Rollups rebuilt: {buckets} buckets")
+        return 0
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Rollup rebuild failed: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,8 @@ from memory import (
     SUMMARY_THRESHOLD,
     MAX_LOG_CONTEXT,
     MAX_LOG_SOURCE,
+    count_user_logs,
+    delete_logs,
     get_effective_config,
     get_memory_summary,
     get_recent_dialogue,
@@ -28,13 +30,7 @@ def memory_summary_api():
     else:
         summary = get_memory_summary(user_id) or maybe_update_summary(user_id)
 
-    db = get_db()
-    total_logs = (
-        db.execute(
-            "SELECT COUNT(*) AS c FROM llm_logs WHERE user_id = ?", (user_id,)
-        ).fetchone()["c"]
-        or 0
-    )
+    total_logs = count_user_logs(user_id)
     recent = get_recent_dialogue(user_id)
     cfg = get_effective_config(user_id)
 
@@ -58,13 +54,8 @@ def memory_clear_api():
     db = get_db()
 
     try:
-        count_row = db.execute(
-            "SELECT COUNT(*) AS c FROM llm_logs WHERE user_id = ?", (user_id,)
-        ).fetchone()
-        logs_count = count_row["c"] if count_row else 0
-
         db.execute("DELETE FROM llm_log_embeddings WHERE user_id = ?", (user_id,))
-        db.execute("DELETE FROM llm_logs WHERE user_id = ?", (user_id,))
+        logs_count = delete_logs(db, user_id)
         db.execute("DELETE FROM llm_memory_summary WHERE user_id = ?", (user_id,))
 
         db.commit()
@@ -97,9 +88,7 @@ def memory_delete_log_api(log_id):
             return jsonify({"error": "Log tidak ditemukan atau bukan milik Anda"}), 404
 
         db.execute("DELETE FROM llm_log_embeddings WHERE log_id = ?", (log_id,))
-        db.execute(
-            "DELETE FROM llm_logs WHERE id = ? AND user_id = ?", (log_id, user_id)
-        )
+        delete_logs(db, user_id, "id = ?", (log_id,))
 
         db.commit()
 
@@ -154,12 +143,15 @@ def memory_logs_api():
             for r in cur.fetchall()
         ]
 
-        count_params = params[: len(where)]
-        count_row = db.execute(
-            f"SELECT COUNT(*) AS c FROM llm_logs WHERE {' AND '.join(where)}",
-            count_params,
-        ).fetchone()
-        total_count = count_row["c"] if count_row else 0
+        if since or until:
+            count_params = params[: len(where)]
+            count_row = db.execute(
+                f"SELECT COUNT(*) AS c FROM llm_logs WHERE {' AND '.join(where)}",
+                count_params,
+            ).fetchone()
+            total_count = count_row["c"] if count_row else 0
+        else:
+            total_count = count_user_logs(user_id)
 
         return jsonify(
             {"logs": logs, "total": total_count, "limit": limit, "offset": offset}
@@ -172,22 +164,12 @@ def memory_logs_api():
 
     if log_ids:
         placeholders = ",".join(["?"] * len(log_ids))
-        params = log_ids + [user_id]
-
-        count_row = db.execute(
-            f"SELECT COUNT(*) AS c FROM llm_logs WHERE id IN ({placeholders}) AND user_id = ?",
-            params,
-        ).fetchone()
-        count = count_row["c"] if count_row else 0
 
         db.execute(
             f"DELETE FROM llm_log_embeddings WHERE log_id IN ({placeholders})",
             log_ids,
         )
-        db.execute(
-            f"DELETE FROM llm_logs WHERE id IN ({placeholders}) AND user_id = ?",
-            params,
-        )
+        count = delete_logs(db, user_id, f"id IN ({placeholders})", log_ids)
     else:
         where = ["user_id = ?"]
         params = [user_id]
@@ -199,20 +181,11 @@ def memory_logs_api():
             where.append("created_at <= ?")
             params.append(until)
 
-        count_row = db.execute(
-            f"SELECT COUNT(*) AS c FROM llm_logs WHERE {' AND '.join(where)}",
-            params,
-        ).fetchone()
-        count = count_row["c"] if count_row else 0
-
         db.execute(
             f"DELETE FROM llm_log_embeddings WHERE log_id IN (SELECT id FROM llm_logs WHERE {' AND '.join(where)})",
             params,
         )
-        db.execute(
-            f"DELETE FROM llm_logs WHERE {' AND '.join(where)}",
-            params,
-        )
+        count = delete_logs(db, user_id, " AND ".join(where[1:]) or "TRUE", params[1:])
 
     db.commit()
 
@@ -227,15 +200,12 @@ def sessions_api():
     db = get_db()
 
     if request.method == "GET":
+        # Counters are maintained by memory.log_message / delete_logs
         cur = db.execute(
-            """SELECT s.id, s.title, s.created_at, s.updated_at,
-                      COUNT(l.id) as message_count,
-                      MAX(l.created_at) as last_message_at
-               FROM chat_sessions s
-               LEFT JOIN llm_logs l ON s.id = l.session_id
-               WHERE s.user_id = ?
-               GROUP BY s.id
-               ORDER BY s.updated_at DESC""",
+            """SELECT id, title, created_at, updated_at, message_count, last_message_at
+               FROM chat_sessions
+               WHERE user_id = ?
+               ORDER BY updated_at DESC""",
             (user_id,),
         )
         sessions = [
@@ -288,7 +258,7 @@ def session_detail_api(session_id):
     db = get_db()
 
     cur = db.execute(
-        "SELECT id, title, created_at, updated_at FROM chat_sessions WHERE id = ? AND user_id = ?",
+        "SELECT id, title, created_at, updated_at, message_count FROM chat_sessions WHERE id = ? AND user_id = ?",
         (session_id, user_id),
     )
     session = cur.fetchone()
@@ -345,11 +315,7 @@ def session_detail_api(session_id):
             extra={"extra_data": {"session_id": session_id, "user_id": user_id}},
         )
 
-        count_row = db.execute(
-            "SELECT COUNT(*) AS c FROM llm_logs WHERE session_id = ?",
-            (session_id,),
-        ).fetchone()
-        logs_count = count_row["c"] if count_row else 0
+        logs_count = session["message_count"] or 0
         logger.debug(
             "Logs to delete",
             extra={"extra_data": {"session_id": session_id, "count": logs_count}},
@@ -366,6 +332,10 @@ def session_detail_api(session_id):
             extra={"extra_data": {"session_id": session_id, "count": emb_count}},
         )
 
+        # Logs would cascade with the session; delete them first so the
+        # user's message counter follows
+        logs_count = delete_logs(db, user_id, "session_id = ?", (session_id,))
+
         logger.debug("Executing DELETE FROM chat_sessions")
         cursor = db.execute(
             "DELETE FROM chat_sessions WHERE id = ? AND user_id = ?",
@@ -453,19 +423,31 @@ def sync_sessions_api():
         if old_session:
             old_session_id = old_session["id"]
         else:
-            db.execute(
+            old_session_id = db.execute(
                 """
                 INSERT INTO chat_sessions (user_id, title, created_at, updated_at)
                 VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                RETURNING id
             """,
                 (user_id, "Old Messages"),
-            )
-            old_session_id = db.execute("SELECT last_insert_rowid()").fetchone()[0]
+            ).fetchone()["id"]
 
         db.execute(
             "UPDATE llm_logs SET session_id = ? WHERE user_id = ? AND session_id IS NULL",
             (old_session_id, user_id),
         )
+        db.execute(
+            """
+            UPDATE chat_sessions
+            SET message_count = message_count + ?,
+                last_message_at = (
+                    SELECT created_at FROM llm_logs
+                    WHERE session_id = ? ORDER BY id DESC LIMIT 1
+                )
+            WHERE id = ?
+            """,
+            (orphaned_logs, old_session_id, old_session_id),
+        )
 
     db.commit()
 
@@ -13,6 +13,8 @@ CREATE TABLE IF NOT EXISTS users (
     -- 'google' or 'openai'
     ai_model TEXT DEFAULT 'gemini-2.0-flash-lite',
     -- default model
+    data_version BIGINT NOT NULL DEFAULT 0,
+    -- naik setiap transaksi user berubah (kunci cache lintas worker)
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -63,6 +65,21 @@ CREATE TABLE IF NOT EXISTS transactions (
     FOREIGN KEY (user_id) REFERENCES users(id)
 );
 
+-- Rollup bulanan transaksi (diupdate di DB transaction yang sama dengan setiap
+-- insert/update/delete transaksi; rebuild: migrations/rebuild_transaction_rollups.py)
+CREATE TABLE IF NOT EXISTS transaction_rollups (
+    user_id INTEGER NOT NULL,
+    month DATE NOT NULL,
+    -- tanggal 1 di bulan tersebut
+    account TEXT NOT NULL DEFAULT '',
+    type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    total_amount NUMERIC NOT NULL DEFAULT 0,
+    tx_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, month, account, type, category),
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
 -- Tabel savings goals untuk tracking target tabungan
 CREATE TABLE IF NOT EXISTS savings_goals (
     id SERIAL PRIMARY KEY,
@@ -116,6 +133,14 @@ CREATE TABLE IF NOT EXISTS llm_logs (
     FOREIGN KEY (session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE
 );
 
+-- Counter pesan per user, di-update oleh memory.log_message (ganti COUNT(*) atas llm_logs)
+CREATE TABLE IF NOT EXISTS llm_log_stats (
+    user_id INTEGER PRIMARY KEY,
+    message_count BIGINT NOT NULL DEFAULT 0,
+    last_message_at TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
 -- Ringkasan terkompres preferensi / pola finansial per user
 CREATE TABLE IF NOT EXISTS llm_memory_summary (
     user_id INTEGER PRIMARY KEY,
@@ -177,7 +202,7 @@ CREATE TABLE IF NOT EXISTS conversation_state (
 );
 
 -- Index untuk mempercepat pencarian berdasarkan user dan session
-CREATE INDEX IF NOT EXISTS idx_llm_logs_user ON llm_logs(user_id);
+CREATE INDEX IF NOT EXISTS idx_llm_logs_user_id ON llm_logs(user_id, id DESC);
 
 CREATE INDEX IF NOT EXISTS idx_llm_logs_session ON llm_logs(session_id);
 
@@ -189,4 +214,62 @@ CREATE INDEX IF NOT EXISTS idx_chat_sessions_user ON chat_sessions(user_id);
 
 CREATE INDEX IF NOT EXISTS idx_llm_log_embeddings_user ON llm_log_embeddings(user_id);
 
-CREATE INDEX IF NOT EXISTS idx_llm_log_embeddings_log ON llm_log_embeddings(log_id);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_llm_log_embeddings_log ON llm_log_embeddings(log_id);
+
+-- Index transaksi untuk query dashboard (lihat migrations/migrate_hot_path_indexes.py)
+CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions(user_id, date DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_user_account ON transactions(user_id, account);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_user_type_category ON transactions(user_id, type, category);
+
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at);
+
+-- Pencarian transaksi: full-text (config 'simple', cocok untuk campuran ID/EN)
+-- dan trigram untuk substring/typo (lihat migrations/migrate_transaction_search.py)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('simple', coalesce(description, '') || ' ' || coalesce(category, ''))
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_transactions_search ON transactions USING GIN (search_vector);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_description_trgm ON transactions USING GIN (description gin_trgm_ops);
+
+-- High-water mark ringkasan memori: id log terakhir yang sudah diringkas,
+-- refresh berikutnya hanya mengirim log setelah id ini
+ALTER TABLE llm_memory_summary ADD COLUMN IF NOT EXISTS last_log_id INTEGER NOT NULL DEFAULT 0;
+
+-- Counter pesan per session, di-update oleh memory.log_message
+-- (lihat migrations/rebuild_log_stats.py untuk backfill)
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP;
+
+-- Idempotency-Key untuk write transaksi (REST dan aksi LLM): klaim key dan
+-- simpan response dalam DB transaction yang sama dengan write-nya
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id INTEGER NOT NULL,
+    idem_key TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    fingerprint TEXT,
+    status_code INTEGER,
+    response TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, idem_key),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys(created_at);
+
+-- Log perubahan autentikasi (logout, ganti password/role, hapus akun). Setiap
+-- worker membaca event setelah version terakhirnya untuk membuang cache sesi
+CREATE TABLE IF NOT EXISTS auth_events (
+    version BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_auth_events_created ON auth_events(created_at);
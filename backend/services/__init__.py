@@ -1,8 +1,9 @@
 """
 Services Module - Business logic and service layer
-Includes conversation state management
+Includes conversation state management and chat context assembly
 """
 
 from .conversation_state_manager import ConversationStateManager
+from .chat_context import ChatContext, assemble_chat_context
 
-__all__ = ["ConversationStateManager"]
+__all__ = ["ConversationStateManager", "ChatContext", "assemble_chat_context"]
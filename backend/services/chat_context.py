@@ -0,0 +1,205 @@
+"""Chat context assembly - everything chat_api needs before the LLM call
+
+Session creation, logging the user's message, the user's name, memory
+config/summary/recent dialogue, the active conversation state and the month's
+financial summary + recent transactions are gathered in ONE statement (data
+modifying CTEs + scalar subqueries), then committed. That replaces roughly ten
+sequential round trips to Neon with two (statement + commit).
+
+A single batched statement is used instead of running the parts on threads:
+each gunicorn worker has at most DB_POOL_MAX connections for its threads, and
+fanning one request out over several connections would starve the others.
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from core import get_logger, latency
+from database import get_db
+from financial_context import format_financial_context, month_date_range
+from memory import MAX_LOG_CONTEXT, format_memory_context
+from services.conversation_state_manager import ConversationStateManager
+
+logger = get_logger(__name__)
+
+DEFAULT_USER_NAME = "Teman"
+RECENT_TRANSACTIONS = 20
+
+_CONTEXT_SQL = """
+WITH new_session AS (
+    INSERT INTO chat_sessions (user_id, title, message_count, last_message_at)
+    SELECT %(user_id)s, 'New Chat', 1, CURRENT_TIMESTAMP
+    WHERE %(session_id)s::integer IS NULL
+    RETURNING id
+), sess AS (
+    SELECT COALESCE(%(session_id)s::integer, (SELECT id FROM new_session)) AS id
+), logged AS (
+    INSERT INTO llm_logs (user_id, session_id, role, content)
+    SELECT %(user_id)s, sess.id, 'user', %(message)s FROM sess
+    RETURNING id, session_id
+), session_stats AS (
+    -- Same counters as memory.log_message; a new session starts at 1
+    UPDATE chat_sessions
+    SET message_count = message_count + 1, last_message_at = CURRENT_TIMESTAMP
+    WHERE id = %(session_id)s::integer AND user_id = %(user_id)s
+), user_stats AS (
+    INSERT INTO llm_log_stats (user_id, message_count, last_message_at)
+    VALUES (%(user_id)s, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id) DO UPDATE
+    SET message_count = llm_log_stats.message_count + 1,
+        last_message_at = EXCLUDED.last_message_at
+), expired AS (
+    DELETE FROM conversation_state
+    WHERE session_id = (SELECT id FROM sess) AND user_id = %(user_id)s
+      AND expires_at < CURRENT_TIMESTAMP
+), cfg AS (
+    SELECT summary_threshold, max_log_context, max_source
+    FROM llm_memory_config WHERE user_id = %(user_id)s
+)
+SELECT
+    (SELECT session_id FROM logged) AS session_id,
+    u.name,
+    u.data_version,
+    (SELECT row_to_json(s) FROM (
+        SELECT summary_text, interaction_count, updated_at
+        FROM llm_memory_summary WHERE user_id = u.id
+    ) s) AS memory_summary,
+    (SELECT COALESCE(NULLIF(max_log_context, 0), %(max_log_context)s) FROM cfg)
+        AS max_log_context,
+    (SELECT COALESCE(json_agg(d ORDER BY d.id), '[]'::json) FROM (
+        SELECT id, role, content FROM llm_logs
+        WHERE user_id = u.id
+        ORDER BY id DESC
+        LIMIT COALESCE((SELECT NULLIF(max_log_context, 0) FROM cfg), %(max_log_context)s)
+    ) d) AS recent_dialogue,
+    (SELECT row_to_json(st) FROM (
+        SELECT id, user_id, intent, state, partial_data, expires_at
+        FROM conversation_state
+        WHERE session_id = (SELECT id FROM sess) AND user_id = %(user_id)s
+          AND expires_at > CURRENT_TIMESTAMP
+        ORDER BY id DESC
+        LIMIT 1
+    ) st) AS session_state,
+    (SELECT json_build_object(
+        'total_income', COALESCE(SUM(total_amount) FILTER (WHERE type = 'income'), 0),
+        'total_expense', COALESCE(SUM(total_amount) FILTER (WHERE type = 'expense'), 0)
+    ) FROM transaction_rollups
+      WHERE user_id = u.id AND month = %(month_start)s) AS month_summary,
+    (SELECT COALESCE(json_agg(t ORDER BY t.date DESC, t.id DESC), '[]'::json) FROM (
+        SELECT id, date, type, category, description, amount, account
+        FROM transactions
+        WHERE user_id = u.id AND date >= %(month_start)s AND date < %(month_end)s
+        ORDER BY date DESC, id DESC
+        LIMIT %(recent_transactions)s
+    ) t) AS recent_transactions
+FROM users u
+WHERE u.id = %(user_id)s
+"""
+
+
+@dataclass
+class ChatContext:
+    """Pre-LLM context of one chat turn"""
+
+    session_id: Optional[int]
+    user_name: str
+    data_version: int
+    financial: str
+    memory: str
+    active_state: Dict
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+
+def _ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 1)
+
+
+def _with_current_message(recent: List[Dict], message: str, limit: int) -> List[Dict]:
+    # The user's message is inserted by the same statement, so its own
+    # snapshot cannot see it yet; append it to match get_recent_dialogue().
+    recent = list(recent) + [{"role": "user", "content": message}]
+    return recent[-limit:]
+
+
+def assemble_chat_context(
+    user_id: int,
+    session_id: Optional[int],
+    message: str,
+    year: int,
+    month: int,
+) -> ChatContext:
+    """Create the session if needed, log the user message and load the context.
+
+    Commits the write; on failure the transaction is rolled back and the
+    error propagates.
+    """
+    started = time.perf_counter()
+    timings = {}
+    db = get_db()
+    month_start, month_end = month_date_range(year, month)
+
+    try:
+        row = db.execute(
+            _CONTEXT_SQL,
+            {
+                "user_id": user_id,
+                "session_id": session_id or None,
+                "message": message,
+                "max_log_context": MAX_LOG_CONTEXT,
+                "month_start": month_start,
+                "month_end": month_end,
+                "recent_transactions": RECENT_TRANSACTIONS,
+            },
+        ).fetchone()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    timings["db"] = _ms(started)
+
+    step = time.perf_counter()
+    row = row or {}
+    totals = row.get("month_summary") or {}
+    income = float(totals.get("total_income") or 0)
+    expense = float(totals.get("total_expense") or 0)
+    financial = format_financial_context(
+        year,
+        month,
+        {"total_income": income, "total_expense": expense, "net": income - expense},
+        row.get("recent_transactions") or [],
+    )
+    timings["financial"] = _ms(step)
+
+    step = time.perf_counter()
+    recent = _with_current_message(
+        row.get("recent_dialogue") or [],
+        message,
+        row.get("max_log_context") or MAX_LOG_CONTEXT,
+    )
+    memory = format_memory_context(row.get("memory_summary"), recent)
+    timings["memory"] = _ms(step)
+
+    state_row = row.get("session_state")
+    if state_row:
+        active_state = {
+            "success": True,
+            "state": ConversationStateManager.state_from_row(state_row),
+        }
+    else:
+        active_state = {"success": False, "state": None}
+
+    timings["total"] = _ms(started)
+    for part, ms in timings.items():
+        latency(f"chat_context_{part}").record(ms)
+    logger.info("chat_context_assembled", user_id=user_id, **timings)
+
+    return ChatContext(
+        session_id=row.get("session_id") or session_id,
+        user_name=row.get("name") or DEFAULT_USER_NAME,
+        data_version=row.get("data_version") or 0,
+        financial=financial,
+        memory=memory,
+        active_state=active_state,
+        timings_ms=timings,
+    )
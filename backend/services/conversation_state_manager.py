@@ -167,21 +167,23 @@ class ConversationStateManager:
             )
             row = cur.fetchone()
 
-            if not row:
-                return None
-
-            return {
-                "id": row["id"],
-                "user_id": row["user_id"],
-                "intent": row["intent"],
-                "state": row["state"],
-                "partial_data": json.loads(row["partial_data"]),
-                "expires_at": row["expires_at"],
-            }
+            return ConversationStateManager.state_from_row(row) if row else None
         except Exception as e:
             logger.error("get_state_error", error=str(e))
             return None
 
+    @staticmethod
+    def state_from_row(row: Dict) -> Dict:
+        """Decode a conversation_state row into the state dict"""
+        return {
+            "id": row["id"],
+            "user_id": row["user_id"],
+            "intent": row["intent"],
+            "state": row["state"],
+            "partial_data": json.loads(row["partial_data"]),
+            "expires_at": row["expires_at"],
+        }
+
     @staticmethod
     def get_session_state(session_id: int) -> Dict:
         """Wrapper to get session state with success indicator"""
@@ -0,0 +1,242 @@
+"""Session cache - per-worker token -> user lookups for require_login
+
+get_current_user ran a sessions JOIN users query (and parsed expires_at) on
+every authenticated request. The lookup is now kept per worker for
+AUTH_CACHE_TTL seconds, keyed by the SHA-256 of the token so raw tokens are
+never held in memory.
+
+Consistency across workers comes from a version stamp. Every change that
+revokes or alters a session (logout, password change or reset, account
+delete, admin edits) calls record_auth_change() inside its transaction,
+which appends (version, user_id) to auth_events. Versions are taken under a
+transaction-scoped advisory lock, so they become visible in commit order.
+Each worker reads the events past its last applied version at most every
+AUTH_EVENTS_POLL seconds - one index probe that usually returns nothing -
+and drops the affected users' entries. A session revoked in one worker is
+served from another worker's cache for at most AUTH_EVENTS_POLL seconds.
+While the log cannot be read the cache is bypassed.
+"""
+
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config import AUTH_CACHE_MAX, AUTH_CACHE_TTL, AUTH_EVENTS_POLL, AUTH_TOKEN_REVALIDATE
+from core import get_logger, incr
+
+logger = get_logger(__name__)
+
+_PURGE_EVERY = 500
+_EVENT_RETENTION_HOURS = 24
+_events = itertools.count(1)
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class SessionCache:
+    """Thread-safe LRU + TTL map of token hash -> (user_id, session lookup)"""
+
+    def __init__(self, maxsize: int, ttl: float, poll_interval: float, retain_changes: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.retain_changes = retain_changes
+        self._data: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._generation = 0  # bumped by every invalidation
+        self._version: Optional[int] = None  # last auth_events version applied
+        self._polled_at = 0.0
+        # user_id -> (auth_events version, monotonic time) of the latest change
+        self._changed: Dict[int, Tuple[int, float]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.polls = 0
+        self.poll_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0 and self._version is not None
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                del self._data[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def generation(self) -> int:
+        """Read before a DB lookup and hand to put()"""
+        return self._generation
+
+    def put(self, key: str, user_id: int, value: Any, generation: int) -> None:
+        """Cache a lookup, unless an invalidation ran while it was being made"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._data[key] = (time.monotonic(), user_id, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int, version: int) -> None:
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for key in [k for k, entry in self._data.items() if entry[1] == user_id]:
+                del self._data[key]
+            latest = self._changed.get(user_id)
+            if latest is None or latest[0] < version:
+                self._changed[user_id] = (version, time.monotonic())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def current_version(self) -> int:
+        return self._version or 0
+
+    def changed_since(self, user_id: int, version: int) -> bool:
+        """Whether an auth change of the user is newer than `version`"""
+        if self._version is None:
+            return True
+        latest = self._changed.get(user_id)
+        return latest is not None and latest[0] > version
+
+    def refresh(self, get_db: Callable[[], Any]) -> None:
+        """Apply auth events committed by any worker (at most every poll_interval).
+
+        Takes the connection getter: between polls no connection is borrowed.
+        """
+        now = time.monotonic()
+        if now - self._polled_at < self.poll_interval:
+            return
+        if not self._poll_lock.acquire(blocking=False):
+            return  # another thread is polling; the cache is at most one poll behind
+        db = None
+        try:
+            self._polled_at = now
+            db = get_db()
+            if self._version is None:
+                self._load(db)
+                return
+            rows = db.execute(
+                "SELECT version, user_id FROM auth_events WHERE version > %s ORDER BY version",
+                (self._version,),
+            ).fetchall()
+            self.polls += 1
+            for row in rows:
+                self.invalidate_user(row["user_id"], row["version"])
+            if rows:
+                self._version = rows[-1]["version"]
+            self._prune_changes(now)
+        except Exception as e:
+            # Unknown what changed meanwhile: stop serving from the cache
+            if db is not None:
+                db.rollback()
+            self._version = None
+            self.clear()
+            self.poll_errors += 1
+            logger.warning("auth_events_poll_failed", error=str(e))
+        finally:
+            self._poll_lock.release()
+
+    def _load(self, db) -> None:
+        # Start (or restart after a failed poll) from the latest version. Changes
+        # made within retain_changes are loaded too: signed tokens issued before
+        # them must still be revalidated
+        rows = db.execute(
+            """
+            SELECT version, user_id FROM auth_events
+            WHERE created_at >= CURRENT_TIMESTAMP - make_interval(secs => %s)
+            ORDER BY version
+            """,
+            (self.retain_changes,),
+        ).fetchall()
+        for row in rows:
+            self.invalidate_user(row["user_id"], row["version"])
+        latest = db.execute(
+            "SELECT COALESCE(MAX(version), 0) AS version FROM auth_events"
+        ).fetchone()
+        self._version = latest["version"]
+
+    def _prune_changes(self, now: float) -> None:
+        # Past retain_changes every signed token has been revalidated anyway
+        with self._lock:
+            for user_id in [
+                u for u, (_, at) in self._changed.items() if now - at > self.retain_changes
+            ]:
+                del self._changed[user_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._data),
+                "max_size": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "auth_events_version": self._version,
+                "polls": self.polls,
+                "poll_errors": self.poll_errors,
+            }
+
+
+session_cache = SessionCache(
+    AUTH_CACHE_MAX,
+    AUTH_CACHE_TTL,
+    AUTH_EVENTS_POLL,
+    max(AUTH_CACHE_TTL, AUTH_TOKEN_REVALIDATE),
+)
+
+
+def record_auth_change(db, user_id: int) -> None:
+    """Log a change that revokes or alters the user's sessions.
+
+    Call inside the transaction making the change (the caller commits). Drops
+    the user's entries in this worker right away; the other workers drop
+    theirs on their next poll.
+    """
+    if next(_events) % _PURGE_EVERY == 0:
+        db.execute(
+            """
+            DELETE FROM auth_events
+            WHERE created_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+            """,
+            (_EVENT_RETENTION_HOURS,),
+        )
+    # Held until commit: versions become visible in the order they were taken
+    db.execute("SELECT pg_advisory_xact_lock(hashtext('auth_events'))")
+    row = db.execute(
+        "INSERT INTO auth_events (user_id) VALUES (%s) RETURNING version", (user_id,)
+    ).fetchone()
+    session_cache.invalidate_user(user_id, row["version"])
+    incr("auth_changes")
+
+
+def get_session_cache_stats() -> Dict[str, Any]:
+    return session_cache.stats()
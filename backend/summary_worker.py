@@ -0,0 +1,183 @@
+"""Background memory summarization
+
+Chat replies call schedule_summary(user_id) and return immediately. A daemon
+thread per gunicorn worker drains a bounded queue:
+
+- Coalesced per user: a user already queued (or waiting for a retry) is not
+  queued again, and a request that arrives while that user's job is running
+  triggers exactly one follow-up run.
+- Bounded: when the queue is full the request is dropped and counted; the
+  next reply of that user schedules it again.
+- Own retry policy: one model call per attempt, up to SUMMARY_JOB_ATTEMPTS
+  attempts with exponential backoff. After the last failure the previous
+  summary is kept.
+
+The database connection is only held while reading the logs and while
+storing the result, never during the model call.
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional
+
+from config import SUMMARY_JOB_ATTEMPTS, SUMMARY_QUEUE_MAX, SUMMARY_RETRY_BACKOFF
+from core import get_logger, incr, latency
+from memory import generate_summary, load_summary_source, store_summary
+
+logger = get_logger(__name__)
+
+
+class SummaryWorker:
+    """Coalescing, bounded background queue of per-user summary jobs"""
+
+    def __init__(self, app, maxsize: int, max_attempts: int, backoff: float):
+        self._app = app
+        self.maxsize = maxsize
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._pending: Dict[int, int] = {}  # user_id -> attempt, queued or in backoff
+        self._running = set()
+        self._rerun = set()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_thread(self) -> None:
+        # Threads do not survive fork: start one per worker process
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self.maxsize)
+            self._pending.clear()
+            self._running.clear()
+            self._rerun.clear()
+            self._thread = threading.Thread(
+                target=self._loop, name="summary-worker", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, user_id: int) -> bool:
+        """Queue a summary refresh for the user; False if it had to be dropped"""
+        with self._lock:
+            self._ensure_thread()
+            if user_id in self._pending:
+                incr("summary_jobs_coalesced")
+                return True
+            if user_id in self._running:
+                self._rerun.add(user_id)
+                incr("summary_jobs_coalesced")
+                return True
+            if not self._enqueue(user_id, 1):
+                return False
+        incr("summary_jobs_submitted")
+        return True
+
+    def _enqueue(self, user_id: int, attempt: int) -> bool:
+        # Caller holds self._lock
+        try:
+            self._queue.put_nowait(user_id)
+        except queue.Full:
+            self._pending.pop(user_id, None)
+            incr("summary_jobs_dropped")
+            logger.warning("summary_queue_full", user_id=user_id, attempt=attempt)
+            return False
+        self._pending[user_id] = attempt
+        return True
+
+    def _retry_later(self, user_id: int, attempt: int) -> None:
+        def requeue():
+            with self._lock:
+                if self._pid == os.getpid():
+                    self._enqueue(user_id, attempt)
+
+        with self._lock:
+            # Keep the user pending during backoff so new requests coalesce
+            self._pending[user_id] = attempt
+            self._rerun.discard(user_id)
+        timer = threading.Timer(self.backoff * 2 ** (attempt - 2), requeue)
+        timer.daemon = True
+        timer.start()
+
+    def _loop(self) -> None:
+        while True:
+            user_id = self._queue.get()
+            with self._lock:
+                attempt = self._pending.pop(user_id, 1)
+                self._running.add(user_id)
+
+            ok = self._run(user_id, attempt)
+
+            with self._lock:
+                self._running.discard(user_id)
+                rerun = user_id in self._rerun
+                self._rerun.discard(user_id)
+
+            if not ok and attempt < self.max_attempts:
+                incr("summary_jobs_retried")
+                self._retry_later(user_id, attempt + 1)
+            elif rerun:
+                self.submit(user_id)
+
+    def _run(self, user_id: int, attempt: int) -> bool:
+        started = time.perf_counter()
+        try:
+            with self._app.app_context():
+                source = load_summary_source(user_id)
+            if source is None:
+                incr("summary_jobs_skipped")
+                return True
+
+            summary_text = generate_summary(source, max_retries=0)
+
+            with self._app.app_context():
+                store_summary(user_id, summary_text, source)
+        except Exception as e:
+            if attempt >= self.max_attempts:
+                incr("summary_jobs_failed")
+            logger.error("summary_job_error", exc=e, user_id=user_id, attempt=attempt)
+            return False
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        latency("summary_job").record(elapsed_ms)
+        incr("summary_jobs_completed")
+        logger.info(
+            "summary_job_done",
+            user_id=user_id,
+            attempt=attempt,
+            elapsed_ms=round(elapsed_ms, 1),
+        )
+        return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "max": self.maxsize,
+                "pending_users": len(self._pending),
+                "running": len(self._running),
+            }
+
+
+_worker: Optional[SummaryWorker] = None
+
+
+def init_summary_worker(app) -> SummaryWorker:
+    """Create the process-wide worker; jobs run inside `app`'s context"""
+    global _worker
+    _worker = SummaryWorker(
+        app, SUMMARY_QUEUE_MAX, SUMMARY_JOB_ATTEMPTS, SUMMARY_RETRY_BACKOFF
+    )
+    return _worker
+
+
+def schedule_summary(user_id: int) -> bool:
+    """Ask for a background summary refresh; never blocks on the model"""
+    if _worker is None:
+        raise RuntimeError("init_summary_worker() has not been called")
+    return _worker.submit(user_id)
+
+
+def get_summary_worker_stats() -> Dict:
+    return _worker.stats() if _worker else {}
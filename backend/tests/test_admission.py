@@ -0,0 +1,94 @@
+import threading
+import time
+
+from core.admission import FairLimiter
+
+
+def _queue(limiter, key, results):
+    """Start a thread waiting for a slot for `key`; returns once it is queued"""
+    queued = limiter.queued
+
+    def run():
+        acquired = limiter.acquire(key)
+        results.append(key if acquired is not None else None)
+        if acquired is not None:
+            limiter.release(acquired)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    while limiter.queued == queued:
+        time.sleep(0.001)
+    return thread
+
+
+def test_freed_slots_go_round_robin_over_users():
+    limiter = FairLimiter("test_rr", 1, 10, 5, 5)
+    held = limiter.acquire("a")
+    order = []
+    threads = [_queue(limiter, key, order) for key in ("a", "a", "b")]
+
+    limiter.release(held)
+    for thread in threads:
+        thread.join()
+
+    assert order == ["a", "b", "a"]
+    assert limiter.active == 0
+
+
+def test_rejects_a_user_over_its_queue_share():
+    limiter = FairLimiter("test_user", 1, 10, 1, 5)
+    held = limiter.acquire("a")
+    results = []
+    thread = _queue(limiter, "a", results)
+
+    assert limiter.acquire("a") is None
+    assert limiter.rejected_user == 1
+
+    limiter.release(held)
+    thread.join()
+    assert results == ["a"]
+
+
+def test_rejects_when_the_queue_is_full():
+    limiter = FairLimiter("test_full", 1, 1, 5, 5)
+    held = limiter.acquire("a")
+    results = []
+    thread = _queue(limiter, "a", results)
+
+    assert limiter.acquire("b") is None
+    assert limiter.rejected_full == 1
+
+    limiter.release(held)
+    thread.join()
+    assert results == ["a"]
+
+
+def test_timed_out_waiter_is_withdrawn():
+    limiter = FairLimiter("test_timeout", 1, 10, 5, 0.05)
+    held = limiter.acquire("a")
+
+    assert limiter.acquire("b") is None
+    assert limiter.timeouts == 1
+    assert limiter.queued == 0
+    assert limiter.stats()["queued_users"] == 0
+
+    limiter.release(held)
+    assert limiter.active == 0
+    assert limiter.acquire("b") is not None
+
+
+def test_holds_count_against_the_queue_bounds():
+    limiter = FairLimiter("test_hold", 1, 2, 1, 0.05)
+    held = limiter.acquire("a")
+
+    assert limiter.hold("b")
+    assert not limiter.hold("b")
+    assert limiter.acquire("b") is None
+    assert limiter.hold("c")
+    assert limiter.acquire("d") is None
+
+    limiter.unhold("b")
+    limiter.unhold("c")
+    limiter.release(held)
+    assert limiter.stats()["holding"] == 0
+    assert limiter.acquire("b") is not None
@@ -0,0 +1,25 @@
+import pytest
+
+from llm.amount_parser import parse_amount
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("50.000", 50000.0),
+        ("50,000.00", 50000.0),
+        ("1,250,000.00", 1250000.0),
+        ("Rp 50.000", 50000.0),
+        ("50rb", 50000.0),
+        ("50k", 50000.0),
+        ("1.5jt", 1500000.0),
+        ("lima puluh ribu", 50000.0),
+    ],
+)
+def test_parse_amount(text, expected):
+    assert parse_amount(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "abc", None])
+def test_parse_amount_rejects_non_amounts(text):
+    assert parse_amount(text) is None
@@ -0,0 +1,54 @@
+import time
+
+from llm.router import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+COOLDOWN = 0.05
+
+
+def _opened():
+    breaker = CircuitBreaker("test", 2, COOLDOWN)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_open_breaker_rejects_until_cooldown():
+    breaker = _opened()
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_successful_probe_closes_the_breaker():
+    breaker = _opened()
+    time.sleep(COOLDOWN * 2)
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # a single probe at a time
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = _opened()
+    time.sleep(COOLDOWN * 2)
+
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.trips == 2
+
+
+def test_released_probe_can_be_taken_again():
+    breaker = _opened()
+    time.sleep(COOLDOWN * 2)
+
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
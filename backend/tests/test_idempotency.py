@@ -0,0 +1,123 @@
+import json
+
+import pytest
+
+import idempotency
+from idempotency import claim_key
+from llm import executor
+
+
+class FakeDB:
+    """Answers claim/lookup statements from scripted rows and logs every call"""
+
+    def __init__(self, claimed=None, stored=None):
+        self.claimed = list(claimed or [])
+        self.stored = list(stored or [])
+        self.calls = []
+        self.params = []
+
+    def execute(self, query, params=()):
+        self.params.append(params)
+        if "INSERT INTO idempotency_keys" in query:
+            self.calls.append("claim")
+            row = self.claimed.pop(0) if self.claimed else None
+        elif "SELECT fingerprint" in query:
+            self.calls.append("lookup")
+            row = self.stored.pop(0) if self.stored else None
+        else:
+            self.calls.append(query.split()[0].lower())
+            row = None
+        return _Cursor(row)
+
+    def commit(self):
+        self.calls.append("commit")
+
+    def rollback(self):
+        self.calls.append("rollback")
+
+
+class _Cursor:
+    def __init__(self, row):
+        self.row = row
+
+    def fetchone(self):
+        return self.row
+
+
+def _stored(response, status_code=200, fingerprint="fp"):
+    return {
+        "fingerprint": fingerprint,
+        "status_code": status_code,
+        "response": None if response is None else json.dumps(response),
+    }
+
+
+def test_claimed_key_goes_ahead():
+    db = FakeDB(claimed=[{"user_id": 1}])
+    assert claim_key(db, 1, "k", "transfer", "fp") is None
+    assert db.calls == ["claim"]
+
+
+def test_used_key_replays_the_stored_response():
+    db = FakeDB(stored=[_stored({"success": True, "id": 7}, status_code=201)])
+    assert claim_key(db, 1, "k", "transfer", "fp") == (201, {"success": True, "id": 7})
+
+
+def test_key_reused_for_another_request_is_rejected():
+    db = FakeDB(stored=[_stored({"success": True}, fingerprint="other")])
+    status_code, body = claim_key(db, 1, "k", "transfer", "fp")
+    assert status_code == 422
+    assert body["code"] == "IDEMPOTENCY_KEY_REUSED"
+
+
+def test_key_without_a_stored_response_is_a_conflict():
+    db = FakeDB(stored=[_stored(None)])
+    status_code, body = claim_key(db, 1, "k", "transfer", "fp")
+    assert status_code == 409
+    assert body["code"] == "IDEMPOTENCY_ALREADY_PROCESSED"
+
+
+def test_key_released_between_statements_is_claimed_again():
+    db = FakeDB(claimed=[None, {"user_id": 1}], stored=[None])
+    assert claim_key(db, 1, "k", "transfer", "fp") is None
+    assert db.calls == ["claim", "lookup", "claim"]
+
+
+def test_long_keys_are_truncated():
+    db = FakeDB(claimed=[{"user_id": 1}])
+    claim_key(db, 1, "k" * 1000, "transfer")
+    assert len(db.params[-1][1]) == idempotency.MAX_KEY_LENGTH
+
+
+def test_action_result_is_stored_before_its_commit():
+    db = FakeDB()
+    executor._commit_write(db, 1, ["prior", "current"], {"success": True})
+    assert db.calls == ["update", "update", "commit"]
+
+
+def test_failed_action_gives_its_keys_back(monkeypatch):
+    db = FakeDB(claimed=[{"user_id": 1}, {"user_id": 1}])
+    monkeypatch.setattr(executor, "get_db", lambda: db)
+    monkeypatch.setattr(
+        executor, "_run_action", lambda *a: {"success": False, "code": "INSERT_ERROR"}
+    )
+
+    result = executor.execute_action(
+        1, "add_transaction", {}, idempotency_key="current", prior_idempotency_key="prior"
+    )
+
+    assert result["code"] == "INSERT_ERROR"
+    assert db.calls == ["claim", "claim", "delete", "delete", "commit"]
+
+
+def test_replayed_action_does_not_run(monkeypatch):
+    db = FakeDB(stored=[_stored({"success": True, "message": "ok"}, fingerprint=None)])
+    monkeypatch.setattr(executor, "get_db", lambda: db)
+    monkeypatch.setattr(
+        executor, "_run_action", lambda *a: pytest.fail("a replayed action ran again")
+    )
+
+    result = executor.execute_action(1, "add_transaction", {}, idempotency_key="k")
+
+    assert result == {"success": True, "message": "ok", "replayed": True}
+    assert db.calls == ["claim", "lookup", "rollback"]
@@ -0,0 +1,41 @@
+from datetime import date
+
+import pytest
+
+from llm.query_engine import plan_query
+
+TODAY = date(2026, 10, 18)
+
+
+def test_balance_of_one_account():
+    plan = plan_query("saldo BCA berapa?", TODAY)
+    assert plan.kind == "balance"
+    assert plan.accounts == ["BCA"]
+    assert plan.confidence == 1.0
+
+
+def test_expense_total_this_month():
+    plan = plan_query("total pengeluaran bulan ini", TODAY)
+    assert plan.kind == "totals"
+    assert plan.tx_type == "expense"
+    assert (plan.start, plan.end) == (date(2026, 10, 1), date(2026, 11, 1))
+
+
+def test_top_categories_last_month():
+    plan = plan_query("kategori pengeluaran terbesar bulan lalu", TODAY)
+    assert plan.kind == "top_categories"
+    assert (plan.start, plan.end) == (date(2026, 9, 1), date(2026, 10, 1))
+
+
+def test_date_range_end_is_exclusive():
+    plan = plan_query("pengeluaran dari 1 oktober sampai 15 oktober", TODAY)
+    assert plan.kind == "totals"
+    assert plan.period == ("range", date(2026, 10, 1))
+    assert (plan.start, plan.end) == (date(2026, 10, 1), date(2026, 10, 16))
+
+
+@pytest.mark.parametrize(
+    "message", ["", "halo", "kenapa pengeluaran saya besar bulan ini?"]
+)
+def test_other_messages_go_to_the_llm(message):
+    assert plan_query(message, TODAY) is None
@@ -0,0 +1,110 @@
+import time
+
+from session_cache import SessionCache
+
+
+class FakeDB:
+    """auth_events reads: `events` are (version, user_id) rows, visible once added"""
+
+    def __init__(self, events=()):
+        self.events = list(events)
+        self.fail = False
+        self.rollbacks = 0
+
+    def execute(self, query, params=()):
+        if self.fail:
+            raise RuntimeError("connection lost")
+        if "MAX(version)" in query:
+            latest = max((v for v, _ in self.events), default=0)
+            return _Result([{"version": latest}])
+        if "version > %s" in query:
+            rows = [e for e in self.events if e[0] > params[0]]
+        else:
+            rows = self.events
+        return _Result([{"version": v, "user_id": u} for v, u in rows])
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0]
+
+
+def _loaded(db, ttl=60.0):
+    cache = SessionCache(100, ttl, 0, 600)
+    cache.refresh(lambda: db)
+    assert cache.enabled
+    return cache
+
+
+def _put(cache, key, user_id):
+    cache.put(key, user_id, (f"user {user_id}", None), cache.generation())
+
+
+def test_disabled_until_the_event_log_is_read():
+    cache = SessionCache(100, 60, 0, 600)
+    _put(cache, "t", 1)
+    assert cache.get("t") is None
+    assert cache.changed_since(1, 0)
+
+
+def test_auth_event_from_another_worker_drops_the_users_entries():
+    db = FakeDB([(1, 7)])
+    cache = _loaded(db)
+    _put(cache, "a", 1)
+    _put(cache, "b", 2)
+    assert cache.current_version() == 1
+
+    db.events.append((2, 1))
+    cache.refresh(lambda: db)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == ("user 2", None)
+    assert cache.current_version() == 2
+
+
+def test_changed_since_compares_versions():
+    db = FakeDB([(3, 1)])
+    cache = _loaded(db)
+
+    assert cache.changed_since(1, 2)
+    assert not cache.changed_since(1, 3)
+    assert not cache.changed_since(2, 0)
+
+
+def test_lookup_raced_by_an_invalidation_is_not_cached():
+    cache = _loaded(FakeDB())
+    generation = cache.generation()
+    cache.invalidate_user(1, 1)
+    cache.put("a", 1, ("stale", None), generation)
+    assert cache.get("a") is None
+
+
+def test_entries_expire_after_ttl():
+    cache = _loaded(FakeDB(), ttl=0.01)
+    _put(cache, "a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+
+def test_failed_poll_bypasses_the_cache():
+    db = FakeDB()
+    cache = _loaded(db)
+    _put(cache, "a", 1)
+
+    db.fail = True
+    cache.refresh(lambda: db)
+
+    assert not cache.enabled
+    assert db.rollbacks == 1
+    assert cache.get("a") is None
+    assert cache.changed_since(1, 10)
+    assert cache.stats()["poll_errors"] == 1
@@ -0,0 +1,50 @@
+import threading
+import time
+
+from core.single_flight import SingleFlight
+
+
+def test_followers_share_the_leaders_result():
+    flights = SingleFlight(60)
+    flight, leader = flights.begin("k")
+    follower, is_leader = flights.begin("k")
+    assert leader and not is_leader and follower is flight
+
+    threading.Timer(0.01, flights.finish, ("k", flight, "answer")).start()
+    assert flights.wait(follower, 5) == "answer"
+    assert flights.stats()["shared"] == 1
+
+
+def test_failed_leader_publishes_none_and_frees_the_key():
+    flights = SingleFlight(60)
+    flight, _ = flights.begin("k")
+    follower, _ = flights.begin("k")
+
+    flights.finish("k", flight, None)
+
+    assert flights.wait(follower, 5) is None
+    _, leader = flights.begin("k")
+    assert leader
+
+
+def test_finished_flights_are_pruned_after_retention():
+    flights = SingleFlight(0.05)
+    flight, _ = flights.begin("k")
+    flights.finish("k", flight, "answer")
+
+    retained, leader = flights.begin("k")
+    assert not leader and retained.result == "answer"
+
+    time.sleep(0.1)
+    _, leader = flights.begin("k")
+    assert leader
+    assert flights.stats()["retained"] == 0
+
+
+def test_wait_times_out():
+    flights = SingleFlight(60)
+    flights.begin("k")
+    follower, _ = flights.begin("k")
+
+    assert flights.wait(follower, 0.01) is None
+    assert flights.stats()["follower_timeouts"] == 1
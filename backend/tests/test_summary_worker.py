@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+import summary_worker
+from summary_worker import SummaryWorker
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+class FakeSummaries:
+    """Stands in for memory's load/generate/store; generate can block or fail"""
+
+    def __init__(self, monkeypatch, failures=0):
+        self.failures = failures
+        self.gate = threading.Event()
+        self.gate.set()
+        self.generated = []
+        self.stored = []
+        monkeypatch.setattr(summary_worker, "load_summary_source", lambda u: {"user": u})
+        monkeypatch.setattr(summary_worker, "generate_summary", self.generate)
+        monkeypatch.setattr(summary_worker, "store_summary", lambda u, t, s: self.stored.append(u))
+
+    def generate(self, source, max_retries):
+        self.generated.append(source["user"])
+        self.gate.wait(2)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("model unavailable")
+        return "summary"
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def test_requests_during_a_run_coalesce_into_one_follow_up(monkeypatch, app):
+    fake = FakeSummaries(monkeypatch)
+    fake.gate.clear()
+    worker = SummaryWorker(app, 10, 1, 0.01)
+
+    assert worker.submit(1)
+    _wait_for(lambda: fake.generated == [1])
+    assert worker.submit(1)
+    assert worker.submit(1)
+    fake.gate.set()
+
+    _wait_for(lambda: fake.stored == [1, 1])
+    time.sleep(0.05)
+    assert fake.generated == [1, 1]
+
+
+def test_queued_user_is_not_queued_twice(monkeypatch, app):
+    fake = FakeSummaries(monkeypatch)
+    fake.gate.clear()
+    worker = SummaryWorker(app, 10, 1, 0.01)
+
+    worker.submit(1)
+    _wait_for(lambda: fake.generated == [1])
+    worker.submit(2)
+    worker.submit(2)
+    assert worker.stats()["queued"] == 1
+    fake.gate.set()
+
+    _wait_for(lambda: sorted(fake.stored) == [1, 2])
+
+
+def test_full_queue_drops_the_request(monkeypatch, app):
+    fake = FakeSummaries(monkeypatch)
+    fake.gate.clear()
+    worker = SummaryWorker(app, 1, 1, 0.01)
+
+    worker.submit(1)
+    _wait_for(lambda: fake.generated == [1])
+    assert worker.submit(2)
+    assert not worker.submit(3)
+    fake.gate.set()
+
+    _wait_for(lambda: fake.stored == [1, 2])
+
+
+def test_failed_job_is_retried_with_backoff(monkeypatch, app):
+    fake = FakeSummaries(monkeypatch, failures=1)
+    worker = SummaryWorker(app, 10, 3, 0.01)
+
+    worker.submit(1)
+
+    _wait_for(lambda: fake.stored == [1])
+    assert fake.generated == [1, 1]
+
+
+def test_gives_up_after_the_last_attempt(monkeypatch, app):
+    fake = FakeSummaries(monkeypatch, failures=10)
+    worker = SummaryWorker(app, 10, 2, 0.01)
+
+    worker.submit(1)
+
+    _wait_for(lambda: len(fake.generated) == 2 and worker.stats()["pending_users"] == 0)
+    time.sleep(0.05)
+    assert fake.generated == [1, 1]
+    assert fake.stored == []
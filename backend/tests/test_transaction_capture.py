@@ -0,0 +1,44 @@
+from datetime import date
+
+import pytest
+
+from llm.transaction_capture import capture_transaction
+
+TODAY = date(2026, 10, 18)
+
+
+def test_complete_expense():
+    capture = capture_transaction("makan siang 35rb pakai gopay", TODAY)
+    assert capture.args == {
+        "type": "expense",
+        "amount": 35000.0,
+        "category": "Makan",
+        "account": "Gopay",
+        "date": "2026-10-18",
+        "description": "Makan siang",
+    }
+    assert capture.is_complete(1.0)
+
+
+def test_income_with_relative_date_and_separated_amount():
+    capture = capture_transaction("terima gaji 8jt ke bca", TODAY)
+    assert capture.args["type"] == "income"
+    assert capture.args["category"] == "Gaji"
+    assert capture.args["amount"] == 8000000.0
+
+    capture = capture_transaction("catat pengeluaran bensin 50.000 cash kemarin", TODAY)
+    assert capture.args["amount"] == 50000.0
+    assert capture.args["date"] == "2026-10-17"
+
+
+def test_missing_account_is_not_complete():
+    capture = capture_transaction("makan siang 35rb", TODAY)
+    assert capture.missing == ["account"]
+    assert not capture.is_complete(0.5)
+
+
+@pytest.mark.parametrize(
+    "message", ["", "berapa saldo gopay?", "transfer 50rb ke bca", "halo"]
+)
+def test_non_transactions_are_rejected(message):
+    assert capture_transaction(message, TODAY) is None
@@ -0,0 +1,132 @@
+"""Precision gate of the local transaction capture on a labeled corpus
+
+Every message is labeled with the add_transaction arguments a careful human
+would record, or None when it must go to the LLM (questions, edits,
+transfers, several transactions, missing fields, ambiguous wording). A
+complete capture of a None message, or with any field differing from the
+label, is a false positive: a wrong row in the user's books.
+LOCAL_CAPTURE_ENABLED may only be switched on while there are none.
+"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from config import LOCAL_CAPTURE_MIN_CONFIDENCE
+from llm.transaction_capture import REQUIRED_FIELDS, capture_transaction
+
+TODAY = date(2026, 10, 18)
+# Recall is what the fast path saves; a drop is worth a look, not a wrong row
+MIN_RECALL = 0.9
+
+# (message, label); label dates are day offsets from today or ISO strings
+CORPUS = [
+    ("makan siang 35rb pakai gopay", ("expense", 35000, "Makan", "Gopay", 0)),
+    ("makan malam 50rb cash", ("expense", 50000, "Makan", "Cash", 0)),
+    ("sarapan nasi uduk 15rb tunai", ("expense", 15000, "Makan", "Cash", 0)),
+    ("beli bakso 25k pake ovo", ("expense", 25000, "Makan", "Ovo", 0)),
+    ("kopi 28rb gopay", None),  # no keyword for coffee
+    ("gofood ayam geprek 42.000 via gopay", ("expense", 42000, "Makan", "Gopay", 0)),
+    ("catat pengeluaran bensin 50.000 cash kemarin", ("expense", 50000, "Transport", "Cash", 1)),
+    ("isi pertalite 30rb bca", ("expense", 30000, "Transport", "BCA", 0)),
+    ("parkir 5rb cash", ("expense", 5000, "Transport", "Cash", 0)),
+    ("bayar tol 12rb pakai bca", ("expense", 12000, "Transport", "BCA", 0)),
+    ("ojol ke kantor 18rb gopay", ("expense", 18000, "Transport", "Gopay", 0)),
+    ("naik kereta 8rb via jago", ("expense", 8000, "Transport", "Jago", 0)),
+    ("bayar listrik 350rb via bca", ("expense", 350000, "Utilitas", "BCA", 0)),
+    ("token pln 100rb seabank", ("expense", 100000, "Utilitas", "Seabank", 0)),
+    ("bayar wifi indihome 300rb maybank", ("expense", 300000, "Utilitas", "Maybank", 0)),
+    ("pulsa 50rb pakai shopeepay", ("expense", 50000, "Utilitas", "Shopeepay", 0)),
+    ("nonton bioskop 60rb pakai ovo", ("expense", 60000, "Hiburan", "Ovo", 0)),
+    ("langganan netflix 54rb bca", ("expense", 54000, "Hiburan", "BCA", 0)),
+    ("beli obat di apotek 45rb cash", ("expense", 45000, "Kesehatan", "Cash", 0)),
+    ("periksa dokter 150rb bca kemarin", ("expense", 150000, "Kesehatan", "BCA", 1)),
+    ("bayar spp 1.5jt bca", ("expense", 1500000, "Pendidikan", "BCA", 0)),
+    ("beli buku kuliah 120rb via seabank", ("expense", 120000, "Pendidikan", "Seabank", 0)),
+    ("belanja bulanan di indomaret 250rb bca", ("expense", 250000, "Belanja", "BCA", 0)),
+    ("belanja di alfamart 75rb cash", ("expense", 75000, "Belanja", "Cash", 0)),
+    ("belanja sayur 40rb tunai tadi pagi", ("expense", 40000, "Belanja", "Cash", 0)),
+    ("beli baju di shopee 150rb", None),  # shop, not the wallet; no account
+    ("beli baju di shopee 150rb pakai bca", None),  # two account aliases
+    ("checkout shopee 89rb pakai shopeepay", None),
+    ("terima gaji 8jt ke bca", ("income", 8000000, "Gaji", "BCA", 0)),
+    ("gaji bulan ini 7.500.000 masuk bca", None),
+    ("gajian 5jt bca", ("income", 5000000, "Gaji", "BCA", 0)),
+    ("dapat bonus 2jt ke bca", ("income", 2000000, "Bonus", "BCA", 0)),
+    ("terima thr 3jt jago", ("income", 3000000, "Bonus", "Jago", 0)),
+    ("pemasukan freelance 1.2jt seabank", ("income", 1200000, "Freelance", "Seabank", 0)),
+    ("refund tokopedia 85rb ke gopay", ("income", 85000, "Refund", "Gopay", 0)),
+    ("dividen saham 300rb jago", ("income", 300000, "Investment", "Jago", 0)),
+    ("makan siang 35rb", None),  # no account
+    ("makan 35rb gopay 2 porsi", None),  # two numbers
+    ("makan 20rb dan bensin 15rb cash", None),  # two transactions
+    ("bensin 20rb", None),
+    ("35rb gopay", None),  # no category
+    ("tadi bayar 50rb pakai cash", None),  # no category
+    ("beli 2 mie ayam 30rb gopay", None),
+    ("makan siang 35rb pakai gopay kemarin siang", ("expense", 35000, "Makan", "Gopay", 1)),
+    ("makan siang 35rb gopay hari ini", ("expense", 35000, "Makan", "Gopay", 0)),
+    ("makan sabtu kemarin 40rb cash", None),  # which day?
+    ("makan 3 hari lalu 40rb cash", None),
+    ("bensin minggu lalu 50rb cash", None),
+    ("berapa pengeluaran makan bulan ini?", None),
+    ("saldo gopay berapa", None),
+    ("hapus transaksi makan 35rb", None),
+    ("ubah makan siang jadi 40rb", None),
+    ("transfer 500rb dari bca ke gopay", None),
+    ("nabung 1jt ke blu", None),
+    ("buat target nabung laptop 10jt", None),
+    ("besok mau beli bensin 50rb cash", None),
+    ("jangan catat makan 35rb", None),
+    ("pinjam 100rb ke teman cash", None),
+    ("makan siang lima puluh ribu gopay", None),  # amount in words: LLM confirms
+    ("beli motor 25jt bca", None),
+    ("lunch 45k gopay", ("expense", 45000, "Makan", "Gopay", 0)),
+    ("dinner pizza 120k bca", ("expense", 120000, "Makan", "BCA", 0)),
+    ("paid parking 5k cash", None),  # "parking" is not a keyword
+    ("grab to office 25k gopay", ("expense", 25000, "Transport", "Gopay", 0)),
+    ("bought medicine at pharmacy 60k bca", ("expense", 60000, "Kesehatan", "BCA", 0)),
+    ("movie tickets 100k ovo", ("expense", 100000, "Hiburan", "Ovo", 0)),
+    ("salary 9jt bca", ("income", 9000000, "Gaji", "BCA", 0)),
+    ("received salary 4jt bca yesterday", ("income", 4000000, "Gaji", "BCA", 1)),
+    ("what did i spend on food?", None),
+    ("halo", None),
+    ("makan 35rb gopay atau ovo", None),
+    ("beli bensin 30rb cash", ("expense", 30000, "Transport", "Cash", 0)),
+    ("beli bensin sama snack 60rb cash", None),  # two categories
+    ("makan siang 35rb pakai gopay 2026-10-01", ("expense", 35000, "Makan", "Gopay", "2026-10-01")),
+]
+
+
+def _label_args(label):
+    tx_type, amount, category, account, day = label
+    if isinstance(day, int):
+        day = (TODAY - timedelta(days=day)).isoformat()
+    return {
+        "type": tx_type,
+        "amount": float(amount),
+        "category": category,
+        "account": account,
+        "date": day,
+    }
+
+
+def _complete_args(message):
+    capture = capture_transaction(message, TODAY)
+    if not capture or not capture.is_complete(LOCAL_CAPTURE_MIN_CONFIDENCE):
+        return None
+    return {f: capture.args.get(f) for f in REQUIRED_FIELDS}
+
+
+@pytest.mark.parametrize("message, label", CORPUS, ids=[m for m, _ in CORPUS])
+def test_no_false_positives(message, label):
+    got = _complete_args(message)
+    if got is not None:
+        assert label is not None, f"captured a message that must go to the LLM: {got}"
+        assert got == _label_args(label)
+
+
+def test_recall():
+    labeled = [(message, label) for message, label in CORPUS if label]
+    captured = sum(1 for message, label in labeled if _complete_args(message) == _label_args(label))
+    assert captured / len(labeled) >= MIN_RECALL
@@ -0,0 +1,377 @@
+"""Bulk import of transactions from CSV / Indonesian bank-statement exports
+
+Rows are parsed lazily from the uploaded stream and fed straight into
+`COPY ... FROM STDIN` on a temp staging table, so neither the file nor the
+parsed rows are ever held in memory as a whole. The staging table is then
+merged into `transactions` (and `transaction_rollups`) with set-based SQL in
+the caller's DB transaction.
+
+Supported layouts (detected from the header row, preamble lines are skipped):
+- generic: date, description, amount[, type, category, account]
+- debit/credit columns (Mandiri, BRI, BNI, ...): Tanggal, Keterangan, Debit, Kredit
+- BCA: Tanggal Transaksi, Keterangan, Cabang, Jumlah with a DB/CR marker
+Without a type column or DB/CR marker, negative amounts are expenses and
+positive amounts are income (bank convention).
+"""
+
+import csv
+import io
+import itertools
+import re
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+
+from llm.amount_parser import parse_amount
+from llm.category_suggester import suggest_category_from_description
+from llm.validation_utils import parse_natural_date, validate_account
+from transaction_rollups import add_staged_to_rollups
+
+DEFAULT_CATEGORY = "Lainnya"
+
+# Header aliases (lowercase, stripped) -> canonical column
+COLUMN_ALIASES = {
+    "date": {
+        "date", "tanggal", "tgl", "tanggal transaksi", "tgl transaksi",
+        "transaction date", "posting date", "tanggal posting", "tgl. transaksi",
+    },
+    "description": {
+        "description", "deskripsi", "keterangan", "uraian", "uraian transaksi",
+        "remark", "remarks", "berita", "catatan", "note", "notes",
+    },
+    "amount": {"amount", "jumlah", "nominal", "mutasi", "nilai", "jumlah (rp)"},
+    "debit": {"debit", "debet", "db", "pengeluaran", "keluar", "withdrawal", "mutasi debet"},
+    "credit": {"credit", "kredit", "cr", "pemasukan", "masuk", "deposit", "mutasi kredit"},
+    "type": {"type", "tipe", "jenis", "jenis transaksi"},
+    "category": {"category", "kategori"},
+    "account": {"account", "akun", "rekening", "sumber dana"},
+}
+
+TYPE_ALIASES = {
+    "income": "income", "pemasukan": "income", "masuk": "income",
+    "kredit": "income", "credit": "income", "cr": "income", "k": "income",
+    "expense": "expense", "pengeluaran": "expense", "keluar": "expense",
+    "debit": "expense", "debet": "expense", "db": "expense", "d": "expense",
+}
+
+# Summary lines at the bottom of bank statements
+_FOOTER_PREFIXES = ("saldo awal", "saldo akhir", "mutasi debet", "mutasi debit",
+                    "mutasi kredit", "total", "opening balance", "closing balance")
+
+_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%Y/%m/%d")
+_DAY_MONTH_RE = re.compile(r"(\d{1,2})[/-](\d{1,2})")
+_DB_CR_RE = re.compile(r"\s*\b(db|cr)\s*$", re.IGNORECASE)
+
+HEADER_SCAN_LINES = 30
+COPY_BATCH_ROWS = 1000
+
+STAGING_COLUMNS = ("line_no", "date", "type", "category", "description", "amount", "account")
+
+CREATE_STAGING_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS import_staging (
+        line_no INTEGER NOT NULL,
+        date DATE NOT NULL,
+        type TEXT NOT NULL,
+        category TEXT NOT NULL,
+        description TEXT,
+        amount NUMERIC NOT NULL,
+        account TEXT
+    ) ON COMMIT DROP
+"""
+
+
+class ImportFormatError(ValueError):
+    """The file has no recognizable header / columns"""
+
+
+@lru_cache(maxsize=256)
+def _normalize_account(raw: str) -> Optional[str]:
+    is_valid, normalized, _ = validate_account(raw)
+    return normalized if is_valid else None
+
+
+@lru_cache(maxsize=4096)
+def _suggest_category(description: str, tx_type: str) -> str:
+    suggestion = suggest_category_from_description(description, tx_type)
+    return suggestion[0] if suggestion else DEFAULT_CATEGORY
+
+
+def _cell(row: List[str], idx: Optional[int]) -> str:
+    if idx is None or idx >= len(row):
+        return ""
+    # BCA quotes cells with a leading apostrophe to force text in Excel
+    return row[idx].strip().lstrip("'").strip()
+
+
+def _parse_date(value: str, default_year: int) -> Optional[str]:
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    match = _DAY_MONTH_RE.fullmatch(value)
+    if match:  # BCA: "DD/MM" without a year
+        try:
+            return date(default_year, int(match.group(2)), int(match.group(1))).isoformat()
+        except ValueError:
+            return None
+    return parse_natural_date(value)
+
+
+def _parse_money(value: str) -> Optional[float]:
+    """parse_amount() that keeps the sign and ignores empty / zero cells"""
+    value = value.strip()
+    if not value or value in ("-", "0", "0.00", "0,00"):
+        return None
+    negative = value.startswith("-") or (value.startswith("(") and value.endswith(")"))
+    amount = parse_amount(value.strip("-() "))
+    if amount is None:
+        return None
+    return -amount if negative else amount
+
+
+def _detect_delimiter(lines: List[str]) -> str:
+    sample = "".join(lines)
+    return max((",", ";", "\t", "|"), key=sample.count)
+
+
+def _map_header(row: List[str]) -> Dict[str, int]:
+    columns = {}
+    for idx, name in enumerate(row):
+        key = name.strip().lstrip("'").strip().lower()
+        for column, aliases in COLUMN_ALIASES.items():
+            if key in aliases and column not in columns:
+                columns[column] = idx
+    return columns
+
+
+class _CopySource:
+    """File-like object over an iterator of str chunks (for copy_expert)"""
+
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = chunks
+        self._buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            out, self._buffer = self._buffer, ""
+        else:
+            out, self._buffer = self._buffer[:size], self._buffer[size:]
+        return out
+
+
+class StatementParser:
+    """Streams normalized rows out of a CSV / bank statement text stream.
+
+    Invalid rows are recorded in `errors` (capped at `max_errors`, counted in
+    `failed`) instead of aborting the import.
+    """
+
+    def __init__(
+        self,
+        text_stream,
+        default_account: Optional[str] = None,
+        default_year: Optional[int] = None,
+        max_rows: int = 100_000,
+        max_errors: int = 200,
+    ):
+        self.text_stream = text_stream
+        self.default_account = default_account
+        self.default_year = default_year or date.today().year
+        self.max_rows = max_rows
+        self.max_errors = max_errors
+        self.layout = None
+        self._reader = None
+        self._columns = None
+        self.total = 0
+        self.valid = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def _error(self, line_no: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": line_no, "error": message})
+
+    def open(self) -> None:
+        """Find the header row; raises ImportFormatError if there is none"""
+        if self._reader is not None:
+            return
+        head = list(itertools.islice(self.text_stream, HEADER_SCAN_LINES))
+        delimiter = _detect_delimiter(head)
+        reader = csv.reader(itertools.chain(head, self.text_stream), delimiter=delimiter)
+
+        # Skip statement preamble (account number, period, ...) up to the header
+        for row in reader:
+            columns = _map_header(row)
+            has_amount = "amount" in columns or "debit" in columns or "credit" in columns
+            if "date" in columns and has_amount:
+                if "debit" in columns or "credit" in columns:
+                    self.layout = "debit_credit"
+                else:
+                    self.layout = "amount"
+                self._reader, self._columns = reader, columns
+                return
+            if reader.line_num >= HEADER_SCAN_LINES:
+                break
+        raise ImportFormatError(
+            "Header tidak dikenali: butuh kolom tanggal dan jumlah (atau debit/kredit)"
+        )
+
+    def _resolve_amount(self, row, columns):
+        """(type, positive amount) or (None, error message)"""
+        explicit_type = TYPE_ALIASES.get(_cell(row, columns.get("type")).lower())
+
+        if self.layout == "debit_credit":
+            debit = _parse_money(_cell(row, columns.get("debit")))
+            credit = _parse_money(_cell(row, columns.get("credit")))
+            if debit and not credit:
+                return "expense", abs(debit)
+            if credit and not debit:
+                return "income", abs(credit)
+            if not debit and not credit:
+                amount = _parse_money(_cell(row, columns.get("amount")))
+                if amount:
+                    return explicit_type or ("expense" if amount < 0 else "income"), abs(amount)
+            return None, "Isi salah satu kolom debit atau kredit"
+
+        raw = _cell(row, columns.get("amount"))
+        marker = _DB_CR_RE.search(raw)
+        if marker:
+            raw = raw[: marker.start()]
+        else:
+            # BCA puts DB/CR in the cell right after the amount
+            nxt = _cell(row, columns["amount"] + 1).lower()
+            marker_type = TYPE_ALIASES.get(nxt) if nxt in ("db", "cr") else None
+            explicit_type = explicit_type or marker_type
+        amount = _parse_money(raw)
+        if amount is None:
+            return None, f"Jumlah tidak valid: '{raw}'"
+        if marker:
+            explicit_type = TYPE_ALIASES[marker.group(1).lower()]
+        return explicit_type or ("expense" if amount < 0 else "income"), abs(amount)
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        self.open()
+        reader, columns = self._reader, self._columns
+        for row in reader:
+            line_no = reader.line_num
+            if not any(cell.strip() for cell in row):
+                continue
+            first = _cell(row, 0).lower()
+            if first.startswith(_FOOTER_PREFIXES):
+                continue
+            if self.total >= self.max_rows:
+                self._error(line_no, f"Melebihi batas {self.max_rows} baris, sisa file diabaikan")
+                break
+            self.total += 1
+
+            raw_date = _cell(row, columns["date"])
+            tx_date = _parse_date(raw_date, self.default_year)
+            if not tx_date:
+                self._error(line_no, f"Tanggal tidak valid: '{raw_date}'")
+                continue
+
+            tx_type, amount = self._resolve_amount(row, columns)
+            if tx_type is None:
+                self._error(line_no, amount)
+                continue
+            if amount <= 0:
+                self._error(line_no, "Jumlah harus > 0")
+                continue
+
+            raw_account = _cell(row, columns.get("account")) or self.default_account
+            account = _normalize_account(raw_account) if raw_account else None
+            if not account:
+                self._error(
+                    line_no,
+                    f"Akun tidak dikenali: '{raw_account}'" if raw_account
+                    else "Akun kosong (isi kolom akun atau parameter account)",
+                )
+                continue
+
+            description = _cell(row, columns.get("description"))
+            category = _cell(row, columns.get("category")) or _suggest_category(
+                description.lower(), tx_type
+            )
+
+            self.valid += 1
+            yield {
+                "line_no": line_no,
+                "date": tx_date,
+                "type": tx_type,
+                "category": category,
+                "description": description or None,
+                "amount": amount,
+                "account": account,
+            }
+
+    def copy_chunks(self) -> Iterator[str]:
+        """rows() encoded as CSV text in batches for COPY ... FORMAT csv"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        for i, row in enumerate(self.rows(), start=1):
+            writer.writerow(
+                ["" if row[c] is None else row[c] for c in STAGING_COLUMNS]
+            )
+            if i % COPY_BATCH_ROWS == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+
+def import_transactions(db, user_id: int, parser: StatementParser) -> Dict[str, Any]:
+    """COPY parsed rows into staging and merge them into transactions.
+
+    Rows identical to an existing transaction (same date, type, category,
+    description, amount, account) are skipped so re-uploading the same
+    statement is harmless. Does not commit.
+    """
+    parser.open()
+    db.execute(CREATE_STAGING_SQL)
+    cur = db.cursor()
+    cur.copy_expert(
+        f"COPY import_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+        _CopySource(parser.copy_chunks()),
+    )
+    cur.close()
+
+    duplicates = db.execute(
+        """
+        DELETE FROM import_staging s
+        USING transactions t
+        WHERE t.user_id = %s AND t.date = s.date AND t.type = s.type
+          AND t.category = s.category AND t.amount = s.amount
+          AND t.account IS NOT DISTINCT FROM s.account
+          AND t.description IS NOT DISTINCT FROM s.description
+        """,
+        (user_id,),
+    ).rowcount
+
+    imported = db.execute(
+        """
+        INSERT INTO transactions (user_id, date, type, category, description, amount, account)
+        SELECT %s, date, type, category, description, amount, account
+        FROM import_staging
+        ORDER BY line_no
+        """,
+        (user_id,),
+    ).rowcount
+    if imported:
+        add_staged_to_rollups(db, user_id, "import_staging")
+
+    return {
+        "format": parser.layout,
+        "rows": parser.total,
+        "imported": imported,
+        "duplicates": duplicates,
+        "failed": parser.failed,
+        "errors": parser.errors,
+    }
@@ -0,0 +1,132 @@
+"""Monthly transaction rollups (user_id, month, account, type, category)
+
+Aggregate queries (month summary, balances, account balances) read this table
+instead of scanning raw transactions. Every write to `transactions` must apply
+the matching delta here on the same connection BEFORE commit, so the rollup
+and the raw rows always change in one DB transaction. Each delta also bumps
+users.data_version, which keys the financial caches in every worker.
+"""
+
+from typing import Any, Dict, Optional
+
+from financial_context import bump_data_version
+
+
+_UPSERT_SQL = """
+    INSERT INTO transaction_rollups
+        (user_id, month, account, type, category, total_amount, tx_count)
+    VALUES (%s, date_trunc('month', %s::date)::date, %s, %s, %s, %s, %s)
+    ON CONFLICT (user_id, month, account, type, category) DO UPDATE SET
+        total_amount = transaction_rollups.total_amount + EXCLUDED.total_amount,
+        tx_count = transaction_rollups.tx_count + EXCLUDED.tx_count
+"""
+
+_PRUNE_SQL = """
+    DELETE FROM transaction_rollups
+    WHERE user_id = %s AND month = date_trunc('month', %s::date)::date
+      AND account = %s AND type = %s AND category = %s AND tx_count <= 0
+"""
+
+
+def _key(row: Dict[str, Any]):
+    # NULL accounts are bucketed under '' so they still hit the unique key
+    return row["date"], row.get("account") or "", row["type"], row["category"]
+
+
+def apply_rollup_delta(db, user_id: int, row: Dict[str, Any], sign: int) -> None:
+    """Add (sign=1) or subtract (sign=-1) one transaction row from its bucket.
+
+    Does not commit - the caller commits together with the transactions write.
+    """
+    tx_date, account, tx_type, category = _key(row)
+    amount = float(row["amount"] or 0) * sign
+    db.execute(
+        _UPSERT_SQL,
+        (user_id, tx_date, account, tx_type, category, amount, sign),
+    )
+    if sign < 0:
+        db.execute(_PRUNE_SQL, (user_id, tx_date, account, tx_type, category))
+    bump_data_version(db, user_id)
+
+
+def add_to_rollups(db, user_id: int, row: Dict[str, Any]) -> None:
+    """Account for a newly inserted transaction"""
+    apply_rollup_delta(db, user_id, row, 1)
+
+
+def remove_from_rollups(db, user_id: int, row: Dict[str, Any]) -> None:
+    """Account for a deleted transaction"""
+    apply_rollup_delta(db, user_id, row, -1)
+
+
+def replace_in_rollups(
+    db, user_id: int, old_row: Dict[str, Any], new_row: Dict[str, Any]
+) -> None:
+    """Account for an updated transaction (old values out, new values in)"""
+    remove_from_rollups(db, user_id, old_row)
+    add_to_rollups(db, user_id, new_row)
+
+
+def add_staged_to_rollups(db, user_id: int, table: str) -> None:
+    """Set-based variant of add_to_rollups for bulk inserts.
+
+    `table` holds the newly inserted rows (date, type, category, amount,
+    account), e.g. the import staging table.
+    """
+    db.execute(
+        f"""
+        INSERT INTO transaction_rollups
+            (user_id, month, account, type, category, total_amount, tx_count)
+        SELECT %s, date_trunc('month', date)::date, COALESCE(account, ''),
+               type, category, SUM(amount), COUNT(*)
+        FROM {table}
+        GROUP BY 2, 3, 4, 5
+        ON CONFLICT (user_id, month, account, type, category) DO UPDATE SET
+            total_amount = transaction_rollups.total_amount + EXCLUDED.total_amount,
+            tx_count = transaction_rollups.tx_count + EXCLUDED.tx_count
+        """,
+        (user_id,),
+    )
+    bump_data_version(db, user_id)
+
+
+def delete_user_rollups(db, user_id: int) -> None:
+    """Drop all buckets of a user (used when all their transactions are deleted)"""
+    db.execute("DELETE FROM transaction_rollups WHERE user_id = %s", (user_id,))
+
+
+def rebuild_rollups(db, user_id: Optional[int] = None) -> int:
+    """Recompute rollups from raw transactions (all users or one user).
+
+    Takes an EXCLUSIVE lock on transaction_rollups so concurrent writers wait
+    and apply their deltas on top of the rebuilt rows. Caller commits.
+    Returns the number of buckets written.
+    """
+    db.execute("LOCK TABLE transaction_rollups IN EXCLUSIVE MODE")
+
+    where = ""
+    params = ()
+    if user_id is not None:
+        where = "WHERE user_id = %s"
+        params = (user_id,)
+
+    db.execute(f"DELETE FROM transaction_rollups {where}", params)
+    cur = db.execute(
+        f"""
+        INSERT INTO transaction_rollups
+            (user_id, month, account, type, category, total_amount, tx_count)
+        SELECT user_id, date_trunc('month', date)::date, COALESCE(account, ''),
+               type, category, SUM(amount), COUNT(*)
+        FROM transactions
+        {where}
+        GROUP BY 1, 2, 3, 4, 5
+        """,
+        params,
+    )
+    buckets = cur.rowcount
+
+    if user_id is not None:
+        bump_data_version(db, user_id)
+    else:
+        db.execute("UPDATE users SET data_version = data_version + 1")
+    return buckets
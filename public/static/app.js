@@ -114,6 +114,12 @@ async function apiFetch(url, options = {}) {
     throw new Error('Session expired');
   }
 
+  // Signed session token diperbarui server setelah revalidasi
+  const refreshedToken = response.headers.get('X-Session-Token-Refresh');
+  if (refreshedToken) {
+    localStorage.setItem('session_token', refreshedToken);
+  }
+
   return response;
 }
 
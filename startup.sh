@@ -13,6 +13,11 @@ cd backend
 python -c "from database import init_db; init_db(standalone=True)"
 echo "✅ Database initialized"
 
+# Backfill transaction rollups once (no-op after the first successful run)
+python migrations/rebuild_transaction_rollups.py --if-needed || echo "⚠️ Rollup backfill failed"
+# Backfill chat message counters once (same pattern)
+python migrations/rebuild_log_stats.py --if-needed || echo "⚠️ Message counter backfill failed"
+
 # Create admin user if not exists
 echo "👤 Creating admin user..."
 python init_admin.py || echo "⚠️ Admin user already exists or failed to create"